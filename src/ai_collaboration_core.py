@@ -86,13 +86,14 @@ class AICollaborationCore:
         
         return results
 
-    def run_ai_conversation_only(self, project_request: str) -> Dict[str, Any]:
+    def run_ai_conversation_only(self, project_request: str, bypass_cache: bool = False) -> Dict[str, Any]:
         """Run only AI-to-AI conversation without design phase"""
         self.logger.info("Starting AI conversation mode")
         
         return self.conversation_engine.start_conversation(
             project_request,
-            max_turns=self.config.get("system.max_iterations", 20)
+            max_turns=self.config.get("system.max_iterations", 20),
+            bypass_cache=bypass_cache
         )
 
     def run_design_only(self, project_request: str) -> Dict[str, Any]:
@@ -123,8 +124,8 @@ class AICollaborationCore:
                 "file_generator": bool(self.file_generator)
             },
             "api_keys_configured": {
-                "openai": bool(os.getenv("OPENAI_API_KEY")),
-                "anthropic": bool(os.getenv("ANTHROPIC_API_KEY"))
+                "openai": bool(self.config.get_api_keys("openai")),
+                "anthropic": bool(self.config.get_api_keys("anthropic"))
             },
             "project_dir": str(self.project_dir),
             "timestamp": datetime.now().isoformat()
@@ -176,8 +177,9 @@ def cli(ctx, config, verbose):
               type=click.Choice(['full', 'design', 'implementation', 'conversation']),
               default='full', 
               help='Execution mode')
+@click.option('--no-cache', is_flag=True, help='Ignore cached AI responses and call the providers again')
 @click.pass_context
-def run(ctx, project_request, mode):
+def run(ctx, project_request, mode, no_cache):
     """Run AI collaboration workflow"""
     system = AICollaborationCore(ctx.obj.get('config'))
     
@@ -188,7 +190,7 @@ def run(ctx, project_request, mode):
     elif mode == 'implementation':
         result = system.run_complete_workflow(project_request, mode='implementation')
     elif mode == 'conversation':
-        result = system.run_ai_conversation_only(project_request)
+        result = system.run_ai_conversation_only(project_request, bypass_cache=no_cache)
     
     if ctx.obj.get('verbose'):
         click.echo(json.dumps(result, indent=2, ensure_ascii=False))
@@ -221,6 +223,33 @@ def status(ctx):
     click.echo(f"Anthropic API: {'✅' if status_info['api_keys_configured']['anthropic'] else '❌'}")
     click.echo(f"Project Directory: {status_info['project_dir']}")
 
+@cli.command('import-conversations')
+@click.option('--source', '-s', default='conversations', help='Directory containing conversation JSON files')
+@click.option('--db', 'db_path', default=None, help='SQLite database path (default: <source>/conversations.db)')
+def import_conversations(source, db_path):
+    """Bulk import JSON conversations into the SQLite store"""
+    from conversation_store import SQLiteConversationStore
+    
+    store = SQLiteConversationStore(Path(db_path) if db_path else Path(source) / "conversations.db")
+    try:
+        count = store.import_json_directory(Path(source))
+    finally:
+        store.close()
+    
+    click.echo(f"✅ Imported {count} conversations into {store.db_path}")
+
+@cli.command('rebuild-manifest')
+@click.option('--source', '-s', default='conversations', help='Directory containing conversation JSON files')
+def rebuild_manifest(source):
+    """Rebuild the conversation summary manifest from conversation files"""
+    from conversation_store import JSONLConversationStore, ConversationManifest
+    
+    store = JSONLConversationStore(Path(source), use_manifest=False)
+    store.manifest = ConversationManifest(Path(source) / "manifest.dat")
+    count = store.rebuild_manifest()
+    
+    click.echo(f"✅ Rebuilt manifest with {count} conversations: {store.manifest.path}")
+
 @cli.command()
 def init():
     """Initialize a new AI collaboration project"""
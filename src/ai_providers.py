@@ -0,0 +1,980 @@
+#!/usr/bin/env python3
+"""
+AI Providers - OpenAI / Anthropic / Gemini 共通の非同期クライアント
+"""
+
+import json
+import time
+import email.utils
+import queue
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable, Iterator, AsyncIterator
+
+from utils.config_manager import ConfigManager
+from response_stream import iter_text_chunks
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+from latency_tracker import LatencyTracker
+from request_hedging import HedgePolicy
+from resilience import CircuitBreaker, RetryPolicy
+from rate_limiter import RateLimiterRegistry
+from context_packer import estimate_tokens
+from api_key_pool import ApiKeyPool
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+    aiohttp = None
+
+PROVIDERS = ("openai", "anthropic", "gemini")
+
+
+class ProviderError(Exception):
+    """プロバイダー呼び出しの失敗（status はHTTPステータス、通信エラー時は None）"""
+
+    def __init__(self, provider: str, message: str, status: int = None, retry_after: float = None):
+        super().__init__(f"{provider}: {message}" if status is None else f"{provider} HTTP {status}: {message}")
+        self.provider = provider
+        self.status = status
+        # レート制限時に応答の Retry-After で指定された秒数
+        self.retry_after = retry_after
+        # 通信エラー・レート制限・サーバーエラーは再試行で回復しうる
+        self.retryable = status is None or status == 429 or status >= 500
+
+
+class CircuitOpenError(ProviderError):
+    """サーキットブレーカーが open のため呼び出さなかった（再試行しない）"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, f"circuit open, retry after {retry_after:.1f}s")
+        self.retryable = False
+        self.retry_after = retry_after
+
+
+class KeysCoolingError(ProviderError):
+    """全てのAPIキーが長く休止中のため呼び出さなかった（再試行しない）"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, f"all API keys cooling down, retry after {retry_after:.1f}s")
+        self.retryable = False
+        self.retry_after = retry_after
+
+
+def _retry_after(response) -> Optional[float]:
+    """応答の Retry-After ヘッダー（秒数、または日時までの秒数）"""
+    value = response.headers.get("Retry-After", "").strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AiohttpTransport:
+    """aiohttp の共有セッションで送信するトランスポート
+
+    全プロバイダーが1つの ClientSession（TCPConnector の keep-alive 接続プール）を
+    共有するため、同じホストへの呼び出しはTLSハンドシェイク済みの接続を再利用する。
+    """
+
+    requires_api_key = True
+
+    def __init__(self, max_connections: int = 100, max_connections_per_host: int = 20,
+                 keepalive_timeout: float = 60.0):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self.sessions_created = 0
+        self.requests = 0
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self.sessions_created += 1
+        return self._session
+
+    async def post_json(self, provider: str, url: str, headers: Dict[str, str],
+                        payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """JSONを送信して応答のJSONを返す"""
+        self.requests += 1
+        try:
+            async with self._get_session().post(
+                url, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                if response.status >= 400:
+                    raise ProviderError(provider, (await response.text())[:500], response.status,
+                                        _retry_after(response))
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ProviderError(provider, str(e) or type(e).__name__)
+
+    async def stream_events(self, provider: str, url: str, headers: Dict[str, str],
+                            payload: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        """JSONを送信し、Server-Sent Events の data を順に返す（timeout は受信間隔の上限）"""
+        self.requests += 1
+        try:
+            async with self._get_session().post(
+                url, json=payload, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+            ) as response:
+                if response.status >= 400:
+                    raise ProviderError(provider, (await response.text())[:500], response.status,
+                                        _retry_after(response))
+
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    yield json.loads(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ProviderError(provider, str(e) or type(e).__name__)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "transport": "aiohttp",
+            "max_connections": self.max_connections,
+            "max_connections_per_host": self.max_connections_per_host,
+            "keepalive_timeout": self.keepalive_timeout,
+            "sessions_created": self.sessions_created,
+            "requests": self.requests
+        }
+
+
+class FakeTransport:
+    """ネットワークに接続せず各プロバイダーの応答形式を返すテスト用トランスポート
+
+    responder(provider, payload) が返すテキストを、通常の呼び出しでは1つの応答、
+    ストリーミングでは chunk_size 文字ずつのイベントとして返す。
+    """
+
+    requires_api_key = False
+
+    def __init__(self, responder: Callable = None, latency: float = 0.0, chunk_size: int = 16):
+        self.responder = responder or (lambda provider, payload: f"[{provider}] fake response")
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.requests = []
+
+    async def post_json(self, provider: str, url: str, headers: Dict[str, str],
+                        payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        self.requests.append({"provider": provider, "url": url, "payload": payload})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self.responder(provider, payload)
+        return self._format_response(provider, text)
+
+    async def stream_events(self, provider: str, url: str, headers: Dict[str, str],
+                            payload: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        self.requests.append({"provider": provider, "url": url, "payload": payload})
+        text = self.responder(provider, payload)
+        for chunk in iter_text_chunks(text, self.chunk_size):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            yield self._format_event(provider, chunk)
+
+    def _format_response(self, provider: str, text: str) -> Dict[str, Any]:
+        output_tokens = max(1, len(text) // 4)
+        if provider == "openai":
+            return {"choices": [{"message": {"content": text}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": output_tokens}}
+        if provider == "anthropic":
+            return {"content": [{"type": "text", "text": text}],
+                    "usage": {"input_tokens": 0, "output_tokens": output_tokens}}
+        return {"candidates": [{"content": {"parts": [{"text": text}]}}],
+                "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": output_tokens}}
+
+    def _format_event(self, provider: str, chunk: str) -> Dict[str, Any]:
+        if provider == "openai":
+            return {"choices": [{"delta": {"content": chunk}}]}
+        if provider == "anthropic":
+            return {"type": "content_block_delta", "delta": {"type": "text_delta", "text": chunk}}
+        return {"candidates": [{"content": {"parts": [{"text": chunk}]}}]}
+
+    async def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"transport": "fake", "requests": len(self.requests)}
+
+
+class ProviderClient:
+    """プロバイダークライアントの共通処理（同時実行数の制限と統計）
+
+    サブクラスは URL・ヘッダー・リクエスト本文の組み立てと応答の解釈だけを実装する。
+    """
+
+    provider = ""
+
+    def __init__(self, transport, api_key: str = None, timeout: float = 60.0, max_concurrent: int = 4):
+        self.transport = transport
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    async def generate(self, model: str, prompt: str, system: str = None, **config) -> Dict[str, Any]:
+        """応答全体を生成して {text, usage, latency} を返す"""
+        url, headers, payload = self._build_request(model, prompt, system, config, stream=False)
+        async with self._semaphore:
+            start = self._begin()
+            try:
+                data = await self.transport.post_json(self.provider, url, headers, payload, self.timeout)
+                text, usage = self._parse_response(data)
+            except Exception:
+                self._end(start, failed=True)
+                raise
+            except BaseException:
+                # 予備の呼び出しに負けた場合など（キャンセル）は失敗に数えない
+                self._end(start)
+                raise
+            latency = self._end(start, usage=usage)
+
+        return {"provider": self.provider, "model": model, "text": text, "usage": usage, "latency": latency}
+
+    async def stream(self, model: str, prompt: str, system: str = None, **config) -> AsyncIterator[str]:
+        """応答をテキスト断片として生成順に返す"""
+        url, headers, payload = self._build_request(model, prompt, system, config, stream=True)
+        async with self._semaphore:
+            start = self._begin()
+            try:
+                async for event in self.transport.stream_events(self.provider, url, headers, payload, self.timeout):
+                    text = self._parse_event(event)
+                    if text:
+                        yield text
+            except Exception:
+                self._end(start, failed=True)
+                raise
+            except BaseException:
+                # 受信側が途中で止めた場合（キャンセル）は失敗に数えない
+                self._end(start)
+                raise
+            self._end(start)
+
+    def _begin(self) -> float:
+        self.in_flight += 1
+        self.requests += 1
+        return time.monotonic()
+
+    def _end(self, start: float, failed: bool = False, usage: Dict[str, int] = None) -> float:
+        latency = time.monotonic() - start
+        self.in_flight -= 1
+        self.total_latency += latency
+        if failed:
+            self.errors += 1
+        if usage:
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+        return latency
+
+    def _build_request(self, model: str, prompt: str, system: Optional[str],
+                       config: Dict[str, Any], stream: bool) -> tuple:
+        raise NotImplementedError
+
+    def _parse_response(self, data: Dict[str, Any]) -> tuple:
+        raise NotImplementedError
+
+    def _parse_event(self, event: Dict[str, Any]) -> Optional[str]:
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "timeout": self.timeout,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "average_latency": self.total_latency / self.requests if self.requests else 0.0,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens
+        }
+
+
+class OpenAIClient(ProviderClient):
+    """OpenAI Chat Completions API"""
+
+    provider = "openai"
+    url = "https://api.openai.com/v1/chat/completions"
+
+    def _build_request(self, model, prompt, system, config, stream):
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        payload = {"model": model, "messages": messages, "stream": stream}
+        for key in ("max_tokens", "temperature", "top_p"):
+            if config.get(key) is not None:
+                payload[key] = config[key]
+
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        return self.url, headers, payload
+
+    def _parse_response(self, data):
+        usage = data.get("usage", {})
+        return data["choices"][0]["message"].get("content") or "", {
+            "input_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("completion_tokens", 0)
+        }
+
+    def _parse_event(self, event):
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+
+class AnthropicClient(ProviderClient):
+    """Anthropic Messages API"""
+
+    provider = "anthropic"
+    url = "https://api.anthropic.com/v1/messages"
+    api_version = "2023-06-01"
+
+    def _build_request(self, model, prompt, system, config, stream):
+        payload = {
+            "model": model,
+            "max_tokens": config.get("max_tokens") or 2000,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream
+        }
+        if system:
+            payload["system"] = system
+        for key in ("temperature", "top_p", "top_k"):
+            if config.get(key) is not None:
+                payload[key] = config[key]
+
+        headers = {
+            "x-api-key": self.api_key or "",
+            "anthropic-version": self.api_version,
+            "Content-Type": "application/json"
+        }
+        return self.url, headers, payload
+
+    def _parse_response(self, data):
+        usage = data.get("usage", {})
+        text = "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+        return text, {
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0)
+        }
+
+    def _parse_event(self, event):
+        if event.get("type") == "content_block_delta":
+            return event.get("delta", {}).get("text")
+        return None
+
+
+class GeminiClient(ProviderClient):
+    """Gemini generateContent API（リクエストごとにキーを送るため、キーはクライアント単位）"""
+
+    provider = "gemini"
+    base_url = "https://generativelanguage.googleapis.com/v1beta/models"
+    safety_settings = [
+        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
+    ]
+
+    def _build_request(self, model, prompt, system, config, stream):
+        generation_config = {}
+        for key, name in (("temperature", "temperature"), ("top_p", "topP"),
+                          ("top_k", "topK"), ("max_tokens", "maxOutputTokens")):
+            if config.get(key) is not None:
+                generation_config[name] = config[key]
+
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": generation_config,
+            "safetySettings": self.safety_settings
+        }
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+
+        method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+        headers = {"x-goog-api-key": self.api_key or "", "Content-Type": "application/json"}
+        return f"{self.base_url}/{model}:{method}", headers, payload
+
+    def _parse_response(self, data):
+        usage = data.get("usageMetadata", {})
+        return self._candidate_text(data), {
+            "input_tokens": usage.get("promptTokenCount", 0),
+            "output_tokens": usage.get("candidatesTokenCount", 0)
+        }
+
+    def _parse_event(self, event):
+        return self._candidate_text(event)
+
+    @staticmethod
+    def _candidate_text(data: Dict[str, Any]) -> str:
+        candidates = data.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+
+CLIENT_CLASSES = {
+    "openai": OpenAIClient,
+    "anthropic": AnthropicClient,
+    "gemini": GeminiClient
+}
+
+
+class ProviderRegistry:
+    """プロバイダークライアントを専用イベントループ上で共有する
+
+    クライアントと接続プールは "ai-providers" スレッドのイベントループに属し、
+    同期的なペルソナ（ワークフローのスレッドやCLI）は generate / iter_stream で、
+    別のイベントループからは agenerate で呼び出す。ループは最初の呼び出しで起動する。
+    """
+
+    def __init__(self, config: ConfigManager = None, transport=None, cache: ResponseCache = None):
+        self.config = config or ConfigManager()
+        self.cache = cache
+        if transport is None and AIOHTTP_AVAILABLE:
+            http_config = self.config.get("ai.http", {})
+            transport = AiohttpTransport(
+                http_config.get("max_connections", 100),
+                http_config.get("max_connections_per_host", 20),
+                http_config.get("keepalive_timeout", 60.0)
+            )
+        self.transport = transport
+        # 同じリクエストが実行中なら新たに呼び出さずに結果を共有する
+        self.single_flight = SingleFlight()
+        # モデルごとの直近の応答時間（モデルの振り分けに使う。失敗した呼び出しもかかった時間を記録）
+        latency_window = self.config.get("ai.routing.latency_window", 200)
+        latency_max_age = self.config.get("ai.routing.latency_max_age_seconds", 300.0)
+        self.latency = LatencyTracker(latency_window, latency_max_age)
+        # ストリーミングの最初の断片までの応答時間（予備の呼び出しを重ねる時期に使う）
+        self.first_token_latency = LatencyTracker(latency_window, latency_max_age)
+        hedging_config = self.config.get("ai.hedging", {})
+        self.hedging = HedgePolicy(
+            self.latency,
+            self.first_token_latency,
+            hedging_config.get("alternates", {}),
+            hedging_config.get("percentile", 95.0),
+            hedging_config.get("min_samples", 20),
+            hedging_config.get("max_hedge_rate", 0.1),
+            hedging_config.get("burst", 5.0),
+            hedging_config.get("enabled", False)
+        )
+        # 失敗した呼び出しのジッター付き再試行と、プロバイダーごとのサーキットブレーカー
+        resilience_config = self.config.get("ai.resilience", {})
+        retry_config = resilience_config.get("retry", {})
+        self.retry_policy = RetryPolicy(
+            retry_config.get("max_attempts", 3),
+            retry_config.get("base_delay", 0.5),
+            retry_config.get("max_delay", 8.0),
+            retry_config.get("budget_ratio", 0.2),
+            retry_config.get("budget_burst", 10.0),
+            retry_config.get("max_retry_after", 30.0)
+        )
+        self.breaker_config = resilience_config.get("breaker", {})
+        self._breakers = {}
+        # (プロバイダー, APIキー, モデル) ごとの RPM / TPM 上限（ai.<provider>.rpm / tpm）まで呼び出しを待たせる
+        self.rate_limits = RateLimiterRegistry(self.config)
+        # プロバイダーごとのAPIキーの一覧（呼び出しごとに実行中の件数が最も少ないキーを使う）
+        self._key_pools = {}
+        self._clients = {}
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def key_pool(self, provider: str) -> ApiKeyPool:
+        """プロバイダーのAPIキーの一覧（キーは ConfigManager.get_api_keys、休止の設定は ai.keys から読み込む）"""
+        with self._lock:
+            if provider not in self._key_pools:
+                keys_config = self.config.get("ai.keys", {})
+                self._key_pools[provider] = ApiKeyPool(
+                    provider,
+                    self.config.get_api_keys(provider),
+                    keys_config.get("cooldown_seconds", 60.0),
+                    keys_config.get("auth_cooldown_seconds", 600.0),
+                    keys_config.get("failure_threshold", 3),
+                    keys_config.get("max_wait_seconds", 10.0)
+                )
+            return self._key_pools[provider]
+
+    def has_api_key(self, provider: str) -> bool:
+        """プロバイダーのAPIキーが1つ以上設定されているか"""
+        return bool(self.key_pool(provider).keys)
+
+    def is_available(self, provider: str) -> bool:
+        """プロバイダーを呼び出せるか（トランスポートとAPIキーの有無）"""
+        if self.transport is None or provider not in CLIENT_CLASSES:
+            return False
+        return not self.transport.requires_api_key or self.has_api_key(provider)
+
+    def client(self, provider: str, api_key: str = None) -> ProviderClient:
+        """APIキーに結びついたクライアントを取得（設定は ai.<provider> から読み込む）
+
+        クライアントは (プロバイダー, APIキー) ごとに作るので、同じプロバイダーでも
+        キーごとのクライアントを同時に使える（max_concurrent もキーごと）。
+        """
+        with self._lock:
+            if (provider, api_key) not in self._clients:
+                provider_config = self.config.get(f"ai.{provider}", {})
+                self._clients[(provider, api_key)] = CLIENT_CLASSES[provider](
+                    self.transport,
+                    api_key,
+                    provider_config.get("timeout", 60.0),
+                    provider_config.get("max_concurrent", 4)
+                )
+            return self._clients[(provider, api_key)]
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        """プロバイダーのサーキットブレーカー（設定は ai.resilience.breaker から読み込む）"""
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(
+                    provider,
+                    self.breaker_config.get("failure_rate", 0.5),
+                    self.breaker_config.get("slow_call_seconds", 30.0),
+                    self.breaker_config.get("slow_call_rate", 0.5),
+                    self.breaker_config.get("window", 20),
+                    self.breaker_config.get("min_calls", 5),
+                    self.breaker_config.get("open_seconds", 30.0)
+                )
+            return self._breakers[provider]
+
+    def get_breaker_states(self) -> Dict[str, Dict[str, Any]]:
+        """プロバイダーごとのサーキットブレーカーの状態"""
+        return {provider: self.breaker(provider).get_state() for provider in PROVIDERS}
+
+    def _estimate_tokens(self, provider: str, prompt: str, system: Optional[str],
+                         config: Dict[str, Any]) -> int:
+        """呼び出し前のトークン数の見積もり（入力 + 出力の上限）"""
+        max_tokens = config.get("max_tokens") or self.config.get(f"ai.{provider}.max_tokens", 0)
+        return estimate_tokens((system or "") + prompt) + (max_tokens or 0)
+
+    async def _wait_rate_limit(self, provider: str, client: ProviderClient, model: str, prompt: str,
+                               system: Optional[str], config: Dict[str, Any]) -> Optional[tuple]:
+        """RPM / TPM の上限に空きができるまで待ち、後で補正するための (limiter, 見積もり) を返す"""
+        limiter = self.rate_limits.limiter(provider, client.api_key, model)
+        if limiter is None:
+            return None
+        estimate = self._estimate_tokens(provider, prompt, system, config)
+        await limiter.acquire(estimate)
+        return limiter, estimate
+
+    async def _checkout(self, provider: str, model: str, prompt: str, system: Optional[str],
+                        config: Dict[str, Any]) -> tuple:
+        """使うAPIキーを選び、そのキーのレート制限を待って (APIキー, クライアント, 見積もり) を返す
+
+        呼び出しの後は必ず key_pool(provider).release(api_key, error) でキーを返す。
+        全てのキーが休止中なら休止が最も早く終わるキーを待ち、max_wait 秒を超える場合は
+        呼び出さずに KeysCoolingError を送出する。
+        """
+        pool = self.key_pool(provider)
+        api_key = pool.acquire()
+        client = self.client(provider, api_key)
+        try:
+            cooling = pool.cooling_for(api_key)
+            if cooling > pool.max_wait:
+                pool.note_cooling(False)
+                raise KeysCoolingError(provider, cooling)
+            if cooling > 0:
+                pool.note_cooling(True)
+                await asyncio.sleep(cooling)
+            reserved = await self._wait_rate_limit(provider, client, model, prompt, system, config)
+        except BaseException:
+            pool.release(api_key)
+            raise
+        return api_key, client, reserved
+
+    def _retry_delay(self, provider: str, attempt: int, error: Exception) -> Optional[float]:
+        """再試行までの秒数（max(バックオフ, Retry-After)。Retry-After が長すぎれば None）
+
+        429 の Retry-After は受けたキーの休止に使うので、休止していない別のキーがあれば
+        Retry-After を待たずにそのキーで再試行する。
+        """
+        retry_after = getattr(error, "retry_after", None)
+        if getattr(error, "status", None) == 429 and self.key_pool(provider).has_ready_key():
+            retry_after = None
+        return self.retry_policy.delay(attempt, retry_after)
+
+    @staticmethod
+    def _reconcile_rate_limit(reserved: Optional[tuple], actual_tokens: int):
+        """見積もったトークン数を実際の使用量で置き換える"""
+        if reserved is not None:
+            limiter, estimate = reserved
+            limiter.reconcile(estimate, actual_tokens)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="ai-providers", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _request_key(self, provider: str, model: str, prompt: str, system: Optional[str],
+                     config: Dict[str, Any], bypass_cache: bool) -> str:
+        """リクエストのキー（キャッシュと実行中の呼び出しの共有に使う。bypass_cache 時は件数を記録）"""
+        if bypass_cache and self.cache is not None:
+            self.cache.note_bypass()
+        return ResponseCache.make_key(provider, model, config, system, prompt)
+
+    async def _generate(self, provider: str, model: str, prompt: str, system: Optional[str],
+                        bypass_cache: bool, config: Dict[str, Any]) -> Dict[str, Any]:
+        key = self._request_key(provider, model, prompt, system, config, bypass_cache)
+        loop = asyncio.get_running_loop()
+        if self.cache is not None and not bypass_cache:
+            text = await loop.run_in_executor(None, self.cache.get, key)
+            if text is not None:
+                return {"provider": provider, "model": model, "text": text, "usage": {}, "latency": 0.0,
+                        "cached": True, "coalesced": False}
+
+        async def call():
+            alternate = self._hedge_alternate(provider, model)
+            delay = self.hedging.delay(provider, model) if alternate else None
+            if delay is None:
+                result = await self._call_generate(provider, model, prompt, system, config)
+            else:
+                result, _ = await self.hedging.race(
+                    lambda: self._call_generate(provider, model, prompt, system, config),
+                    lambda: self._call_generate(alternate[0], alternate[1], prompt, system, config),
+                    delay
+                )
+            result["cached"] = False
+            # 予備の呼び出しが勝った応答は別のモデルの応答なのでキャッシュしない
+            if self.cache is not None and (result["provider"], result["model"]) == (provider, model):
+                await loop.run_in_executor(None, self.cache.put, key, result["text"], provider, model)
+            return result
+
+        return await self.single_flight.do(key, call)
+
+    async def _call_generate(self, provider: str, model: str, prompt: str, system: Optional[str],
+                             config: Dict[str, Any]) -> Dict[str, Any]:
+        """サーキットブレーカーを確認して呼び出し、再試行できる失敗はバックオフして再試行"""
+        breaker = self.breaker(provider)
+        self.retry_policy.note_call()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(provider, breaker.retry_after())
+            api_key, client, reserved = await self._checkout(provider, model, prompt, system, config)
+            started = time.monotonic()
+            used, error = 0, None
+            try:
+                result = await client.generate(model, prompt, system, **config)
+                usage = result["usage"] or {}
+                used = (usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+                        or estimate_tokens((system or "") + prompt) + estimate_tokens(result["text"]))
+            except Exception as e:
+                error = e
+            finally:
+                # 失敗・キャンセル（予備の呼び出しに負けた場合など）でもキーを返し、
+                # トークンを使っていないものとして見積もりを戻す
+                # （レート制限・認証エラーのキーは休止させ、再試行では別のキーを使う）
+                self.key_pool(provider).release(api_key, error)
+                self._reconcile_rate_limit(reserved, used)
+
+            if error is not None:
+                elapsed = time.monotonic() - started
+                self.latency.record(provider, model, elapsed)
+                # リクエスト自体の誤り（4xx）はプロバイダーの障害として数えない
+                breaker.record(not getattr(error, "retryable", True), elapsed)
+                if getattr(error, "retryable", False):
+                    # 429 / 503 の Retry-After より早くは再試行しない（429 は休止していない別のキーがあれば待たない）。
+                    # max_retry_after より長く待たせる場合は再試行せずに失敗させ、呼び出し元に任せる
+                    delay = self._retry_delay(provider, attempt, error)
+                    if delay is not None and self.retry_policy.can_retry(attempt):
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                raise error
+            self.latency.record(provider, model, result["latency"])
+            breaker.record(True, result["latency"])
+            return result
+
+    def _hedge_alternate(self, provider: str, model: str) -> Optional[tuple]:
+        """予備の呼び出しを重ねる先（ai.hedging が無効・重ねる先を呼び出せない場合は None）"""
+        alternate = self.hedging.alternate(provider, model)
+        if alternate is None or not self.is_available(alternate[0]):
+            return None
+        return alternate
+
+    def generate(self, provider: str, model: str, prompt: str, system: str = None,
+                 bypass_cache: bool = False, **config) -> Dict[str, Any]:
+        """応答全体を生成（呼び出し元のスレッドをブロックする）"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(provider, model, prompt, system, bypass_cache, config), self._get_loop()
+        )
+        return future.result()
+
+    async def agenerate(self, provider: str, model: str, prompt: str, system: str = None,
+                        bypass_cache: bool = False, **config) -> Dict[str, Any]:
+        """別のイベントループから応答全体の生成を待つ"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(provider, model, prompt, system, bypass_cache, config), self._get_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    def iter_stream(self, provider: str, model: str, prompt: str, system: str = None,
+                    bypass_cache: bool = False, **config) -> Iterator[str]:
+        """ストリーミング応答を同期イテレータとして返す（途中で止めると呼び出しもキャンセル）
+
+        キャッシュにある応答は断片に分けて返し、最後まで受信できた応答だけをキャッシュする。
+        bypass_cache=True の場合は読み出さずに呼び出し、結果でキャッシュを更新する。
+        同じリクエストが実行中なら1つの呼び出しの断片を共有し、全員が途中で止めた時だけキャンセルする。
+        """
+        key = self._request_key(provider, model, prompt, system, config, bypass_cache)
+        if self.cache is not None and not bypass_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield from iter_text_chunks(cached)
+                return
+
+        # 同じリクエストのストリームが実行中なら、受信済みの断片から相乗りする
+        loop = self._get_loop()
+        flight, subscription = self.single_flight.join_stream(
+            key,
+            lambda flight: asyncio.run_coroutine_threadsafe(
+                self._pump_stream(key, flight, provider, model, prompt, system, config), loop
+            )
+        )
+        try:
+            while True:
+                kind, value = subscription.get()
+                if kind == "end":
+                    break
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            self.single_flight.leave_stream(key, flight, subscription)
+
+    async def _pump_stream(self, key: str, flight, provider: str, model: str, prompt: str,
+                           system: Optional[str], config: Dict[str, Any]):
+        """ストリーミング応答を受信して相乗りしている全員に配る（最後まで受信できたらキャッシュ）"""
+        opened = None
+        try:
+            opened = await self._open_stream_hedged(provider, model, prompt, system, config)
+            if opened["first"] is not None:
+                flight.publish(opened["first"])
+                async for delta in opened["stream"]:
+                    flight.publish(delta)
+        except asyncio.CancelledError:
+            # 全員が受信をやめたストリームも、受信した分だけを使用量として見積もりを戻す
+            if opened is not None:
+                self._settle_stream(opened, "".join(flight.parts))
+            self.single_flight.end_stream(key, flight, ProviderError(provider, "stream cancelled"))
+            raise
+        except Exception as e:
+            if opened is not None:
+                self._settle_stream(opened, "".join(flight.parts), e)
+                elapsed = time.monotonic() - opened["started"]
+                self.latency.record(opened["provider"], opened["model"], elapsed)
+                self.breaker(opened["provider"]).record(not getattr(e, "retryable", True), elapsed)
+            self.single_flight.end_stream(key, flight, e)
+            return
+
+        self._settle_stream(opened, "".join(flight.parts))
+        self.latency.record(opened["provider"], opened["model"], time.monotonic() - opened["started"])
+        # ストリーミングの遅延は最初の断片までの時間で判定する
+        self.breaker(opened["provider"]).record(True, opened["first_token"])
+        # 予備の呼び出しが勝った応答は別のモデルの応答なのでキャッシュしない
+        if self.cache is not None and (opened["provider"], opened["model"]) == (provider, model):
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.cache.put, key, "".join(flight.parts), provider, model
+            )
+        self.single_flight.end_stream(key, flight)
+
+    async def _open_stream(self, provider: str, model: str, prompt: str, system: Optional[str],
+                           config: Dict[str, Any]) -> Dict[str, Any]:
+        """ストリームを開いて最初の断片まで受信（空の応答は first が None）
+
+        最初の断片を受信するまでの失敗は、_call_generate と同じく再試行できる。
+        """
+        breaker = self.breaker(provider)
+        self.retry_policy.note_call()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(provider, breaker.retry_after())
+            api_key, client, reserved = await self._checkout(provider, model, prompt, system, config)
+            started = time.monotonic()
+            stream = client.stream(model, prompt, system, **config)
+            first, opened, error = None, False, None
+            try:
+                try:
+                    first = await stream.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                opened = True
+            except Exception as e:
+                error = e
+            finally:
+                # 最初の断片までに失敗・キャンセルされたストリームはキーを返し、見積もりを戻す
+                if not opened:
+                    self.key_pool(provider).release(api_key, error)
+                    self._reconcile_rate_limit(reserved, 0)
+
+            if error is not None:
+                elapsed = time.monotonic() - started
+                self.latency.record(provider, model, elapsed)
+                # リクエスト自体の誤り（4xx）はプロバイダーの障害として数えない
+                breaker.record(not getattr(error, "retryable", True), elapsed)
+                if getattr(error, "retryable", False):
+                    # 429 / 503 の Retry-After より早くは再試行しない（429 は休止していない別のキーがあれば待たない）。
+                    # max_retry_after より長く待たせる場合は再試行せずに失敗させ、呼び出し元に任せる
+                    delay = self._retry_delay(provider, attempt, error)
+                    if delay is not None and self.retry_policy.can_retry(attempt):
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                raise error
+            first_token = time.monotonic() - started
+            self.first_token_latency.record(provider, model, first_token)
+            return {"provider": provider, "model": model, "started": started, "first_token": first_token,
+                    "stream": stream, "first": first, "reserved": reserved, "api_key": api_key,
+                    "prompt_tokens": estimate_tokens((system or "") + prompt)}
+
+    async def _open_stream_hedged(self, provider: str, model: str, prompt: str, system: Optional[str],
+                                  config: Dict[str, Any]) -> Dict[str, Any]:
+        """最初の断片が p95 までに届かなければ予備のストリームを重ね、先に届いた方を使う"""
+        alternate = self._hedge_alternate(provider, model)
+        delay = self.hedging.delay(provider, model, streaming=True) if alternate else None
+        if delay is None:
+            return await self._open_stream(provider, model, prompt, system, config)
+
+        opened, _ = await self.hedging.race(
+            lambda: self._open_stream(provider, model, prompt, system, config),
+            lambda: self._open_stream(alternate[0], alternate[1], prompt, system, config),
+            delay,
+            discard=self._discard_stream
+        )
+        return opened
+
+    def _discard_stream(self, opened: Dict[str, Any]):
+        """予備の呼び出しと同時に開いて使わなかったストリームを閉じ、APIキーと見積もりを返す"""
+        asyncio.ensure_future(opened["stream"].aclose())
+        self._settle_stream(opened, opened["first"] or "")
+
+    def _settle_stream(self, opened: Dict[str, Any], received: str, error: Exception = None):
+        """開いたストリームのAPIキーを返し、トークンの見積もりを受信したテキストの分に置き換える
+
+        ストリーミング応答は使用量を返さないので、受信したテキストとプロンプトから見積もる
+        （何も受信していなければ使っていないものとして見積もりを戻す）。1つのストリームにつき1回だけ行う。
+        """
+        if opened.get("settled"):
+            return
+        opened["settled"] = True
+        self.key_pool(opened["provider"]).release(opened["api_key"], error)
+        self._reconcile_rate_limit(
+            opened["reserved"], opened["prompt_tokens"] + estimate_tokens(received) if received else 0
+        )
+
+    def close(self):
+        """接続プールを閉じてイベントループを停止"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+            self._clients = {}
+        if loop is None:
+            return
+
+        if self.transport is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.transport.close(), loop).result(5)
+            except Exception as e:
+                print(f"Error closing provider transport: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+    def _get_client_stats(self) -> Dict[str, Dict[str, Any]]:
+        """プロバイダーごとのクライアントの統計（APIキーごとのクライアントを合計）"""
+        stats = {}
+        for (provider, _), client in list(self._clients.items()):
+            client_stats = client.get_stats()
+            if provider not in stats:
+                stats[provider] = client_stats
+                continue
+            total = stats[provider]
+            latency = total["average_latency"] * total["requests"] + client_stats["average_latency"] * client_stats["requests"]
+            for name in ("max_concurrent", "in_flight", "requests", "errors", "input_tokens", "output_tokens"):
+                total[name] += client_stats[name]
+            total["average_latency"] = latency / total["requests"] if total["requests"] else 0.0
+        return stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """プロバイダー呼び出しの統計"""
+        return {
+            "transport": self.transport.get_stats() if self.transport is not None else None,
+            "available": {provider: self.is_available(provider) for provider in PROVIDERS},
+            "providers": self._get_client_stats(),
+            "key_pools": {provider: pool.get_stats() for provider, pool in list(self._key_pools.items())},
+            "response_cache": self.cache.get_stats() if self.cache is not None else None,
+            "single_flight": self.single_flight.get_stats(),
+            "latency": self.latency.get_stats(),
+            "first_token_latency": self.first_token_latency.get_stats(),
+            "hedging": self.hedging.get_stats(),
+            "retries": self.retry_policy.get_stats(),
+            "circuit_breakers": self.get_breaker_states(),
+            "rate_limits": self.rate_limits.get_stats()
+        }
+
+
+def stream_with_fallback(registry: ProviderRegistry, provider: str, model: str, prompt: str,
+                         fallback: Callable[[], str], system: str = None, bypass_cache: bool = False,
+                         **config) -> Iterator[str]:
+    """プロバイダーの応答をストリーミングし、何も受信できなければ fallback() の応答を断片で返す"""
+    emitted = False
+    if registry.is_available(provider):
+        try:
+            for delta in registry.iter_stream(provider, model, prompt, system, bypass_cache, **config):
+                emitted = True
+                yield delta
+        except Exception as e:
+            print(f"{provider} API error: {e}")
+
+    # 途中まで送った応答にシミュレーション応答は混ぜない
+    if not emitted:
+        yield from iter_text_chunks(fallback())
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """共有のプロバイダーレジストリを取得"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            config = ConfigManager()
+            cache_config = config.get("ai.cache", {})
+            cache = None
+            if cache_config.get("enabled", True):
+                cache = ResponseCache(
+                    Path(cache_config.get("directory", "cache/responses")),
+                    cache_config.get("ttl", 86400.0),
+                    cache_config.get("max_entries", 1024),
+                    cache_config.get("max_bytes", 16 * 1024 * 1024),
+                    cache_config.get("max_disk_bytes", 256 * 1024 * 1024)
+                )
+            _registry = ProviderRegistry(config, cache=cache)
+        return _registry
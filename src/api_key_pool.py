@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+API Key Pool - プロバイダーごとの複数のAPIキーへ呼び出しを振り分ける
+"""
+
+import time
+import threading
+from typing import Dict, List, Any, Optional
+
+from rate_limiter import RateLimiterRegistry
+
+
+class ApiKeyPool:
+    """1つのプロバイダーのAPIキーの中から、実行中の呼び出しが最も少ないキーを選ぶ
+
+    レート制限（429）を受けたキーは Retry-After（無ければ cooldown_seconds）の間、
+    認証エラー（401 / 403）のキーは auth_cooldown_seconds の間、再試行できる失敗が
+    failure_threshold 回続いたキーは cooldown_seconds の間、選ばない。全てのキーが
+    休止中の場合は休止が最も早く終わるキーを返し、呼び出し側は cooling_for(key) 秒待ってから
+    使う（max_wait 秒を超える場合は待たずに失敗させる）。
+    キーが無い場合（APIキーを使わないトランスポート）は None を返す。
+    """
+
+    def __init__(self, provider: str, keys: List[str], cooldown_seconds: float = 60.0,
+                 auth_cooldown_seconds: float = 600.0, failure_threshold: int = 3, max_wait: float = 10.0):
+        self.provider = provider
+        self.keys = list(keys)
+        self.cooldown_seconds = cooldown_seconds
+        self.auth_cooldown_seconds = auth_cooldown_seconds
+        self.failure_threshold = failure_threshold
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._state = {key: {"in_flight": 0, "requests": 0, "failures": 0, "consecutive_failures": 0,
+                             "cooldowns": 0, "cooling_until": 0.0} for key in self.keys}
+        self.cooling_waits = 0
+        self.cooling_rejections = 0
+
+    def acquire(self) -> Optional[str]:
+        """呼び出しに使うキーを選ぶ（呼び出し後に必ず release する）"""
+        if not self.keys:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            ready = [key for key in self.keys if self._state[key]["cooling_until"] <= now]
+            if ready:
+                # 実行中の件数、同じなら累計の呼び出し件数が少ないキー
+                key = min(ready, key=lambda k: (self._state[k]["in_flight"], self._state[k]["requests"]))
+            else:
+                key = min(self.keys, key=lambda k: self._state[k]["cooling_until"])
+            self._state[key]["in_flight"] += 1
+            self._state[key]["requests"] += 1
+            return key
+
+    def cooling_for(self, key: Optional[str]) -> float:
+        """キーの休止が終わるまでの秒数（休止していなければ 0）"""
+        if key is None:
+            return 0.0
+        with self._lock:
+            return max(self._state[key]["cooling_until"] - time.monotonic(), 0.0)
+
+    def has_ready_key(self) -> bool:
+        """休止していないキーがあるか"""
+        with self._lock:
+            now = time.monotonic()
+            return any(self._state[key]["cooling_until"] <= now for key in self.keys)
+
+    def note_cooling(self, waited: bool):
+        """全てのキーが休止中だった呼び出しを記録（waited=False は待たずに失敗させた）"""
+        with self._lock:
+            if waited:
+                self.cooling_waits += 1
+            else:
+                self.cooling_rejections += 1
+
+    def release(self, key: Optional[str], error: Exception = None):
+        """呼び出しの結果を記録（error は失敗時の例外、キャンセルは None として扱う）"""
+        if key is None:
+            return
+        with self._lock:
+            state = self._state[key]
+            state["in_flight"] -= 1
+            if error is None:
+                state["consecutive_failures"] = 0
+                return
+
+            status = getattr(error, "status", None)
+            if status == 429:
+                state["failures"] += 1
+                retry_after = getattr(error, "retry_after", None)
+                self._cool(state, retry_after if retry_after else self.cooldown_seconds)
+            elif status in (401, 403):
+                state["failures"] += 1
+                self._cool(state, self.auth_cooldown_seconds)
+            elif getattr(error, "retryable", False):
+                # リクエスト自体の誤り（その他の4xx）はキーの問題として数えない
+                state["failures"] += 1
+                state["consecutive_failures"] += 1
+                if state["consecutive_failures"] >= self.failure_threshold:
+                    self._cool(state, self.cooldown_seconds)
+
+    def _cool(self, state: Dict[str, Any], seconds: float):
+        state["consecutive_failures"] = 0
+        state["cooldowns"] += 1
+        state["cooling_until"] = max(state["cooling_until"], time.monotonic() + seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キーごとの実行中の件数・休止状態（キーはハッシュの先頭8文字で表示）"""
+        with self._lock:
+            now = time.monotonic()
+            keys = {}
+            for key in self.keys:
+                state = self._state[key]
+                keys[RateLimiterRegistry.key_id(key)] = {
+                    "in_flight": state["in_flight"],
+                    "requests": state["requests"],
+                    "failures": state["failures"],
+                    "cooldowns": state["cooldowns"],
+                    "cooling_for": max(state["cooling_until"] - now, 0.0)
+                }
+            return {
+                "keys": len(self.keys),
+                "available": sum(1 for item in keys.values() if item["cooling_for"] == 0.0),
+                "cooling_waits": self.cooling_waits,
+                "cooling_rejections": self.cooling_rejections,
+                "per_key": keys
+            }
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Blob Store - 大きなメッセージ本文のコンテンツアドレス型ストア
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Iterable
+
+from conversation_store import ConversationCache
+
+
+class BlobStore:
+    """SHA-256 ダイジェストをキーに本文を重複排除して保存する
+
+    本文は blob_dir/<先頭2文字>/<digest> に zlib 圧縮して1ファイルずつ置き、
+    参照数は refcounts.json にまとめて保存する。新しい本文は flush() まで
+    メモリに保持されるため、会話イベントより先に flush() を呼ぶこと。
+    """
+
+    REFCOUNTS_FILE = "refcounts.json"
+
+    def __init__(self, blob_dir: Path, cache_max_bytes: int = 16 * 1024 * 1024):
+        self.blob_dir = Path(blob_dir)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.refcounts_path = self.blob_dir / self.REFCOUNTS_FILE
+        # 読み出した本文のLRUキャッシュ
+        self.cache = ConversationCache(max_entries=100000, max_bytes=cache_max_bytes)
+        self._lock = threading.Lock()
+        self._refcounts = {}
+        self._sizes = {}
+        self._pending = {}
+        self._dirty = False
+        self._refcounts_loaded = False
+        self._load()
+
+    @staticmethod
+    def digest(content: str) -> str:
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def has_refcounts(self) -> bool:
+        """参照数を読み込めたか（無い・壊れている場合は会話から数え直す）"""
+        return self._refcounts_loaded
+
+    def _load(self):
+        """参照数を読み込む"""
+        if not self.refcounts_path.exists():
+            return
+
+        try:
+            with open(self.refcounts_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading blob refcounts {self.refcounts_path}: {e}")
+            return
+
+        for digest, (count, raw_size, stored_size) in entries.items():
+            self._refcounts[digest] = count
+            self._sizes[digest] = (raw_size, stored_size)
+        self._refcounts_loaded = True
+
+    def put(self, content: str) -> str:
+        """本文を保存して参照数を1増やし、ダイジェストを返す"""
+        digest = self.digest(content)
+
+        with self._lock:
+            if digest not in self._refcounts:
+                self._refcounts[digest] = 0
+                self._pending[digest] = content
+            self._refcounts[digest] += 1
+            self._dirty = True
+
+        self.cache.put(digest, content)
+        return digest
+
+    def get(self, digest: str) -> str:
+        """ダイジェストから本文を取得"""
+        content = self.cache.get(digest)
+        if content is not None:
+            return content
+
+        with self._lock:
+            content = self._pending.get(digest)
+        if content is None:
+            try:
+                with open(self._blob_path(digest), 'rb') as f:
+                    content = zlib.decompress(f.read()).decode('utf-8')
+            except (OSError, zlib.error) as e:
+                print(f"Error reading blob {digest}: {e}")
+                return ""
+
+        self.cache.put(digest, content)
+        return content
+
+    def release(self, digest: str):
+        """参照数を1減らし、0になった本文を削除"""
+        with self._lock:
+            if digest not in self._refcounts:
+                return
+            self._refcounts[digest] -= 1
+            self._dirty = True
+            if self._refcounts[digest] > 0:
+                return
+            del self._refcounts[digest]
+            self._sizes.pop(digest, None)
+            if self._pending.pop(digest, None) is not None:
+                return
+
+        try:
+            self._blob_path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    def flush(self):
+        """未書き出しの本文と参照数を書き出す"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            dirty = self._dirty
+            self._dirty = False
+
+        for digest, content in pending.items():
+            path = self._blob_path(digest)
+            if path.exists():
+                stored_size = path.stat().st_size
+            else:
+                data = zlib.compress(content.encode('utf-8'))
+                path.parent.mkdir(exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                stored_size = len(data)
+            with self._lock:
+                if digest in self._refcounts:
+                    self._sizes[digest] = (len(content.encode('utf-8')), stored_size)
+
+        if dirty or pending:
+            self._save_refcounts()
+
+    def _save_refcounts(self):
+        with self._lock:
+            entries = {
+                digest: [count, *self._sizes.get(digest, (0, 0))]
+                for digest, count in self._refcounts.items()
+            }
+
+        tmp_path = self.refcounts_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.refcounts_path)
+        self._refcounts_loaded = True
+
+    def rebuild_refcounts(self, digests: Iterable[str]) -> int:
+        """会話から参照されているダイジェストで参照数を数え直し、参照の無い本文を削除（起動時用）"""
+        refcounts = {}
+        for digest in digests:
+            refcounts[digest] = refcounts.get(digest, 0) + 1
+
+        removed = 0
+        for path in self.blob_dir.glob("*/*"):
+            if path.name in refcounts:
+                with self._lock:
+                    if path.name not in self._sizes:
+                        raw_size = len(zlib.decompress(path.read_bytes()))
+                        self._sizes[path.name] = (raw_size, path.stat().st_size)
+            else:
+                path.unlink()
+                removed += 1
+
+        with self._lock:
+            self._refcounts = refcounts
+            self._sizes = {digest: size for digest, size in self._sizes.items() if digest in refcounts}
+            self._dirty = True
+
+        self._save_refcounts()
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """重複排除の統計"""
+        with self._lock:
+            logical_bytes = 0
+            raw_bytes = 0
+            stored_bytes = 0
+            for digest, count in self._refcounts.items():
+                raw_size, stored_size = self._sizes.get(digest, (0, 0))
+                logical_bytes += raw_size * count
+                raw_bytes += raw_size
+                stored_bytes += stored_size
+
+            return {
+                "blobs": len(self._refcounts),
+                "references": sum(self._refcounts.values()),
+                "logical_bytes": logical_bytes,
+                "unique_bytes": raw_bytes,
+                "stored_bytes": stored_bytes,
+                "pending_writes": len(self._pending),
+                "cache": self.cache.get_stats()
+            }
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Collaboration Scheduler - ユーザー間で公平にAI協調作業の実行枠を割り当てる
+"""
+
+import math
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, Optional
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+# 0 以下の重みはこの値に切り上げる（1/重み で順番を計算するため）
+MIN_WEIGHT = 0.01
+
+
+class CollaborationScheduler:
+    """全体の同時実行数とユーザーごとの上限を持つ重み付き公平キュー
+
+    待機中の要求には仮想終了時刻 max(仮想時刻, そのユーザーの前回の終了時刻) + 1/重み
+    を割り当て、interactive を batch より優先した上で終了時刻の小さい順に実行する。
+    1人のユーザーが大量に要求しても、他のユーザーの要求は順番を追い越される。
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_per_user: int = 2, user_weights: Dict[str, float] = None):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.user_weights = self._validate_weights(user_weights or {})
+        self._waiting = []
+        self._running = {}
+        self._last_finish = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self.dispatched = 0
+        self.total_wait = 0.0
+
+    @staticmethod
+    def _validate_weights(user_weights: Dict[str, Any]) -> Dict[str, float]:
+        """重みを検証（数値でないものは無視し、0 以下は MIN_WEIGHT に切り上げる）"""
+        weights = {}
+        for user_id, weight in user_weights.items():
+            try:
+                value = float(weight)
+            except (TypeError, ValueError):
+                value = math.nan
+            if not math.isfinite(value):
+                print(f"Ignoring invalid scheduler weight for {user_id}: {weight!r}")
+                continue
+            weight = value
+            if weight < MIN_WEIGHT:
+                print(f"Scheduler weight for {user_id} must be positive, using {MIN_WEIGHT}: {weight!r}")
+                weight = MIN_WEIGHT
+            weights[user_id] = weight
+        return weights
+
+    def _weight(self, user_id: str) -> float:
+        return self.user_weights.get(user_id, 1.0)
+
+    def _order(self, waiter: Dict[str, Any]) -> tuple:
+        return (PRIORITIES.index(waiter["priority"]), waiter["finish"], waiter["sequence"])
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: str = PRIORITY_INTERACTIVE,
+                   on_position: Optional[Callable] = None):
+        """実行枠を確保して処理を行う（枠が空くまで待機）"""
+        await self.acquire(user_id, priority, on_position)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    async def acquire(self, user_id: str, priority: str = PRIORITY_INTERACTIVE,
+                      on_position: Optional[Callable] = None):
+        """実行枠を確保する。待機中は on_position(順番, 待機数) で順番を通知"""
+        if priority not in PRIORITIES:
+            priority = PRIORITY_INTERACTIVE
+
+        finish = max(self._virtual_time, self._last_finish.get(user_id, 0.0)) + 1.0 / self._weight(user_id)
+        self._last_finish[user_id] = finish
+
+        waiter = {
+            "user_id": user_id,
+            "priority": priority,
+            "finish": finish,
+            "sequence": next(self._sequence),
+            "future": asyncio.get_running_loop().create_future(),
+            "on_position": on_position,
+            "position": None,
+            "enqueued_at": time.monotonic()
+        }
+        self._waiting.append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter["future"]
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+                self._dispatch()
+            elif waiter["future"].done() and not waiter["future"].cancelled():
+                # 枠を割り当てられた直後にキャンセルされた場合は返却する
+                self.release(user_id)
+            raise
+
+    def release(self, user_id: str):
+        """実行枠を返却して次の要求を開始"""
+        self._running[user_id] -= 1
+        if self._running[user_id] <= 0:
+            del self._running[user_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        """空いている枠に待機中の要求を割り当て、残りに順番を通知"""
+        self._waiting.sort(key=self._order)
+
+        while self._waiting and sum(self._running.values()) < self.max_concurrent:
+            eligible = next(
+                (w for w in self._waiting if self._running.get(w["user_id"], 0) < self.max_per_user),
+                None
+            )
+            if eligible is None:
+                break
+
+            self._waiting.remove(eligible)
+            self._running[eligible["user_id"]] = self._running.get(eligible["user_id"], 0) + 1
+            self._virtual_time = max(self._virtual_time, eligible["finish"] - 1.0 / self._weight(eligible["user_id"]))
+            self.dispatched += 1
+            self.total_wait += time.monotonic() - eligible["enqueued_at"]
+            eligible["future"].set_result(None)
+
+        for position, waiter in enumerate(self._waiting, 1):
+            if waiter["position"] != position and waiter["on_position"]:
+                waiter["position"] = position
+                try:
+                    waiter["on_position"](position, len(self._waiting))
+                except Exception as e:
+                    print(f"Error reporting queue position: {e}")
+
+    def queue_position(self, user_id: str) -> int:
+        """ユーザーの先頭の待機要求の順番（待機していなければ0）"""
+        for position, waiter in enumerate(self._waiting, 1):
+            if waiter["user_id"] == user_id:
+                return position
+        return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """スケジューラ統計"""
+        waiting_by_user = {}
+        for waiter in self._waiting:
+            waiting_by_user[waiter["user_id"]] = waiting_by_user.get(waiter["user_id"], 0) + 1
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_per_user": self.max_per_user,
+            "running": sum(self._running.values()),
+            "waiting": len(self._waiting),
+            "running_by_user": dict(self._running),
+            "waiting_by_user": waiting_by_user,
+            "waiting_by_priority": {
+                priority: sum(1 for w in self._waiting if w["priority"] == priority) for priority in PRIORITIES
+            },
+            "dispatched": self.dispatched,
+            "average_wait_seconds": self.total_wait / self.dispatched if self.dispatched else 0.0
+        }
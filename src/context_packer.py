@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Context Packer - モデルのトークン上限に合わせて会話履歴をプロンプトに詰める
+"""
+
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+from utils.config_manager import ConfigManager
+
+# モデル名の前方一致で引くコンテキスト長（トークン数、長い接頭辞を優先）
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 128000,
+    "o3": 200000,
+    "claude-3": 200000,
+    "claude": 100000,
+    "gemini-1.5-pro": 2097152,
+    "gemini-1.5-flash": 1048576,
+    "gemini-pro": 32760,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# 決定事項を含むメッセージの目印（小文字で比較）
+DECISION_MARKERS = ("decision", "decided", "agreed", "approved", "決定", "合意", "承認", "採用")
+
+ENGLISH_LABELS = {
+    "request": "Project request:",
+    "summary": "\nSummary of earlier conversation:",
+    "history": "\nConversation so far:",
+    "omitted": "({count} messages omitted)",
+    "truncated": "...(truncated)"
+}
+
+JAPANESE_LABELS = {
+    "request": "プロジェクトリクエスト:",
+    "summary": "\nこれまでの会話の要約:",
+    "history": "\n会話履歴:",
+    "omitted": "（{count} 件のメッセージは省略）",
+    "truncated": "…（以下省略）"
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（ASCIIは4文字で1トークン、日本語などの非ASCII文字は1文字1トークン）"""
+    if not text:
+        return 0
+    # UTF-8で2バイト以上になる文字数を、エンコード後の長さの差から求める（1文字ずつ数えない）
+    non_ascii = (len(text.encode('utf-8')) - len(text)) // 2
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = "") -> str:
+    """先頭から max_tokens に収まる長さで切り詰める"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(max_tokens - estimate_tokens(marker), 0)
+    length = len(text) * budget // max(estimate_tokens(text), 1)
+    while length > 0 and estimate_tokens(text[:length]) > budget:
+        length = length * 9 // 10
+    return text[:length] + marker
+
+
+class ContextPacker:
+    """会話履歴をモデルの入力トークン予算に収まるように選んで並べる
+
+    予算は min(max_input_tokens, コンテキスト長 - max_output_tokens - reserve_tokens) から
+    system プロンプトや指示文など別に送る分を引いたもの。最新のメッセージ、最新のコードを含む
+    メッセージ、最新の決定事項を優先して入れ、残りを新しい順に入る所まで詰める。
+    入りきらない優先メッセージは先頭から切り詰め、入れた順ではなく会話の順に並べて返す。
+    """
+
+    def __init__(self, max_input_tokens: int = 8000, reserve_tokens: int = 256,
+                 context_windows: Dict[str, int] = None):
+        self.max_input_tokens = max_input_tokens
+        self.reserve_tokens = reserve_tokens
+        self.context_windows = dict(MODEL_CONTEXT_WINDOWS)
+        self.context_windows.update(context_windows or {})
+        self._lock = threading.Lock()
+        self.packs = 0
+        self.used_tokens = 0
+        self.dropped_tokens = 0
+        self.dropped_messages = 0
+        self.truncated_messages = 0
+
+    def context_window(self, model: str) -> int:
+        """モデルのコンテキスト長"""
+        matches = [prefix for prefix in self.context_windows if (model or "").startswith(prefix)]
+        if not matches:
+            return DEFAULT_CONTEXT_WINDOW
+        return self.context_windows[max(matches, key=len)]
+
+    def budget(self, model: str, max_output_tokens: int = 0, reserved_text: str = "") -> int:
+        """会話履歴とプロジェクトリクエストに使える入力トークン数"""
+        window = self.context_window(model) - max_output_tokens - self.reserve_tokens
+        return max(min(self.max_input_tokens, window) - estimate_tokens(reserved_text), 0)
+
+    def pack(self, conversation_log: list, project_request: str, model: str,
+             max_output_tokens: int = 0, reserved_text: str = "",
+             labels: Dict[str, str] = None, summary=None) -> Tuple[str, Dict[str, Any]]:
+        """予算内の文脈と (使用・切り捨てたトークン数などの) 統計を返す
+
+        summary (RollingSummary) を渡すと、要約に畳み込み済みのメッセージの代わりに要約を入れる。
+        """
+        labels = labels or ENGLISH_LABELS
+        budget = self.budget(model, max_output_tokens, reserved_text)
+
+        summary_text, covered = summary.snapshot() if summary is not None else ("", 0)
+        conversation_log = (conversation_log or [])[covered:]
+        header = f"{labels['request']} {project_request}"
+        if summary_text:
+            header = f"{header}\n{labels['summary']}\n{summary_text}"
+        remaining = budget - estimate_tokens(header)
+        entries = [
+            f"{msg.get('speaker', 'unknown')}: {msg.get('content', '')}" for msg in conversation_log
+        ]
+        costs = [estimate_tokens(entry) for entry in entries]
+        if entries:
+            remaining -= estimate_tokens(labels["history"])
+
+        pinned = self._pinned(conversation_log)
+        order = pinned + [index for index in reversed(range(len(entries))) if index not in pinned]
+        included = {}
+        truncated = 0
+        for index in order:
+            if costs[index] <= remaining:
+                included[index] = entries[index]
+                remaining -= costs[index]
+            elif index in pinned and remaining > 32:
+                included[index] = truncate_to_tokens(entries[index], remaining, labels["truncated"])
+                remaining -= estimate_tokens(included[index])
+                truncated += 1
+            elif index not in pinned:
+                # 古いメッセージは途中を抜かさず、入らなくなった所で打ち切る
+                break
+
+        parts = [header]
+        if entries:
+            parts.append(labels["history"])
+            if len(included) < len(entries):
+                parts.append(labels["omitted"].format(count=len(entries) - len(included)))
+            parts.extend(included[index] for index in sorted(included))
+        text = "\n".join(parts)
+
+        used = estimate_tokens(text)
+        dropped = sum(cost for index, cost in enumerate(costs) if index not in included)
+        dropped += sum(costs[index] - estimate_tokens(included[index]) for index in included)
+        stats = {
+            "model": model,
+            "budget": budget,
+            "used_tokens": used,
+            "dropped_tokens": dropped,
+            "included_messages": len(included),
+            "dropped_messages": len(entries) - len(included),
+            "truncated_messages": truncated,
+            "summarized_messages": covered,
+            "summary_tokens": estimate_tokens(summary_text)
+        }
+        with self._lock:
+            self.packs += 1
+            self.used_tokens += used
+            self.dropped_tokens += dropped
+            self.dropped_messages += stats["dropped_messages"]
+            self.truncated_messages += truncated
+        return text, stats
+
+    def _pinned(self, conversation_log: list) -> List[int]:
+        """優先して入れるメッセージ（最新・最新のコード・最新の決定事項）"""
+        if not conversation_log:
+            return []
+        pinned = [len(conversation_log) - 1]
+        code = self._latest(conversation_log, lambda content: "```" in content)
+        decision = self._latest(conversation_log, lambda content: any(
+            marker in content.lower() for marker in DECISION_MARKERS
+        ))
+        for index in (code, decision):
+            if index is not None and index not in pinned:
+                pinned.append(index)
+        return pinned
+
+    @staticmethod
+    def _latest(conversation_log: list, predicate) -> Optional[int]:
+        for index in reversed(range(len(conversation_log))):
+            if predicate(conversation_log[index].get("content", "")):
+                return index
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """累計の使用・切り捨てトークン数"""
+        with self._lock:
+            return {
+                "max_input_tokens": self.max_input_tokens,
+                "packs": self.packs,
+                "used_tokens": self.used_tokens,
+                "dropped_tokens": self.dropped_tokens,
+                "dropped_messages": self.dropped_messages,
+                "truncated_messages": self.truncated_messages
+            }
+
+
+_packer = None
+_packer_lock = threading.Lock()
+
+
+def get_context_packer() -> ContextPacker:
+    """全ペルソナで共有する ContextPacker を取得（設定は ai.context から読み込む）"""
+    global _packer
+    with _packer_lock:
+        if _packer is None:
+            context_config = ConfigManager().get("ai.context", {})
+            _packer = ContextPacker(
+                context_config.get("max_input_tokens", 8000),
+                context_config.get("reserve_tokens", 256),
+                context_config.get("context_windows", {})
+            )
+        return _packer
@@ -13,6 +13,12 @@ import webbrowser
 from datetime import datetime
 from pathlib import Path
 import random
+from typing import Callable, Iterator
+
+from ai_providers import ProviderRegistry, get_provider_registry, stream_with_fallback
+from context_packer import get_context_packer, estimate_tokens
+from conversation_summary import RollingSummary, create_rolling_summary
+from model_router import get_model_router
 
 try:
     from gemini_integration import GeminiPersona
@@ -21,23 +27,73 @@ except ImportError:
     GEMINI_AVAILABLE = False
     GeminiPersona = None
 
+def build_conversation_context(conversation_log: list, project_request: str, model: str,
+                               max_output_tokens: int = 0, reserved_text: str = "",
+                               summary: RollingSummary = None) -> tuple:
+    """会話履歴（と要約）からモデルの入力トークン予算に収まる文脈を構築（文脈と統計を返す）"""
+    return get_context_packer().pack(
+        conversation_log, project_request, model, max_output_tokens, reserved_text, summary=summary
+    )
+
+
 class ConversationEngine:
     """AI Conversation Engine for WebUI integration"""
     
     def __init__(self, config):
         self.config = config
         
-    def start_conversation(self, project_request: str, max_turns: int = 20) -> dict:
-        """Start AI conversation and return results"""
+    def start_conversation(self, project_request: str, max_turns: int = 20,
+                           on_delta: Callable = None, on_message: Callable = None,
+                           models: dict = None, bypass_cache: bool = False, phase: str = "conversation") -> dict:
+        """Start AI conversation and return results
+
+        Each persona response is streamed: on_delta(speaker, turn, delta) is called for
+        every text fragment and on_message(speaker, turn, content, metadata) once it is complete.
+        models are the requested models; each call may be routed to another tier of the same
+        provider based on phase, prompt size and observed latency (recorded under "routing").
+        bypass_cache skips cached provider responses (fresh results still refresh the cache).
+        Each log entry records the token budget used and dropped for its prompt under "context".
+        Older turns are folded into a rolling summary (ai.summary) so prompts stay a constant size.
+        """
+        models = models or {}
+        summary = create_rolling_summary(self.config)
+        personas = [
+            ("chatgpt", ChatGPTPersona(models.get("openai"))),
+            ("claude", ClaudePersona(models.get("anthropic")))
+        ]
+        if GEMINI_AVAILABLE:
+            personas.append(("gemini", GeminiPersona(models.get("gemini") or self.config.get("ai.gemini.model", "gemini-1.5-pro"))))
+        
+        conversation_log = []
+        for turn in range(1, max_turns + 1):
+            speaker, persona = personas[(turn - 1) % len(personas)]
+            
+            parts = []
+            for delta in persona.stream_response(project_request, conversation_log, turn, bypass_cache, summary, phase):
+                parts.append(delta)
+                if on_delta:
+                    on_delta(speaker, turn, delta)
+            content = "".join(parts)
+            
+            metadata = {"context": persona.last_context, "routing": persona.last_route}
+            conversation_log.append({
+                "speaker": speaker,
+                "content": content,
+                "turn": turn,
+                "timestamp": datetime.now().isoformat(),
+                **metadata
+            })
+            if summary:
+                summary.update(conversation_log)
+            if on_message:
+                on_message(speaker, turn, content, metadata)
+        
         return {
             "status": "success",
-            "conversation_log": [
-                {"speaker": "chatgpt", "message": "Starting project analysis..."},
-                {"speaker": "claude", "message": "Beginning implementation..."},
-                {"speaker": "system", "message": "Conversation completed"}
-            ],
+            "conversation_log": conversation_log,
             "max_turns": max_turns,
-            "project_request": project_request
+            "project_request": project_request,
+            "summary": summary.snapshot()[0] if summary else None
         }
 
 
@@ -49,6 +105,7 @@ class AIConversationSystem:
         self.chatgpt_persona = ChatGPTPersona()
         self.claude_persona = ClaudePersona()
         self.gemini_persona = GeminiPersona() if GEMINI_AVAILABLE else None
+        self.summary = create_rolling_summary()
         self.conversation_active = True
         
     def start_ai_conversation(self, project_request: str):
@@ -458,21 +515,21 @@ Read-Host "Press Enter to close"
                 
                 if current_turn == "chatgpt":
                     response = self.chatgpt_persona.generate_response(
-                        project_request, self.conversation_log, turn_count
+                        project_request, self.conversation_log, turn_count, summary=self.summary
                     )
                     self._add_message("chatgpt", response, turn_count)
                     current_turn = "claude"
                     
                 elif current_turn == "claude":
                     response = self.claude_persona.generate_response(
-                        project_request, self.conversation_log, turn_count
+                        project_request, self.conversation_log, turn_count, summary=self.summary
                     )
                     self._add_message("claude", response, turn_count)
                     current_turn = "gemini" if self.gemini_persona else "chatgpt"
                     
                 elif current_turn == "gemini" and self.gemini_persona:
                     response = self.gemini_persona.generate_response(
-                        project_request, self.conversation_log, turn_count
+                        project_request, self.conversation_log, turn_count, summary=self.summary
                     )
                     self._add_message("gemini", response, turn_count)
                     current_turn = "chatgpt"
@@ -500,6 +557,8 @@ Read-Host "Press Enter to close"
             "timestamp": datetime.now().isoformat()
         }
         self.conversation_log.append(message)
+        if self.summary:
+            self.summary.update(self.conversation_log)
         
         # コンソール出力
         speaker_names = {
@@ -553,7 +612,26 @@ Read-Host "Press Enter to close"
 class ChatGPTPersona:
     """ChatGPT o3のペルソナ"""
     
-    def __init__(self):
+    system_prompt = """You are ChatGPT o3, the architect in an AI collaboration system. You work with Claude Code (implementation) and Gemini (optimization) on the user's project.
+
+Your role:
+- Analyze requirements and design the architecture
+- Review the code the other AIs produce and point out issues
+- Plan testing, security and deployment
+
+Keep answers concrete and actionable, and address the other AIs directly."""
+    
+    def __init__(self, model: str = None, providers: ProviderRegistry = None):
+        self.providers = providers or get_provider_registry()
+        ai_config = self.providers.config.get("ai.openai", {})
+        self.model = model or ai_config.get("model", "gpt-4")
+        self.generation_config = {
+            "max_tokens": ai_config.get("max_tokens", 2000),
+            "temperature": ai_config.get("temperature", 0.7)
+        }
+        # 直近の文脈に使った・切り捨てたトークン数と、モデルの振り分け結果
+        self.last_context = None
+        self.last_route = None
         self.responses = [
             # 分析・設計段階
             "Project Analysis:\nI'll analyze the requirements for a modern web application with authentication and task management.\n\nKey Components:\n1. User Authentication System\n2. Task CRUD Operations\n3. Database Design\n4. API Architecture\n5. Frontend Framework\n\nClaude, please start with the backend API structure using FastAPI. Create the main application file with user authentication endpoints.",
@@ -581,8 +659,33 @@ class ChatGPTPersona:
         ]
         self.response_index = 0
 
-    def generate_response(self, project_request: str, conversation_log: list, turn: int) -> str:
+    def generate_response(self, project_request: str, conversation_log: list, turn: int,
+                          bypass_cache: bool = False, summary: RollingSummary = None,
+                          phase: str = "conversation") -> str:
         """ChatGPT風の応答を生成"""
+        return "".join(self.stream_response(project_request, conversation_log, turn, bypass_cache, summary, phase))
+
+    def stream_response(self, project_request: str, conversation_log: list, turn: int,
+                        bypass_cache: bool = False, summary: RollingSummary = None,
+                        phase: str = "conversation") -> Iterator[str]:
+        """ChatGPT風の応答をストリーミング生成（APIが利用できない場合は定型応答）"""
+        instruction = f"Turn {turn}: respond to the conversation about {project_request} from the design and review perspective."
+        context, self.last_context = build_conversation_context(
+            conversation_log, project_request, self.model,
+            self.generation_config["max_tokens"], self.system_prompt + instruction, summary
+        )
+        prompt = f"{context}\n\n{instruction}"
+        self.last_route = get_model_router().route(
+            "openai", self.model, estimate_tokens(self.system_prompt + prompt), phase
+        )
+        yield from stream_with_fallback(
+            self.providers, "openai", self.last_route["model"], prompt,
+            lambda: self._next_response(project_request, turn),
+            system=self.system_prompt, bypass_cache=bypass_cache, **self.generation_config
+        )
+
+    def _next_response(self, project_request: str, turn: int) -> str:
+        """次の定型応答を選択"""
         response = self.responses[self.response_index % len(self.responses)]
         self.response_index += 1
         
@@ -596,7 +699,26 @@ class ChatGPTPersona:
 class ClaudePersona:
     """Claude Codeのペルソナ"""
     
-    def __init__(self):
+    system_prompt = """You are Claude Code, the implementer in an AI collaboration system. You work with ChatGPT o3 (design and review) and Gemini (optimization) on the user's project.
+
+Your role:
+- Turn the agreed design into working code
+- Respond to review feedback with concrete changes
+- Name every file you create
+
+Keep answers focused on code, with short explanations."""
+    
+    def __init__(self, model: str = None, providers: ProviderRegistry = None):
+        self.providers = providers or get_provider_registry()
+        ai_config = self.providers.config.get("ai.anthropic", {})
+        self.model = model or ai_config.get("model", "claude-3-sonnet-20240229")
+        self.generation_config = {
+            "max_tokens": ai_config.get("max_tokens", 2000),
+            "temperature": ai_config.get("temperature", 0.7)
+        }
+        # 直近の文脈に使った・切り捨てたトークン数と、モデルの振り分け結果
+        self.last_context = None
+        self.last_route = None
         self.responses = [
             # 実装開始
             "Great analysis, ChatGPT! I'll start implementing the FastAPI backend.\n\n```python\n# main.py\nfrom fastapi import FastAPI, Depends, HTTPException\nfrom fastapi.security import HTTPBearer\nfrom sqlalchemy.orm import Session\nimport bcrypt\nimport jwt\n\napp = FastAPI(title=\"Task Management API\")\nsecurity = HTTPBearer()\n\n@app.post(\"/auth/register\")\ndef register_user(user_data: UserCreate, db: Session = Depends(get_db)):\n    hashed_password = bcrypt.hashpw(user_data.password.encode(), bcrypt.gensalt())\n    # Implementation continues...\n```\n\nCreated: main.py with authentication endpoints",
@@ -624,8 +746,33 @@ class ClaudePersona:
         ]
         self.response_index = 0
 
-    def generate_response(self, project_request: str, conversation_log: list, turn: int) -> str:
+    def generate_response(self, project_request: str, conversation_log: list, turn: int,
+                          bypass_cache: bool = False, summary: RollingSummary = None,
+                          phase: str = "conversation") -> str:
         """Claude風の応答を生成"""
+        return "".join(self.stream_response(project_request, conversation_log, turn, bypass_cache, summary, phase))
+
+    def stream_response(self, project_request: str, conversation_log: list, turn: int,
+                        bypass_cache: bool = False, summary: RollingSummary = None,
+                        phase: str = "conversation") -> Iterator[str]:
+        """Claude風の応答をストリーミング生成（APIが利用できない場合は定型応答）"""
+        instruction = f"Turn {turn}: respond to the conversation about {project_request} from the implementation perspective."
+        context, self.last_context = build_conversation_context(
+            conversation_log, project_request, self.model,
+            self.generation_config["max_tokens"], self.system_prompt + instruction, summary
+        )
+        prompt = f"{context}\n\n{instruction}"
+        self.last_route = get_model_router().route(
+            "anthropic", self.model, estimate_tokens(self.system_prompt + prompt), phase
+        )
+        yield from stream_with_fallback(
+            self.providers, "anthropic", self.last_route["model"], prompt,
+            lambda: self._next_response(project_request, turn),
+            system=self.system_prompt, bypass_cache=bypass_cache, **self.generation_config
+        )
+
+    def _next_response(self, project_request: str, turn: int) -> str:
+        """次の定型応答を選択"""
         response = self.responses[self.response_index % len(self.responses)]
         self.response_index += 1
         
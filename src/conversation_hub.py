@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Conversation Hub - 会話イベントを複数のWebSocket購読者に配信
+"""
+
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Any
+
+
+def serialize_message(data: Dict[str, Any]) -> str:
+    """WebSocket送信用にシリアライズ（Starlette の send_json と同じ形式）"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+# キューが満杯の間に破棄してよいフレーム（断片は完成時の ai_response で置き換わる）
+DROPPABLE_TYPES = {"ai_response_delta"}
+
+
+class Subscriber:
+    """1つのWebSocket接続と専用の送信キュー・送信タスク
+
+    送信はキューに積むだけで即座に戻り、遅いクライアントへの書き込みは
+    このタスクだけが待つ。キューが満杯の間は破棄してよいフレームだけを捨て、
+    同じフェーズの未送信の progress_update は新しいものに置き換え、それ以外（決定の要求・保存済みイベントなど）を積めない場合や満杯が
+    slow_client_timeout 秒続いた場合は切断する（クライアントは since_seq 付きで
+    再接続して差分を取り直し、回答待ちの質問は再接続時に送り直される）。
+    """
+
+    def __init__(self, conversation_id: str, websocket, max_queue: int = 256,
+                 slow_client_timeout: float = 10.0, hub: "ConversationHub" = None):
+        self.conversation_id = conversation_id
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.slow_client_timeout = slow_client_timeout
+        self.hub = hub
+        self._items = deque()
+        # 置き換えのキー（進捗のフェーズ）ごとの未送信のエントリ
+        self._coalescable = {}
+        self._ready = asyncio.Event()
+        self._saturated_since = None
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._task = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """送信タスクを停止"""
+        self.closed = True
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def enqueue(self, text: str, droppable: bool = False, coalesce_key: str = None) -> bool:
+        """シリアライズ済みのメッセージを送信キューに追加"""
+        if self.closed:
+            return False
+
+        if len(self._items) >= self.max_queue:
+            now = time.monotonic()
+            if self._saturated_since is None:
+                self._saturated_since = now
+            if now - self._saturated_since > self.slow_client_timeout:
+                self._disconnect_slow_client()
+                return False
+            # 同じキーの未送信のエントリは取り消し、新しい方を末尾に積む（seq の順序を保つ）
+            superseded = self._coalescable.get(coalesce_key) if coalesce_key else None
+            if superseded is not None:
+                self._items.remove(superseded)
+                self.coalesced += 1
+                self._count("coalesced")
+                self._append([text, coalesce_key])
+                return True
+            # 破棄できないフレームは黙って捨てず、切断して差分同期に任せる
+            if not droppable:
+                self._disconnect_slow_client()
+                return False
+            self.dropped += 1
+            self._count("dropped")
+            return False
+
+        self._append([text, coalesce_key])
+        return True
+
+    def _append(self, entry: list):
+        self._items.append(entry)
+        if entry[1]:
+            self._coalescable[entry[1]] = entry
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._ready.set()
+
+    async def send_json(self, data: Dict[str, Any]):
+        """この購読者だけに送信（会話データの応答など）"""
+        self.enqueue(serialize_message(data))
+
+    def _count(self, key: str):
+        if self.hub is not None:
+            self.hub.counters[key] += 1
+
+    def _disconnect_slow_client(self):
+        """送信が追いつかないクライアントを切断"""
+        print(f"Disconnecting slow subscriber of {self.conversation_id} (send queue full)")
+        self.closed = True
+        self._count("disconnected")
+        self._items.clear()
+        self._coalescable.clear()
+        if self._task:
+            self._task.cancel()
+        asyncio.create_task(self._close_websocket())
+
+    async def _close_websocket(self):
+        try:
+            await self.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def _run(self):
+        while True:
+            if not self._items:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            text, coalesce_key = entry = self._items.popleft()
+            if coalesce_key and self._coalescable.get(coalesce_key) is entry:
+                del self._coalescable[coalesce_key]
+            # 半分まで捌けたら飽和状態から回復したとみなす
+            if len(self._items) <= self.max_queue // 2:
+                self._saturated_since = None
+
+            try:
+                await self.websocket.send_text(text)
+                self.sent += 1
+            except Exception as e:
+                print(f"Error sending to subscriber of {self.conversation_id}: {e}")
+                self.closed = True
+                return
+
+
+class ConversationChannel:
+    """会話の全購読者へ送信する send_json 互換のハンドル"""
+
+    def __init__(self, hub: "ConversationHub", conversation_id: str):
+        self.hub = hub
+        self.conversation_id = conversation_id
+
+    async def send_json(self, data: Dict[str, Any]):
+        self.hub.publish(self.conversation_id, data)
+
+
+class ConversationHub:
+    """会話ごとの購読者を管理し、イベントを1回のシリアライズで全員に配信する"""
+
+    def __init__(self, max_queue: int = 256, slow_client_timeout: float = 10.0):
+        self.max_queue = max_queue
+        self.slow_client_timeout = slow_client_timeout
+        self._subscribers = {}
+        self.published = 0
+        # 切断済みの購読者も含めた累計
+        self.counters = {"dropped": 0, "coalesced": 0, "disconnected": 0}
+
+    def subscribe(self, conversation_id: str, websocket) -> Subscriber:
+        """購読者を登録して送信タスクを開始"""
+        subscriber = Subscriber(conversation_id, websocket, self.max_queue, self.slow_client_timeout, self)
+        self._subscribers.setdefault(conversation_id, set()).add(subscriber)
+        subscriber.start()
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber) -> int:
+        """購読者を削除し、会話に残っている購読者数を返す"""
+        subscribers = self._subscribers.get(subscriber.conversation_id, set())
+        subscribers.discard(subscriber)
+        if not subscribers:
+            self._subscribers.pop(subscriber.conversation_id, None)
+        await subscriber.close()
+        return len(subscribers)
+
+    def channel(self, conversation_id: str) -> ConversationChannel:
+        return ConversationChannel(self, conversation_id)
+
+    def publish(self, conversation_id: str, data: Dict[str, Any]) -> int:
+        """会話の全購読者に配信し、キューに積めた購読者数を返す"""
+        subscribers = self._subscribers.get(conversation_id)
+        if not subscribers:
+            return 0
+
+        text = serialize_message(data)
+        droppable = data.get("type") in DROPPABLE_TYPES
+        # 満杯の間、進捗はフェーズごとに最新の1件だけ送れば十分
+        coalesce_key = f"progress:{data.get('phase')}" if data.get("type") == "progress_update" else None
+        self.published += 1
+        return sum(1 for subscriber in list(subscribers) if subscriber.enqueue(text, droppable, coalesce_key))
+
+    def subscriber_count(self, conversation_id: str) -> int:
+        return len(self._subscribers.get(conversation_id, ()))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """配信統計"""
+        subscribers = [s for group in self._subscribers.values() for s in group]
+        return {
+            "conversations": len(self._subscribers),
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "queued": sum(s.depth for s in subscribers),
+            "max_queue_depth": max((s.depth for s in subscribers), default=0),
+            "peak_queue_depth": max((s.max_depth for s in subscribers), default=0),
+            "queue_limit": self.max_queue,
+            "dropped": self.counters["dropped"],
+            "coalesced": self.counters["coalesced"],
+            "slow_client_disconnects": self.counters["disconnected"]
+        }
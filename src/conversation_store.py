@@ -0,0 +1,976 @@
+#!/usr/bin/env python3
+"""
+Conversation Store - 会話データの永続化レイヤー
+"""
+
+import os
+import json
+import sqlite3
+import base64
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+# イベント種別
+EVENT_MESSAGE_ADDED = "message_added"
+EVENT_DECISION_RECORDED = "decision_recorded"
+EVENT_MODELS_CHANGED = "models_changed"
+EVENT_STATUS_CHANGED = "status_changed"
+
+
+def make_event(event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """イベントレコードを作成"""
+    return {
+        "type": event_type,
+        "data": data,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def apply_event(conversation: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """イベントを会話データに適用"""
+    event_type = event.get("type")
+    data = event.get("data", {})
+
+    if event_type == EVENT_MESSAGE_ADDED:
+        conversation.setdefault("messages", []).append(data["message"])
+    elif event_type == EVENT_DECISION_RECORDED:
+        conversation.setdefault("user_decisions", []).append(data["decision"])
+    elif event_type == EVENT_MODELS_CHANGED:
+        conversation["selected_models"] = data["models"]
+    elif event_type == EVENT_STATUS_CHANGED:
+        conversation["status"] = data["status"]
+
+    if "seq" in event:
+        conversation["event_seq"] = event["seq"]
+
+    return conversation
+
+
+class ConversationManifest:
+    """会話サマリーの固定長レコードマニフェスト
+
+    1会話につき RECORD_SIZE バイトのレコード（空白埋めのJSON + 改行）を持ち、
+    更新は該当スロットへの上書きのみで行う。一覧取得はこのマニフェストだけを読む。
+    """
+
+    RECORD_SIZE = 512
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._records = {}
+        self._slots = {}
+        # 次に割り当てるスロット（ファイル上のスロット数）と、壊れていて再利用できるスロット
+        self._next_slot = 0
+        self._free_slots = []
+        # ページング用の (created_at, id) 昇順インデックスと件数カウンタ
+        self._order = []
+        self._user_order = {}
+        self._counts = {}
+        self._load()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _load(self):
+        """マニフェストを読み込んでメモリ上に展開"""
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        self._next_slot = len(data) // self.RECORD_SIZE
+        for slot in range(self._next_slot):
+            chunk = data[slot * self.RECORD_SIZE:(slot + 1) * self.RECORD_SIZE]
+            try:
+                record = json.loads(chunk.decode('utf-8').strip())
+                conversation_id = record["id"]
+            except (UnicodeDecodeError, json.JSONDecodeError, TypeError, KeyError):
+                # 壊れたスロットは新しい会話に再利用する（有効なレコードのスロットは上書きしない）
+                print(f"Skipping corrupt manifest record {slot} in {self.path}")
+                self._free_slots.append(slot)
+                continue
+            self._records[conversation_id] = record
+            self._slots[conversation_id] = slot
+
+        self._reindex()
+
+    def _reindex(self):
+        """ページング用インデックスを作り直す"""
+        self._order = sorted(summary_key(record) for record in self._records.values())
+        self._user_order = {}
+        self._counts = {}
+        for key in self._order:
+            record = self._records[key[1]]
+            self._user_order.setdefault(record["user_id"], []).append(key)
+            count_key = (record["user_id"], record["status"])
+            self._counts[count_key] = self._counts.get(count_key, 0) + 1
+
+    @staticmethod
+    def make_record(conversation: Dict[str, Any]) -> Dict[str, Any]:
+        """会話からマニフェストレコードを作成"""
+        record = summarize_conversation(conversation)
+        record["user_id"] = conversation.get("user_id", "default")
+        return record
+
+    def _encode(self, record: Dict[str, Any]) -> tuple:
+        """レコードを固定長バイト列に変換（長いリクエストは切り詰め）"""
+        record = dict(record)
+        limit = self.RECORD_SIZE - 1
+        encoded = json.dumps(record, ensure_ascii=False).encode('utf-8')
+
+        while len(encoded) > limit and record["project_request"]:
+            # 1文字は最大6バイト（\uXXXX）なので、超過分の1/6ずつ削れば行き過ぎない
+            excess = len(encoded) - limit
+            record["project_request"] = record["project_request"][:-max(1, excess // 6)]
+            encoded = json.dumps(record, ensure_ascii=False).encode('utf-8')
+
+        if len(encoded) > limit:
+            raise ValueError(f"Manifest record for {record['id']} exceeds {self.RECORD_SIZE} bytes")
+
+        return encoded.ljust(limit, b" ") + b"\n", record
+
+    def update(self, conversation: Dict[str, Any]):
+        """会話のレコードを作成または上書き"""
+        encoded, record = self._encode(self.make_record(conversation))
+        conversation_id = record["id"]
+
+        with self._lock:
+            slot = self._slots.get(conversation_id)
+            if slot is None:
+                slot = self._allocate_slot()
+                self._slots[conversation_id] = slot
+                key = summary_key(record)
+                bisect.insort(self._order, key)
+                bisect.insort(self._user_order.setdefault(record["user_id"], []), key)
+            else:
+                previous = self._records[conversation_id]
+                previous_key = (previous["user_id"], previous["status"])
+                self._counts[previous_key] -= 1
+            count_key = (record["user_id"], record["status"])
+            self._counts[count_key] = self._counts.get(count_key, 0) + 1
+            self._records[conversation_id] = record
+
+            mode = 'r+b' if self.path.exists() else 'wb'
+            with open(self.path, mode) as f:
+                f.seek(slot * self.RECORD_SIZE)
+                f.write(encoded)
+
+    def _allocate_slot(self) -> int:
+        """新しい会話のスロット（壊れたスロットを優先し、無ければファイル末尾）"""
+        if self._free_slots:
+            return self._free_slots.pop(0)
+        slot = self._next_slot
+        self._next_slot += 1
+        return slot
+
+    def contains(self, conversation_id: str) -> bool:
+        return conversation_id in self._records
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """会話のレコードを取得"""
+        return self._records.get(conversation_id)
+
+    def summaries(self, user_id: str = None) -> List[Dict[str, Any]]:
+        """サマリーの一覧（作成日時の降順）"""
+        with self._lock:
+            records = list(self._records.values())
+
+        summaries = [
+            {key: value for key, value in record.items() if key != "user_id"}
+            for record in records
+            if user_id is None or record.get("user_id") == user_id
+        ]
+        return sorted(summaries, key=lambda x: x["created_at"], reverse=True)
+
+    def page(self, user_id: str = None, statuses: List[str] = None, limit: int = 50,
+             after: tuple = None) -> Dict[str, Any]:
+        """(created_at, id) の降順でキーセットページング"""
+        with self._lock:
+            keys = self._order if user_id is None else self._user_order.get(user_id, [])
+            position = len(keys) if after is None else bisect.bisect_left(keys, tuple(after))
+
+            items = []
+            next_key = None
+            while position > 0:
+                position -= 1
+                record = self._records[keys[position][1]]
+                if statuses and record["status"] not in statuses:
+                    continue
+                if len(items) == limit:
+                    next_key = summary_key(items[-1])
+                    break
+                items.append(record)
+
+            total = sum(
+                count for (record_user, status), count in self._counts.items()
+                if (user_id is None or record_user == user_id) and (not statuses or status in statuses)
+            )
+
+        return {
+            "items": [{key: value for key, value in record.items() if key != "user_id"} for record in items],
+            "total": total,
+            "next": next_key
+        }
+
+    def rebuild(self, conversations) -> int:
+        """会話データからマニフェストを再構築"""
+        encoded_records = [self._encode(self.make_record(conversation)) for conversation in conversations]
+        records = [record for _, record in encoded_records]
+        tmp_path = self.path.with_suffix(".tmp")
+
+        with self._lock:
+            with open(tmp_path, 'wb') as f:
+                for encoded, _ in encoded_records:
+                    f.write(encoded)
+            os.replace(tmp_path, self.path)
+
+            self._records = {record["id"]: record for record in records}
+            self._slots = {record["id"]: slot for slot, record in enumerate(records)}
+            self._next_slot = len(records)
+            self._free_slots = []
+            self._reindex()
+
+        return len(records)
+
+
+class JSONLConversationStore:
+    """スナップショット + 追記専用イベントログによる会話ストア
+
+    conversations/<id>.json にスナップショット、conversations/<id>.events.jsonl に
+    スナップショット以降のイベントを1行ずつ追記する。イベント数が snapshot_interval に
+    達したらスナップショットを書き直してログを切り詰める（コンパクション）。
+    """
+
+    def __init__(self, conversations_dir: Path, snapshot_interval: int = 50, use_manifest: bool = True):
+        self.conversations_dir = Path(conversations_dir)
+        self.conversations_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshot_interval = snapshot_interval
+        self._events_since_snapshot = {}
+        self.manifest = None
+
+        if use_manifest:
+            self.manifest = ConversationManifest(self.conversations_dir / "manifest.dat")
+            if not self.manifest.exists():
+                self.rebuild_manifest()
+            else:
+                self._reconcile_manifest()
+
+    def _snapshot_path(self, conversation_id: str) -> Path:
+        return self.conversations_dir / f"{conversation_id}.json"
+
+    def _log_path(self, conversation_id: str) -> Path:
+        return self.conversations_dir / f"{conversation_id}.events.jsonl"
+
+    def save_snapshot(self, conversation: Dict[str, Any]):
+        """スナップショットを書き込みイベントログを切り詰める"""
+        conversation_id = conversation["id"]
+        snapshot_path = self._snapshot_path(conversation_id)
+        tmp_path = snapshot_path.with_suffix(".json.tmp")
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(conversation, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, snapshot_path)
+
+        # スナップショットに event_seq が含まれるため、ここでクラッシュしても二重適用されない
+        log_path = self._log_path(conversation_id)
+        if log_path.exists():
+            log_path.unlink()
+
+        self._events_since_snapshot[conversation_id] = 0
+
+        if self.manifest is not None:
+            self.manifest.update(conversation)
+
+    def append_event(self, conversation: Dict[str, Any], event: Dict[str, Any]):
+        """イベントをログに追記（必要ならコンパクション）"""
+        self.append_events(conversation, [event])
+
+    def append_events(self, conversation: Dict[str, Any], events: List[Dict[str, Any]]):
+        """複数のイベントを1回の書き込みで追記（必要ならコンパクション）"""
+        conversation_id = conversation["id"]
+
+        with open(self._log_path(conversation_id), 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events))
+
+        count = self._events_since_snapshot.get(conversation_id, 0) + len(events)
+        self._events_since_snapshot[conversation_id] = count
+
+        if count >= self.snapshot_interval:
+            self.save_snapshot(conversation)
+        elif self.manifest is not None:
+            self.manifest.update(conversation)
+
+    def load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """スナップショットを読み込みログの末尾を再生"""
+        snapshot_path = self._snapshot_path(conversation_id)
+        if not snapshot_path.exists():
+            return None
+
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            conversation = json.load(f)
+
+        snapshot_seq = conversation.get("event_seq", 0)
+        replayed = 0
+
+        for event in self._read_events(conversation_id):
+            if event.get("seq", 0) <= snapshot_seq:
+                continue
+            apply_event(conversation, event)
+            replayed += 1
+
+        self._events_since_snapshot[conversation_id] = replayed
+        return conversation
+
+    def _read_events(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """イベントログを読み込む（書きかけの末尾行は無視）"""
+        log_path = self._log_path(conversation_id)
+        if not log_path.exists():
+            return []
+
+        events = []
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"Skipping corrupt event in {log_path}")
+        return events
+
+    def checkpoint(self, conversation: Dict[str, Any]):
+        """未統合のイベントがあればスナップショットに統合"""
+        if self._events_since_snapshot.get(conversation["id"], 0) > 0:
+            self.save_snapshot(conversation)
+
+    def compact(self, conversation_id: str) -> bool:
+        """ログを再生してスナップショットに統合"""
+        conversation = self.load(conversation_id)
+        if conversation is None:
+            return False
+        self.save_snapshot(conversation)
+        return True
+
+    def list_conversation_ids(self) -> List[str]:
+        """保存されている会話IDの一覧"""
+        return [path.stem for path in self.conversations_dir.glob("*.json")]
+
+    def iter_conversations(self):
+        """保存されている全会話を読み込む"""
+        for conversation_id in self.list_conversation_ids():
+            try:
+                conversation = self.load(conversation_id)
+            except Exception as e:
+                print(f"Error loading conversation {conversation_id}: {e}")
+                continue
+            if conversation is not None:
+                yield conversation
+
+    def rebuild_manifest(self) -> int:
+        """conversations/ からマニフェストを再構築"""
+        if self.manifest is None:
+            return 0
+        return self.manifest.rebuild(self.iter_conversations())
+
+    def _reconcile_manifest(self):
+        """マニフェストに無い会話を追加（スナップショット作成直後のクラッシュ対策）"""
+        for conversation_id in self.list_conversation_ids():
+            if self.manifest.contains(conversation_id):
+                continue
+            try:
+                conversation = self.load(conversation_id)
+            except Exception as e:
+                print(f"Error loading conversation {conversation_id}: {e}")
+                continue
+            if conversation is not None:
+                self.manifest.update(conversation)
+
+    def list_summaries(self, user_id: str = None) -> List[Dict[str, Any]]:
+        """会話サマリーの一覧（作成日時の降順）"""
+        if self.manifest is not None:
+            return self.manifest.summaries(user_id)
+
+        conversations = [
+            summarize_conversation(conversation)
+            for conversation in self.iter_conversations()
+            if user_id is None or conversation.get("user_id") == user_id
+        ]
+        return sorted(conversations, key=lambda x: x["created_at"], reverse=True)
+
+
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """1件の会話サマリーを取得"""
+        if self.manifest is not None:
+            return self.manifest.get(conversation_id)
+
+        conversation = self.load(conversation_id)
+        return summarize_conversation(conversation) if conversation else None
+
+    def page_summaries(self, user_id: str = None, statuses: List[str] = None, limit: int = 50,
+                       after: tuple = None) -> Dict[str, Any]:
+        """会話サマリーをキーセットページングで取得"""
+        if self.manifest is not None:
+            return self.manifest.page(user_id, statuses, limit, after)
+
+        summaries = [
+            summary for summary in self.list_summaries(user_id)
+            if not statuses or summary["status"] in statuses
+        ]
+        return paginate_summaries(summaries, limit, after)
+
+
+class SQLiteConversationStore:
+    """SQLite (WALモード) による会話ストア
+
+    会話・メッセージ・決定をテーブルに分けて保存し、一覧取得は
+    (user_id, created_at) インデックスを使ったクエリで返す。
+    """
+
+    # conversations テーブルの列に展開されるキー（それ以外は extra に JSON で保存）
+    CONVERSATION_COLUMNS = ("id", "user_id", "project_request", "created_at", "status", "event_seq")
+    NESTED_KEYS = ("messages", "user_decisions", "selected_models")
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._initialize_schema()
+
+    def _initialize_schema(self):
+        """スキーマを作成"""
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    project_request TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    selected_models TEXT,
+                    extra TEXT NOT NULL DEFAULT '{}',
+                    event_seq INTEGER NOT NULL DEFAULT 0,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    decision_count INTEGER NOT NULL DEFAULT 0
+                );
+                DROP INDEX IF EXISTS idx_conversations_user_created;
+                DROP INDEX IF EXISTS idx_conversations_created;
+                CREATE INDEX IF NOT EXISTS idx_conversations_user_created_id
+                    ON conversations (user_id, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_conversations_created_id
+                    ON conversations (created_at, id);
+
+                CREATE TABLE IF NOT EXISTS messages (
+                    rowid INTEGER PRIMARY KEY,
+                    conversation_id TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL DEFAULT '{}',
+                    timestamp TEXT NOT NULL,
+                    extra TEXT NOT NULL DEFAULT '{}',
+                    seq INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_conversation
+                    ON messages (conversation_id, rowid);
+
+                CREATE TABLE IF NOT EXISTS decisions (
+                    rowid INTEGER PRIMARY KEY,
+                    conversation_id TEXT NOT NULL,
+                    decision_id TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    context TEXT NOT NULL DEFAULT '{}',
+                    timestamp TEXT NOT NULL,
+                    seq INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_decisions_conversation
+                    ON decisions (conversation_id, rowid);
+            """)
+
+        self._migrate_schema()
+
+    def _migrate_schema(self):
+        """既存DBに不足している列を追加"""
+        with self._lock, self._conn:
+            for table in ("messages", "decisions"):
+                columns = [row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+                if "seq" not in columns:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        """接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    # --- 行 <-> dict 変換 ---
+
+    def _conversation_row(self, conversation: Dict[str, Any]) -> tuple:
+        extra = {
+            key: value for key, value in conversation.items()
+            if key not in self.CONVERSATION_COLUMNS and key not in self.NESTED_KEYS
+        }
+        selected_models = conversation.get("selected_models")
+        return (
+            conversation["id"],
+            conversation.get("user_id", "default"),
+            conversation.get("project_request", ""),
+            conversation.get("created_at", datetime.now().isoformat()),
+            conversation.get("status", "active"),
+            json.dumps(selected_models, ensure_ascii=False) if selected_models is not None else None,
+            json.dumps(extra, ensure_ascii=False),
+            conversation.get("event_seq", 0),
+            len(conversation.get("messages", [])),
+            len(conversation.get("user_decisions", [])),
+        )
+
+    @staticmethod
+    def _message_row(conversation_id: str, message: Dict[str, Any]) -> tuple:
+        known = ("id", "type", "content", "metadata", "timestamp", "seq")
+        extra = {key: value for key, value in message.items() if key not in known}
+        return (
+            conversation_id,
+            message.get("id", ""),
+            message.get("type", ""),
+            message.get("content", ""),
+            json.dumps(message.get("metadata", {}), ensure_ascii=False),
+            message.get("timestamp", ""),
+            json.dumps(extra, ensure_ascii=False),
+            message.get("seq", 0),
+        )
+
+    @staticmethod
+    def _decision_row(conversation_id: str, decision: Dict[str, Any]) -> tuple:
+        return (
+            conversation_id,
+            decision.get("id", ""),
+            decision.get("question", ""),
+            decision.get("answer", ""),
+            json.dumps(decision.get("context", {}), ensure_ascii=False),
+            decision.get("timestamp", ""),
+            decision.get("seq", 0),
+        )
+
+    def _write_conversation(self, conversation: Dict[str, Any]):
+        """会話全体を書き込む（ロック・トランザクションは呼び出し側）"""
+        conversation_id = conversation["id"]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversations (id, user_id, project_request, created_at, status, "
+            "selected_models, extra, event_seq, message_count, decision_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._conversation_row(conversation)
+        )
+        self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        self._conn.execute("DELETE FROM decisions WHERE conversation_id = ?", (conversation_id,))
+        self._conn.executemany(
+            "INSERT INTO messages (conversation_id, message_id, type, content, metadata, timestamp, extra, seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._message_row(conversation_id, m) for m in conversation.get("messages", [])]
+        )
+        self._conn.executemany(
+            "INSERT INTO decisions (conversation_id, decision_id, question, answer, context, timestamp, seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self._decision_row(conversation_id, d) for d in conversation.get("user_decisions", [])]
+        )
+
+    # --- ストアインターフェース ---
+
+    def save_snapshot(self, conversation: Dict[str, Any]):
+        """会話全体を保存"""
+        with self._lock, self._conn:
+            self._write_conversation(conversation)
+
+    def append_event(self, conversation: Dict[str, Any], event: Dict[str, Any]):
+        """イベントを対応するテーブルへの1行書き込みとして反映"""
+        self.append_events(conversation, [event])
+
+    def append_events(self, conversation: Dict[str, Any], events: List[Dict[str, Any]]):
+        """複数のイベントを1トランザクションで反映"""
+        with self._lock, self._conn:
+            for event in events:
+                self._write_event(conversation, event)
+
+    def _write_event(self, conversation: Dict[str, Any], event: Dict[str, Any]):
+        """イベントを書き込む（ロック・トランザクションは呼び出し側）"""
+        conversation_id = conversation["id"]
+        event_type = event.get("type")
+        data = event.get("data", {})
+        seq = event.get("seq", conversation.get("event_seq", 0))
+
+        if event_type == EVENT_MESSAGE_ADDED:
+            self._conn.execute(
+                "INSERT INTO messages (conversation_id, message_id, type, content, metadata, timestamp, extra, seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._message_row(conversation_id, data["message"])
+            )
+            self._conn.execute(
+                "UPDATE conversations SET message_count = message_count + 1, event_seq = ? WHERE id = ?",
+                (seq, conversation_id)
+            )
+        elif event_type == EVENT_DECISION_RECORDED:
+            self._conn.execute(
+                "INSERT INTO decisions (conversation_id, decision_id, question, answer, context, timestamp, seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._decision_row(conversation_id, data["decision"])
+            )
+            self._conn.execute(
+                "UPDATE conversations SET decision_count = decision_count + 1, event_seq = ? WHERE id = ?",
+                (seq, conversation_id)
+            )
+        elif event_type == EVENT_MODELS_CHANGED:
+            self._conn.execute(
+                "UPDATE conversations SET selected_models = ?, event_seq = ? WHERE id = ?",
+                (json.dumps(data["models"], ensure_ascii=False), seq, conversation_id)
+            )
+        elif event_type == EVENT_STATUS_CHANGED:
+            self._conn.execute(
+                "UPDATE conversations SET status = ?, event_seq = ? WHERE id = ?",
+                (data["status"], seq, conversation_id)
+            )
+        else:
+            self._write_conversation(conversation)
+
+    def load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """会話を読み込む"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            message_rows = self._conn.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY rowid", (conversation_id,)
+            ).fetchall()
+            decision_rows = self._conn.execute(
+                "SELECT * FROM decisions WHERE conversation_id = ? ORDER BY rowid", (conversation_id,)
+            ).fetchall()
+
+        conversation = {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "project_request": row["project_request"],
+            "created_at": row["created_at"],
+            "status": row["status"],
+        }
+        conversation.update(json.loads(row["extra"]))
+        if row["selected_models"] is not None:
+            conversation["selected_models"] = json.loads(row["selected_models"])
+
+        messages = []
+        for m in message_rows:
+            message = {
+                "id": m["message_id"],
+                "type": m["type"],
+                "content": m["content"],
+                "metadata": json.loads(m["metadata"]),
+                "timestamp": m["timestamp"],
+            }
+            message.update(json.loads(m["extra"]))
+            if m["seq"]:
+                message["seq"] = m["seq"]
+            messages.append(message)
+
+        decisions = []
+        for d in decision_rows:
+            decision = {
+                "id": d["decision_id"],
+                "question": d["question"],
+                "answer": d["answer"],
+                "context": json.loads(d["context"]),
+                "timestamp": d["timestamp"],
+            }
+            if d["seq"]:
+                decision["seq"] = d["seq"]
+            decisions.append(decision)
+
+        conversation["messages"] = messages
+        conversation["user_decisions"] = decisions
+        conversation["event_seq"] = row["event_seq"]
+
+        return conversation
+
+    def checkpoint(self, conversation: Dict[str, Any]):
+        """SQLiteでは書き込み済みのため何もしない"""
+        pass
+
+    def compact(self, conversation_id: str) -> bool:
+        """SQLiteではコンパクション不要"""
+        return self.load(conversation_id) is not None
+
+    def list_conversation_ids(self) -> List[str]:
+        """保存されている会話IDの一覧"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM conversations").fetchall()
+        return [row["id"] for row in rows]
+
+    def iter_conversations(self):
+        """保存されている全会話を読み込む"""
+        for conversation_id in self.list_conversation_ids():
+            conversation = self.load(conversation_id)
+            if conversation is not None:
+                yield conversation
+
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """1件の会話サマリーを取得"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, project_request, created_at, status, message_count, decision_count "
+                "FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_summaries(self, user_id: str = None) -> List[Dict[str, Any]]:
+        """会話サマリーの一覧（インデックスを使って作成日時の降順）"""
+        query = ("SELECT id, project_request, created_at, status, message_count, decision_count "
+                 "FROM conversations")
+        params = ()
+        if user_id is not None:
+            query += " WHERE user_id = ?"
+            params = (user_id,)
+        query += " ORDER BY created_at DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def page_summaries(self, user_id: str = None, statuses: List[str] = None, limit: int = 50,
+                       after: tuple = None) -> Dict[str, Any]:
+        """会話サマリーをキーセットページングで取得（インデックス範囲スキャン）"""
+        conditions = []
+        params = []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if statuses:
+            conditions.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+
+        count_query = "SELECT COUNT(*) FROM conversations"
+        if conditions:
+            count_query += " WHERE " + " AND ".join(conditions)
+        count_params = list(params)
+
+        if after is not None:
+            conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([after[0], after[0], after[1]])
+
+        query = ("SELECT id, project_request, created_at, status, message_count, decision_count "
+                 "FROM conversations")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            total = self._conn.execute(count_query, count_params).fetchone()[0]
+
+        items = [dict(row) for row in rows[:limit]]
+        next_key = summary_key(items[-1]) if len(rows) > limit else None
+        return {"items": items, "total": total, "next": next_key}
+
+    def import_conversations(self, conversations: List[Dict[str, Any]]) -> int:
+        """会話を一括インポート（単一トランザクション）"""
+        with self._lock, self._conn:
+            for conversation in conversations:
+                self._write_conversation(conversation)
+        return len(conversations)
+
+    def import_json_directory(self, conversations_dir: Path, batch_size: int = 500) -> int:
+        """既存の conversations/*.json（+ イベントログ）を一括インポート"""
+        source = JSONLConversationStore(conversations_dir, use_manifest=False)
+        imported = 0
+        batch = []
+
+        for conversation in source.iter_conversations():
+            batch.append(conversation)
+            if len(batch) >= batch_size:
+                imported += self.import_conversations(batch)
+                batch = []
+
+        if batch:
+            imported += self.import_conversations(batch)
+
+        return imported
+
+
+
+def snapshot_copy(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """書き出し用の浅いコピー（メッセージ等は追記のみで変更されないためリストだけ複製）"""
+    return {
+        key: list(value) if isinstance(value, list) else value
+        for key, value in conversation.items()
+    }
+
+
+def items_since(items: List[Dict[str, Any]], since_seq: int) -> List[Dict[str, Any]]:
+    """seq が since_seq より大きい要素を返す（末尾から走査するため差分量に比例）"""
+    if since_seq <= 0:
+        return list(items)
+
+    start = len(items)
+    while start > 0 and items[start - 1].get("seq", 0) > since_seq:
+        start -= 1
+    return items[start:]
+
+
+def estimate_size(value: Any) -> int:
+    """JSONシリアライズ後のバイト数でサイズを見積もる"""
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+class ConversationCache:
+    """件数とバイト数で上限を持つ会話のLRUキャッシュ
+
+    上限を超えると最も長く使われていない会話を on_evict に渡してから追い出す。
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """キャッシュから取得（ヒット時は最近使用に移動）"""
+        with self._lock:
+            conversation = self._entries.get(conversation_id)
+            if conversation is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            return conversation
+
+    def put(self, conversation_id: str, conversation: Dict[str, Any]):
+        """キャッシュに追加"""
+        with self._lock:
+            if conversation_id in self._entries:
+                self._total_bytes -= self._sizes[conversation_id]
+            self._entries[conversation_id] = conversation
+            self._entries.move_to_end(conversation_id)
+            self._sizes[conversation_id] = estimate_size(conversation)
+            self._total_bytes += self._sizes[conversation_id]
+            self._evict_if_needed()
+
+    def grow(self, conversation_id: str, delta_bytes: int):
+        """会話の更新に合わせて見積もりサイズを加算"""
+        with self._lock:
+            if conversation_id not in self._entries:
+                return
+            self._sizes[conversation_id] += delta_bytes
+            self._total_bytes += delta_bytes
+            self._entries.move_to_end(conversation_id)
+            self._evict_if_needed()
+
+    def discard(self, conversation_id: str):
+        """エントリを削除（on_evict は呼ばない）"""
+        with self._lock:
+            if self._entries.pop(conversation_id, None) is not None:
+                self._total_bytes -= self._sizes.pop(conversation_id)
+
+    def _evict_if_needed(self):
+        """上限を超えている間、古いエントリを追い出す（直近の1件は残す）"""
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            conversation_id, conversation = self._entries.popitem(last=False)
+            if self.on_evict:
+                try:
+                    self.on_evict(conversation_id, conversation)
+                except Exception as e:
+                    print(f"Error flushing evicted conversation {conversation_id}: {e}")
+            self._total_bytes -= self._sizes.pop(conversation_id)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+def summarize_conversation(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """一覧表示用のサマリーを作成"""
+    return {
+        "id": conversation["id"],
+        "project_request": conversation["project_request"],
+        "created_at": conversation["created_at"],
+        "status": conversation["status"],
+        "message_count": len(conversation.get("messages", [])),
+        "decision_count": len(conversation.get("user_decisions", []))
+    }
+
+
+def summary_key(summary: Dict[str, Any]) -> tuple:
+    """ページングのソートキー"""
+    return (summary["created_at"], summary["id"])
+
+
+def paginate_summaries(summaries: List[Dict[str, Any]], limit: int = 50, after: tuple = None) -> Dict[str, Any]:
+    """メモリ上のサマリー一覧を (created_at, id) の降順でページング"""
+    ordered = sorted(summaries, key=summary_key, reverse=True)
+    if after is not None:
+        ordered = [summary for summary in ordered if summary_key(summary) < tuple(after)]
+
+    items = ordered[:limit]
+    next_key = summary_key(items[-1]) if len(ordered) > limit else None
+    return {"items": items, "total": len(summaries), "next": next_key}
+
+
+def encode_cursor(key: tuple) -> str:
+    """ページングキーをURLセーフなカーソル文字列に変換"""
+    raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """カーソル文字列をページングキーに戻す（不正な場合は ValueError）"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, conversation_id = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return (str(created_at), str(conversation_id))
+
+
+def create_conversation_store(backend: str = "jsonl", conversations_dir: str = "conversations",
+                              snapshot_interval: int = 50, sqlite_path: str = None):
+    """設定に応じたストアを作成"""
+    if backend == "sqlite":
+        db_path = Path(sqlite_path) if sqlite_path else Path(conversations_dir) / "conversations.db"
+        return SQLiteConversationStore(db_path)
+    if backend == "jsonl":
+        return JSONLConversationStore(Path(conversations_dir), snapshot_interval)
+    raise ValueError(f"Unknown conversation storage backend: {backend}")
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Conversation Summary - 長い会話の古いターンを一定サイズの要約にまとめる
+"""
+
+import re
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Any, Optional, Tuple
+
+from utils.config_manager import ConfigManager
+from ai_providers import get_provider_registry
+from context_packer import DECISION_MARKERS, estimate_tokens, truncate_to_tokens
+
+# ファイル作成を示す行の目印（小文字で比較）
+ARTIFACT_MARKERS = ("created", "作成")
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between AI assistants working on a software project.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Write the updated summary in at most {max_tokens} tokens as short bullet lines. Keep decisions, created files, agreed designs and open issues; drop greetings and repeated content."""
+
+_WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}|[぀-ヿ一-鿿]{2,}")
+
+
+def _candidate_lines(message: Dict[str, Any]) -> List[Tuple[str, bool]]:
+    """メッセージを要約候補の行に分ける（コードブロックの中身は除き、(行, 先頭行か) を返す）"""
+    speaker = message.get("speaker", "unknown")
+    lines = []
+    in_code = False
+    for line in message.get("content", "").splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_code = not in_code
+            continue
+        if in_code or len(stripped) < 8:
+            continue
+        lines.append((f"{speaker}: {stripped.lstrip('#-*• ')}", not lines))
+    return lines
+
+
+def extract_summary_lines(messages: List[Dict[str, Any]]) -> List[Tuple[float, str]]:
+    """抽出型要約の候補行に重要度を付ける
+
+    まとめる範囲に多く出てくる語を含む行ほど高く、決定事項・ファイル作成・各メッセージの
+    先頭行は優先する。
+    """
+    candidates = []
+    seen = set()
+    for message in messages:
+        for line, first in _candidate_lines(message):
+            # 話者が違っても同じ内容の行は1度だけ
+            text = line.split(": ", 1)[1]
+            if text not in seen:
+                seen.add(text)
+                candidates.append((line, first))
+    frequencies = Counter(
+        word.lower() for line, _ in candidates for word in _WORD_PATTERN.findall(line)
+    )
+
+    scored = []
+    for line, first in candidates:
+        words = [word.lower() for word in _WORD_PATTERN.findall(line)]
+        score = sum(frequencies[word] for word in set(words)) / math.sqrt(len(words) + 1)
+        lowered = line.lower()
+        if any(marker in lowered for marker in DECISION_MARKERS):
+            score *= 3
+        if any(marker in lowered for marker in ARTIFACT_MARKERS):
+            score *= 2
+        if first:
+            score *= 1.5
+        scored.append((score, line))
+    return scored
+
+
+class RollingSummary:
+    """1つの会話の要約を interval ターンごとに少しずつ更新する
+
+    直近 keep_recent 件より前のメッセージを interval 件たまるごとに要約へ畳み込み、
+    要約は常に max_tokens 以内に保つ。ペルソナのプロンプトには要約と、まだ畳み込んで
+    いない直近のメッセージだけが入るので、会話が長くなってもプロンプトの大きさは変わらない。
+    model を指定すると安価なモデルで要約し（別スレッドで実行してターンを待たせない）、
+    失敗した場合や指定が無い場合はローカルの抽出型要約を使う。
+    """
+
+    def __init__(self, interval: int = 4, keep_recent: int = 4, max_tokens: int = 400,
+                 provider: str = None, model: str = None, providers=None):
+        self.interval = max(interval, 1)
+        self.keep_recent = max(keep_recent, 0)
+        self.max_tokens = max_tokens
+        self.provider = provider
+        self.model = model
+        self.providers = providers
+        self._lock = threading.Lock()
+        self._lines = []
+        self._updating = False
+        self.text = ""
+        self.covered = 0
+        self.folds = 0
+        self.model_folds = 0
+        self.model_errors = 0
+
+    def snapshot(self) -> Tuple[str, int]:
+        """(要約, 要約に畳み込み済みのメッセージ数)"""
+        with self._lock:
+            return self.text, self.covered
+
+    def update(self, conversation_log: list):
+        """畳み込み待ちのメッセージが interval 件たまっていれば要約を更新"""
+        end = len(conversation_log) - self.keep_recent
+        with self._lock:
+            if self._updating or end - self.covered < self.interval:
+                return
+            start = self.covered
+            self._updating = True
+        messages = list(conversation_log[start:end])
+
+        if self.model and self.providers is not None and self.providers.is_available(self.provider):
+            threading.Thread(
+                target=self._fold_with_model, args=(messages, end), name="conversation-summary", daemon=True
+            ).start()
+        else:
+            self._fold_extractive(messages, end)
+
+    def _fold_extractive(self, messages: List[Dict[str, Any]], end: int):
+        with self._lock:
+            # 古い要約行は少しずつ重要度を下げ、新しい内容に場所を譲る
+            lines = [(score * 0.8, line) for score, line in self._lines]
+            known = {line.split(": ", 1)[-1] for _, line in lines}
+            lines += [item for item in extract_summary_lines(messages) if item[1].split(": ", 1)[1] not in known]
+            while lines and sum(estimate_tokens(line) for _, line in lines) > self.max_tokens:
+                lines.remove(min(lines, key=lambda item: item[0]))
+            self._commit(lines, "\n".join(line for _, line in lines), end)
+
+    def _fold_with_model(self, messages: List[Dict[str, Any]], end: int):
+        with self._lock:
+            current = self.text
+        prompt = SUMMARY_PROMPT.format(
+            summary=current or "(none)",
+            messages="\n".join(f"{msg.get('speaker', 'unknown')}: {msg.get('content', '')}" for msg in messages),
+            max_tokens=self.max_tokens
+        )
+        try:
+            result = self.providers.generate(
+                self.provider, self.model, prompt, max_tokens=self.max_tokens, temperature=0.2
+            )
+        except Exception as e:
+            print(f"Error summarizing conversation with {self.provider}: {e}")
+            with self._lock:
+                self.model_errors += 1
+            self._fold_extractive(messages, end)
+            return
+
+        text = truncate_to_tokens(result["text"].strip(), self.max_tokens)
+        with self._lock:
+            self.model_folds += 1
+            self._commit([(1.0, line) for line in text.splitlines() if line.strip()], text, end)
+
+    def _commit(self, lines: List[Tuple[float, str]], text: str, end: int):
+        """要約と畳み込み済みの位置をまとめて差し替える（ロック内で呼ぶ）"""
+        self._lines = lines
+        self.text = text
+        self.covered = end
+        self.folds += 1
+        self._updating = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "covered_messages": self.covered,
+                "summary_tokens": estimate_tokens(self.text),
+                "folds": self.folds,
+                "model_folds": self.model_folds,
+                "model_errors": self.model_errors
+            }
+
+
+def create_rolling_summary(config: ConfigManager = None, providers=None) -> Optional[RollingSummary]:
+    """設定 ai.summary から会話の要約を作成（無効な場合は None）"""
+    summary_config = (config or ConfigManager()).get("ai.summary", {})
+    if not summary_config.get("enabled", True):
+        return None
+
+    model = summary_config.get("model")
+    if model and providers is None:
+        providers = get_provider_registry()
+    return RollingSummary(
+        summary_config.get("interval", 4),
+        summary_config.get("keep_recent", 4),
+        summary_config.get("max_tokens", 400),
+        summary_config.get("provider", "gemini"),
+        model,
+        providers
+    )
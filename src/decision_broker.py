@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Decision Broker - WebSocket 経由のユーザー決定待ちを Future で管理
+"""
+
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Any
+
+
+class DecisionCancelled(Exception):
+    """決定待ちが取り消された（クライアント切断など）"""
+    pass
+
+
+class DecisionBroker:
+    """decision_id ごとの asyncio.Future でユーザーの回答を待つ
+
+    user_decision メッセージが届いた時点で resolve() が Future を完了させるため、
+    ポーリングせずに即座に待機側へ回答が渡る。イベントループ上でのみ使用する。
+    """
+
+    def __init__(self, default_timeout: float = 300.0):
+        self.default_timeout = default_timeout
+        self._pending = {}
+        self._counts = {}
+        self.resolved = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def create(self, conversation_id: str, question: str = "", context: Dict = None,
+               options: List[str] = None, default: str = None) -> str:
+        """決定待ちを登録して decision_id を返す"""
+        decision_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self._pending[decision_id] = {
+            "conversation_id": conversation_id,
+            "question": question,
+            "context": context or {},
+            "options": options or [],
+            "default": default,
+            "future": future
+        }
+        self._counts[conversation_id] = self._counts.get(conversation_id, 0) + 1
+        return decision_id
+
+    async def wait(self, decision_id: str, timeout: float = None) -> str:
+        """回答を待つ（タイムアウトは asyncio.TimeoutError、取り消しは DecisionCancelled）"""
+        entry = self._pending.get(decision_id)
+        if entry is None:
+            raise KeyError(f"Unknown decision: {decision_id}")
+
+        try:
+            return await asyncio.wait_for(entry["future"], timeout or self.default_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.discard(decision_id)
+
+    def resolve(self, conversation_id: str, decision_id: str, answer: str) -> Optional[Dict[str, Any]]:
+        """回答で Future を完了させ、質問の情報を返す（該当なしは None）"""
+        entry = self._pending.get(decision_id)
+        if entry is None or entry["conversation_id"] != conversation_id or entry["future"].done():
+            return None
+
+        entry["future"].set_result(answer)
+        self.resolved += 1
+        return {"question": entry["question"], "context": entry["context"]}
+
+    def cancel_conversation(self, conversation_id: str, reason: str = "client disconnected") -> int:
+        """会話の決定待ちを全て取り消す"""
+        cancelled = 0
+        for entry in list(self._pending.values()):
+            if entry["conversation_id"] == conversation_id and not entry["future"].done():
+                entry["future"].set_exception(DecisionCancelled(reason))
+                cancelled += 1
+
+        self.cancelled += cancelled
+        return cancelled
+
+    def discard(self, decision_id: str):
+        """決定待ちを登録解除（登録済みでなければ何もしない）"""
+        entry = self._pending.pop(decision_id, None)
+        if entry is None:
+            return
+
+        conversation_id = entry["conversation_id"]
+        self._counts[conversation_id] -= 1
+        if self._counts[conversation_id] <= 0:
+            del self._counts[conversation_id]
+
+    def pending_for(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """会話の未回答の決定待ち（再接続した購読者に送り直す）"""
+        return [
+            {"decision_id": decision_id, "question": entry["question"], "options": entry["options"],
+             "default": entry["default"], "context": entry["context"]}
+            for decision_id, entry in self._pending.items()
+            if entry["conversation_id"] == conversation_id and not entry["future"].done()
+        ]
+
+    def pending_count(self, conversation_id: str = None) -> int:
+        """決定待ちの件数（会話指定時はその会話のみ）"""
+        if conversation_id is None:
+            return len(self._pending)
+        return self._counts.get(conversation_id, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """決定待ちの統計"""
+        return {
+            "pending": len(self._pending),
+            "pending_by_conversation": dict(self._counts),
+            "resolved": self.resolved,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled
+        }
@@ -5,6 +5,7 @@ Enhanced AI Collaboration System - ユーザー対話機能付き
 
 import sys
 import json
+import time
 import traceback
 from pathlib import Path
 from typing import Dict, List, Optional, Any
@@ -12,11 +13,15 @@ from datetime import datetime
 
 # Import existing modules
 from ai_collaboration_core import AICollaborationCore
-from user_interaction import UserInteractionManager, ask_user, handle_error_with_user, confirm_action
+from user_interaction import UserInteractionManager, ask_user
+from resilience import RetryPolicy
 
 class EnhancedAICollaboration(AICollaborationCore):
     """ユーザー対話機能を強化したAI協調システム"""
     
+    # 1フェーズでAI同士が会話するターン数の上限（ターンごとにプロバイダーを呼び出すため）
+    MAX_PHASE_TURNS = 10
+    
     def __init__(self, config_path: Optional[str] = None):
         super().__init__(config_path)
         self.user_interaction = UserInteractionManager(
@@ -24,6 +29,21 @@ class EnhancedAICollaboration(AICollaborationCore):
         )
         self.error_count = 0
         self.max_retries = self.config.get("system.max_retries", 3)
+        # フェーズの再試行はジッター付き指数バックオフで間隔を空ける
+        self.phase_retry = RetryPolicy(
+            self.max_retries,
+            self.config.get("system.retry_base_delay", 1.0),
+            self.config.get("system.retry_max_delay", 30.0)
+        )
+        # 進捗通知先 callback(phase, message)（WebUIから設定）
+        self.progress_callback = None
+        # AI応答のストリーム通知先 delta_callback(speaker, turn, delta) / response_callback(speaker, turn, content, metadata)
+        self.delta_callback = None
+        self.response_callback = None
+        # プロバイダーごとの使用モデル {"openai": ..., "anthropic": ..., "gemini": ...}（未指定は設定の既定値）
+        self.models = None
+        # True の場合はキャッシュ済みの応答を使わずにAIを呼び出す
+        self.bypass_cache = False
         
     def run_complete_workflow_with_interaction(self, project_request: str, mode: str = "full") -> Dict[str, Any]:
         """ユーザー対話付きの完全ワークフロー実行"""
@@ -33,9 +53,10 @@ class EnhancedAICollaboration(AICollaborationCore):
         print(f"Mode: {mode}")
         
         # プロジェクト開始の確認
-        if not confirm_action(
+        if not self.user_interaction.request_confirmation(
             f"Start AI collaboration for: {project_request}",
-            {"mode": mode, "estimated_time": "5-10 minutes"}
+            {"mode": mode, "estimated_time": "5-10 minutes"},
+            default=True
         ):
             return {"status": "cancelled_by_user", "reason": "User cancelled at start"}
         
@@ -64,7 +85,7 @@ class EnhancedAICollaboration(AICollaborationCore):
                     # Ask user for design input
                     design_data = self._get_design_from_user(project_request)
                 
-                results["phases"]["implementation"] = self._run_implementation_phase_with_interaction(design_data)
+                results["phases"]["implementation"] = self._run_implementation_phase_with_interaction(design_data, project_request)
                 
                 if results["phases"]["implementation"].get("status") == "error":
                     return self._handle_phase_error("implementation", results)
@@ -96,16 +117,22 @@ class EnhancedAICollaboration(AICollaborationCore):
         """対話付き設計フェーズ"""
         
         print(f"\n📋 Phase 1: Design Collaboration")
+        self._report_progress("design", "Starting design phase...")
         
+        # 会話は一度だけ行い、再試行では再利用する（ターンごとにプロバイダーを呼び出すため）
+        conversation = None
         retry_count = 0
         while retry_count < self.max_retries:
             try:
-                # Design phase implementation
-                design_result = self.design_system.run_design_phase(project_request)
-                
-                # Check if design was successful
-                if not design_result or design_result.get("error"):
-                    raise Exception(f"Design phase failed: {design_result.get('error', 'Unknown error')}")
+                # AI同士の設計会話（応答は生成されたそばから通知）
+                if conversation is None:
+                    conversation = self._run_phase_conversation(
+                        project_request, "design", self._phase_turns("design_turns", 2)
+                    )
+                design_result = {
+                    **self._create_default_design(project_request),
+                    "conversation_log": conversation["conversation_log"]
+                }
                 
                 # Ask user to review design
                 if self._review_design_with_user(design_result):
@@ -128,7 +155,7 @@ class EnhancedAICollaboration(AICollaborationCore):
                 retry_count += 1
                 self.error_count += 1
                 
-                error_response = handle_error_with_user(
+                error_response = self.user_interaction.handle_error(
                     e,
                     context={
                         "phase": "design",
@@ -144,15 +171,20 @@ class EnhancedAICollaboration(AICollaborationCore):
                 elif not error_response["retry"]:
                     return {"status": "error", "error": str(e)}
                 
+                if retry_count < self.max_retries and not self._wait_before_retry(retry_count, e):
+                    return {"status": "error", "error": str(e)}
                 print(f"🔄 Retrying design phase... ({retry_count}/{self.max_retries})")
         
         return {"status": "error", "error": f"Max retries ({self.max_retries}) exceeded"}
 
-    def _run_implementation_phase_with_interaction(self, design_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _run_implementation_phase_with_interaction(self, design_data: Dict[str, Any], project_request: str = "") -> Dict[str, Any]:
         """対話付き実装フェーズ"""
         
         print(f"\n⚡ Phase 2: AI Implementation")
+        self._report_progress("implementation", "ChatGPT and Claude starting implementation...")
         
+        # 会話は一度だけ行い、再試行では再利用する（ターンごとにプロバイダーを呼び出すため）
+        conversation = None
         retry_count = 0
         while retry_count < self.max_retries:
             try:
@@ -166,6 +198,14 @@ class EnhancedAICollaboration(AICollaborationCore):
                 if not impl_result or impl_result.get("error"):
                     raise Exception(f"Implementation failed: {impl_result.get('error', 'Unknown error')}")
                 
+                # AI同士の実装会話（応答は生成されたそばから通知）
+                if conversation is None:
+                    conversation = self._run_phase_conversation(
+                        project_request or (design_data or {}).get("project_name", ""),
+                        "implementation", self._phase_turns("implementation_turns", 3)
+                    )
+                impl_result["conversation_log"] = conversation["conversation_log"]
+                
                 # Ask user to review implementation
                 if self._review_implementation_with_user(impl_result):
                     return {"status": "success", "data": impl_result}
@@ -180,7 +220,7 @@ class EnhancedAICollaboration(AICollaborationCore):
                 # Suggest solutions based on error type
                 solutions = self._generate_implementation_solutions(e)
                 
-                error_response = handle_error_with_user(
+                error_response = self.user_interaction.handle_error(
                     e,
                     context={
                         "phase": "implementation",
@@ -200,6 +240,8 @@ class EnhancedAICollaboration(AICollaborationCore):
                     print(f"🔧 Applying solution: {solution}")
                     # Apply solution logic here
                 
+                if retry_count < self.max_retries and not self._wait_before_retry(retry_count, e):
+                    return {"status": "error", "error": str(e)}
                 print(f"🔄 Retrying implementation... ({retry_count}/{self.max_retries})")
         
         return {"status": "error", "error": f"Max retries ({self.max_retries}) exceeded"}
@@ -208,6 +250,7 @@ class EnhancedAICollaboration(AICollaborationCore):
         """対話付きファイル生成フェーズ"""
         
         print(f"\n📁 Phase 3: File Generation")
+        self._report_progress("file_generation", "Generating project files...")
         
         try:
             # Show what files will be generated
@@ -218,9 +261,10 @@ class EnhancedAICollaboration(AICollaborationCore):
                 for file_info in files_to_generate:
                     print(f"  - {file_info['name']}: {file_info.get('description', 'No description')}")
                 
-                if not confirm_action(
+                if not self.user_interaction.request_confirmation(
                     f"Generate {len(files_to_generate)} files",
-                    {"output_directory": self.config.get("system.output_directory", "./generated_projects")}
+                    {"output_directory": self.config.get("system.output_directory", "./generated_projects")},
+                    default=True
                 ):
                     return {"status": "cancelled", "reason": "File generation cancelled by user"}
             
@@ -236,7 +280,63 @@ class EnhancedAICollaboration(AICollaborationCore):
             return {"status": "success", "data": files_result}
             
         except Exception as e:
-            return handle_error_with_user(e, context={"phase": "file_generation"})
+            return self.user_interaction.handle_error(e, context={"phase": "file_generation"})
+
+    def _phase_turns(self, key: str, default: int) -> int:
+        """フェーズの会話のターン数（system.<key>、1〜MAX_PHASE_TURNS に制限）"""
+        try:
+            turns = int(self.config.get(f"system.{key}", default))
+        except (TypeError, ValueError):
+            turns = default
+        return max(1, min(turns, self.MAX_PHASE_TURNS))
+
+    def _run_phase_conversation(self, project_request: str, phase: str, max_turns: int) -> Dict[str, Any]:
+        """フェーズのAI同士の会話を実行（断片は delta_callback、完成した応答は response_callback に通知）"""
+        return self.conversation_engine.start_conversation(
+            project_request,
+            max_turns=max_turns,
+            on_delta=lambda speaker, turn, delta: self._notify(self.delta_callback, speaker, turn, delta),
+            on_message=lambda speaker, turn, content, metadata: self._notify(
+                self.response_callback, speaker, turn, content, metadata
+            ),
+            models=self.models,
+            bypass_cache=self.bypass_cache,
+            phase=phase
+        )
+
+    def _report_progress(self, phase: str, message: str):
+        """進捗を通知（通知の失敗でワークフローは止めない）"""
+        if not self.progress_callback:
+            return
+        
+        try:
+            self.progress_callback(phase, message)
+        except Exception as e:
+            print(f"Error reporting progress: {e}")
+
+    def _wait_before_retry(self, retry_count: int, error: Exception = None) -> bool:
+        """フェーズを再試行する前に待つ（失敗が続くほど長く、ジッターで再試行の時期をずらす）
+
+        失敗がプロバイダーの 429 / 503 で Retry-After が指定されていれば、その秒数以上待つ。
+        Retry-After が system.retry_max_delay を超える場合は待たずに False を返す（再試行しない）。
+        """
+        delay = self.phase_retry.delay(retry_count - 1, getattr(error, "retry_after", None))
+        if delay is None:
+            print(f"⚠️ Provider asked to wait {error.retry_after:.0f}s; not retrying")
+            return False
+        print(f"⏳ Waiting {delay:.1f}s before retrying...")
+        time.sleep(delay)
+        return True
+
+    def _notify(self, callback, *args):
+        """AI応答のストリームを通知（通知の失敗で生成は止めない）"""
+        if not callback:
+            return
+        
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Error streaming AI response: {e}")
 
     def _review_design_with_user(self, design_result: Dict[str, Any]) -> bool:
         """ユーザーによる設計レビュー"""
@@ -255,7 +355,7 @@ class EnhancedAICollaboration(AICollaborationCore):
             for feature in design_result["main_features"]:
                 print(f"  - {feature}")
         
-        return ask_user(
+        return self.user_interaction.ask_user_decision(
             "Do you approve this design?",
             ["yes", "no", "modify"],
             default="yes"
@@ -275,7 +375,7 @@ class EnhancedAICollaboration(AICollaborationCore):
             for component in impl_result["generated_components"]:
                 print(f"  - {component}")
         
-        return ask_user(
+        return self.user_interaction.ask_user_decision(
             "Do you approve this implementation?",
             ["yes", "no", "modify"],
             default="yes"
@@ -396,9 +496,10 @@ class EnhancedAICollaboration(AICollaborationCore):
         if results.get("error_count", 0) > 0:
             print(f"Errors encountered: {results['error_count']}")
         
-        return confirm_action(
+        return self.user_interaction.request_confirmation(
             "Mark this collaboration as completed",
-            {"phases": completed_phases, "errors": results.get("error_count", 0)}
+            {"phases": completed_phases, "errors": results.get("error_count", 0)},
+            default=True
         )
 
     def _handle_phase_error(self, phase: str, results: Dict[str, Any]) -> Dict[str, Any]:
@@ -417,7 +518,7 @@ class EnhancedAICollaboration(AICollaborationCore):
         print(f"Error: {error}")
         print(f"Traceback: {traceback.format_exc()}")
         
-        error_response = handle_error_with_user(
+        error_response = self.user_interaction.handle_error(
             error,
             context={"type": "system_error", "results_so_far": len(results.get("phases", {}))}
         )
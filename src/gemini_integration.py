@@ -5,87 +5,19 @@ Gemini AI Integration for AI Collaboration System
 
 import os
 import time
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator
 from datetime import datetime
 
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    genai = None
+from ai_providers import AIOHTTP_AVAILABLE, get_provider_registry, stream_with_fallback
+from context_packer import JAPANESE_LABELS, get_context_packer, estimate_tokens
+from conversation_summary import RollingSummary
+from model_router import get_model_router
+
 
 class GeminiPersona:
     """Gemini AIのペルソナ"""
     
-    def __init__(self, model_name: str = "gemini-1.5-pro"):
-        self.model_name = model_name
-        self.client = None
-        self.conversation_history = []
-        
-        if GEMINI_AVAILABLE:
-            self._initialize_client()
-        
-    def _initialize_client(self):
-        """Gemini クライアントを初期化"""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            print("Warning: GEMINI_API_KEY not found in environment variables")
-            return
-        
-        try:
-            genai.configure(api_key=api_key)
-            
-            # 安全設定を設定
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
-            
-            # 生成設定
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 2048,
-            }
-            
-            self.client = genai.GenerativeModel(
-                model_name=self.model_name,
-                safety_settings=safety_settings,
-                generation_config=generation_config
-            )
-            
-            print(f"Gemini client initialized with model: {self.model_name}")
-            
-        except Exception as e:
-            print(f"Failed to initialize Gemini client: {e}")
-            self.client = None
-
-    def generate_response(self, project_request: str, conversation_log: list, turn: int) -> str:
-        """Gemini風の応答を生成"""
-        
-        # Gemini が利用できない場合はシミュレーション応答
-        if not GEMINI_AVAILABLE or not self.client:
-            return self._get_simulation_response(project_request, turn)
-        
-        try:
-            # プロンプトを作成
-            system_prompt = """あなたはAI協調開発システムのGemini担当です。ChatGPTとClaudeと連携して、ユーザーのプロジェクトを実装します。
+    system_prompt = """あなたはAI協調開発システムのGemini担当です。ChatGPTとClaudeと連携して、ユーザーのプロジェクトを実装します。
 
 役割:
 - 高速で効率的な実装支援
@@ -98,37 +30,64 @@ class GeminiPersona:
 - 明確で読みやすいコード
 - 効率的なアプローチ
 - 他のAIとの協調"""
+    
+    def __init__(self, model_name: str = "gemini-1.5-pro", providers=None):
+        self.model_name = model_name
+        self.providers = providers or get_provider_registry()
+        self.conversation_history = []
+        
+        # 生成設定
+        self.generation_config = {
+            "temperature": 0.7,
+            "top_p": 0.8,
+            "top_k": 40,
+            "max_tokens": 2048,
+        }
+        # 直近の文脈に使った・切り捨てたトークン数と、モデルの振り分け結果
+        self.last_context = None
+        self.last_route = None
+        
+        if not self.providers.is_available("gemini"):
+            print("Warning: Gemini API is not available (GEMINI_API_KEY or aiohttp missing), using simulation responses")
 
-            # 会話履歴から文脈を構築
-            context = self._build_context(conversation_log, project_request)
-            
-            # 完全なプロンプトを作成
-            full_prompt = f"{system_prompt}\n\n{context}\n\nターン {turn}: {project_request} について、実装とコード生成の観点から回答してください。"
-            
-            # Gemini API呼び出し
-            response = self.client.generate_content(full_prompt)
-            
-            if response.text:
-                return response.text
-            else:
-                return self._get_simulation_response(project_request, turn)
-                
-        except Exception as e:
-            print(f"Gemini API error: {e}")
-            return self._get_simulation_response(project_request, turn)
+    def generate_response(self, project_request: str, conversation_log: list, turn: int,
+                          bypass_cache: bool = False, summary: RollingSummary = None,
+                          phase: str = "conversation") -> str:
+        """Gemini風の応答を生成"""
+        return "".join(self.stream_response(project_request, conversation_log, turn, bypass_cache, summary, phase))
 
-    def _build_context(self, conversation_log: list, project_request: str) -> str:
-        """会話履歴から文脈を構築"""
-        context_parts = [f"プロジェクトリクエスト: {project_request}"]
-        
-        if conversation_log:
-            context_parts.append("\n会話履歴:")
-            for msg in conversation_log[-5:]:  # 最新5件のみ
-                speaker = msg.get("speaker", "unknown")
-                content = msg.get("content", "")[:200]  # 200文字に制限
-                context_parts.append(f"{speaker}: {content}")
+    def stream_response(self, project_request: str, conversation_log: list, turn: int,
+                        bypass_cache: bool = False, summary: RollingSummary = None,
+                        phase: str = "conversation") -> Iterator[str]:
+        """Gemini風の応答をストリーミング生成（テキスト断片を生成順に返す）"""
+        prompt = self._build_prompt(project_request, conversation_log, turn, summary)
+        # フェーズ・プロンプトの大きさ・応答時間から Pro / Flash を選ぶ
+        self.last_route = get_model_router().route(
+            "gemini", self.model_name, estimate_tokens(self.system_prompt + prompt), phase
+        )
+        # API が利用できない・失敗した場合はシミュレーション応答
+        yield from stream_with_fallback(
+            self.providers, "gemini", self.last_route["model"], prompt,
+            lambda: self._get_simulation_response(project_request, turn),
+            system=self.system_prompt, bypass_cache=bypass_cache, **self.generation_config
+        )
+
+    def _build_prompt(self, project_request: str, conversation_log: list, turn: int,
+                      summary: RollingSummary = None) -> str:
+        """プロンプトを作成（役割の指示は system_prompt として別に送る）"""
+        instruction = f"ターン {turn}: {project_request} について、実装とコード生成の観点から回答してください。"
+        context = self._build_context(conversation_log, project_request, self.system_prompt + instruction, summary)
         
-        return "\n".join(context_parts)
+        return f"{context}\n\n{instruction}"
+
+    def _build_context(self, conversation_log: list, project_request: str, reserved_text: str = "",
+                       summary: RollingSummary = None) -> str:
+        """会話履歴（と要約）からモデルの入力トークン予算に収まる文脈を構築"""
+        context, self.last_context = get_context_packer().pack(
+            conversation_log, project_request, self.model_name,
+            self.generation_config["max_tokens"], reserved_text, JAPANESE_LABELS, summary
+        )
+        return context
 
     def _get_simulation_response(self, project_request: str, turn: int) -> str:
         """シミュレーション応答（Gemini APIが利用できない場合）"""
@@ -150,7 +109,7 @@ class GeminiPersona:
             f"包括的なテストを実装します！\n\n```python\n# tests/test_main.py\nimport pytest\nfrom fastapi.testclient import TestClient\nfrom main import app\n\nclient = TestClient(app)\n\ndef test_read_root():\n    response = client.get(\"/\")\n    assert response.status_code == 200\n    assert \"message\" in response.json()\n\ndef test_health_check():\n    response = client.get(\"/health\")\n    assert response.status_code == 200\n    assert response.json()[\"status\"] == \"healthy\"\n\n@pytest.fixture\ndef sample_project():\n    return {{\n        \"name\": \"Test Project\",\n        \"version\": \"1.0.0\",\n        \"features\": [\"api\", \"database\", \"tests\"]\n    }}\n\ndef test_project_creation(sample_project):\n    response = client.post(\"/projects\", json=sample_project)\n    assert response.status_code == 201\n```\n\n✅ 作成: tests/ - 完全なテストスイート",
             
             # パフォーマンス最適化
-            f"パフォーマンス最適化を実装！\n\n```python\n# performance.py - 最適化ツール\nimport asyncio\nimport aiohttp\nfrom functools import lru_cache\nfrom typing import List, Dict\n\nclass OptimizedProcessor:\n    def __init__(self):\n        self.session = None\n    \n    async def __aenter__(self):\n        self.session = aiohttp.ClientSession()\n        return self\n    \n    async def __aexit__(self, exc_type, exc_val, exc_tb):\n        if self.session:\n            await self.session.close()\n    \n    @lru_cache(maxsize=100)\n    def cached_computation(self, input_data: str) -> str:\n        # 計算結果をキャッシュ\n        return f\"processed_{input_data}\"\n    \n    async def batch_process(self, items: List[Dict]):\n        tasks = []\n        async with self.session as session:\n            for item in items:\n                task = asyncio.create_task(\n                    self.process_item(session, item)\n                )\n                tasks.append(task)\n            \n            results = await asyncio.gather(*tasks)\n            return results\n```\n\n✅ 作成: performance.py - 高速処理システム",
+            f"パフォーマンス最適化を実装！\n\n```python\n# performance.py - 最適化ツール\nimport asyncio\nimport aiohttp\nfrom functools import lru_cache\nfrom typing import List, Dict\n\nclass OptimizedProcessor:\n    def __init__(self):\n        self.session = None\n    \n    async def __aenter__(self):\n        self.session = aiohttp.ClientSession()\n        return self\n    \n    async def __aexit__(self, exc_type, exc_val, exc_tb):\n        if self.session:\n            await self.session.close()\n    \n    @lru_cache(maxsize=100)\n    def cached_computation(self, input_data: str) -> str:\n        # 計算結果をキャッシュ\n        return f\"processed_{{input_data}}\"\n    \n    async def batch_process(self, items: List[Dict]):\n        tasks = []\n        async with self.session as session:\n            for item in items:\n                task = asyncio.create_task(\n                    self.process_item(session, item)\n                )\n                tasks.append(task)\n            \n            results = await asyncio.gather(*tasks)\n            return results\n```\n\n✅ 作成: performance.py - 高速処理システム",
             
             # 完成報告
             f"Gemini実装完了！効率的なシステムが構築されました。\n\n📊 **実装サマリー:**\n- ✅ 高速APIサーバー (FastAPI)\n- ✅ データベース設計 (SQLAlchemy)\n- ✅ プロジェクト管理ツール\n- ✅ Docker開発環境\n- ✅ 非同期タスク処理 (Celery)\n- ✅ 包括的テストスイート\n- ✅ パフォーマンス最適化\n\n🚀 **特徴:**\n- 高速・効率的な実装\n- スケーラブルなアーキテクチャ\n- 開発者フレンドリーな構造\n- 本番環境対応\n\n💡 **次のステップ:**\n1. 環境変数設定\n2. データベースマイグレーション実行\n3. テスト実行で品質確認\n4. Docker環境でデプロイ\n\nGeminiが提供する高速で多機能な実装により、堅牢なシステムが完成しました！"
@@ -165,7 +124,7 @@ class GeminiIntegration:
     
     def __init__(self):
         self.personas = {}
-        self.available = GEMINI_AVAILABLE
+        self.available = AIOHTTP_AVAILABLE
         
     def get_persona(self, model_name: str = "gemini-1.5-pro") -> GeminiPersona:
         """指定されたモデルのペルソナを取得"""
@@ -175,7 +134,7 @@ class GeminiIntegration:
     
     def is_available(self) -> bool:
         """Gemini APIが利用可能か確認"""
-        return self.available and bool(os.getenv("GEMINI_API_KEY"))
+        return get_provider_registry().is_available("gemini")
     
     def get_supported_models(self) -> List[str]:
         """サポートされているモデル一覧"""
@@ -184,6 +143,10 @@ class GeminiIntegration:
             "gemini-1.5-flash", 
             "gemini-pro"
         ]
+    
+    def get_model_tiers(self) -> List[str]:
+        """呼び出しごとの振り分けに使うモデルの階層（速い順）"""
+        return get_model_router().tiers.get("gemini", [])
 
 # シングルトンインスタンス
 gemini_integration = GeminiIntegration()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Latency Tracker - プロバイダー・モデルごとの直近の応答時間
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+class LatencyTracker:
+    """(プロバイダー, モデル) ごとに直近 window 件の応答時間を保持し、パーセンタイルを返す
+
+    max_age 秒より古い記録は使わない。遅いと判断されて呼ばれなくなったモデルも、
+    古い記録が消えれば再び呼ばれて新しい応答時間が記録される。
+    """
+
+    def __init__(self, window: int = 200, max_age: float = None):
+        self.window = window
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, provider: str, model: str, latency: float):
+        """1回の呼び出しにかかった秒数を記録"""
+        with self._lock:
+            samples = self._samples.get((provider, model))
+            if samples is None:
+                samples = self._samples[(provider, model)] = deque(maxlen=self.window)
+            samples.append((time.monotonic(), latency))
+
+    def _recent(self, provider: str, model: str) -> list:
+        """max_age 以内の応答時間（古い記録は取り除く。_lock を保持して呼ぶ）"""
+        samples = self._samples.get((provider, model))
+        if not samples:
+            return []
+        if self.max_age is not None:
+            expires = time.monotonic() - self.max_age
+            while samples and samples[0][0] < expires:
+                samples.popleft()
+        return [latency for _, latency in samples]
+
+    def count(self, provider: str, model: str) -> int:
+        with self._lock:
+            return len(self._recent(provider, model))
+
+    def percentile(self, provider: str, model: str, percent: float, min_samples: int = 1) -> Optional[float]:
+        """応答時間のパーセンタイル（記録が min_samples 件未満なら None）"""
+        with self._lock:
+            samples = sorted(self._recent(provider, model))
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(int(len(samples) * percent / 100), len(samples) - 1)
+        return samples[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """モデルごとの件数と p50 / p95"""
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            f"{provider}/{model}": {
+                "samples": self.count(provider, model),
+                "p50": self.percentile(provider, model, 50),
+                "p95": self.percentile(provider, model, 95)
+            }
+            for provider, model in keys
+        }
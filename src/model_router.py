@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Model Router - プロンプトの大きさ・フェーズ・応答時間からモデルの階層を選ぶ
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from utils.config_manager import ConfigManager
+from ai_providers import get_provider_registry
+from latency_tracker import LatencyTracker
+
+
+class ModelRouter:
+    """呼び出しごとにプロバイダー内のモデルの階層（速いモデル〜高性能なモデル）を選ぶ
+
+    tiers はプロバイダーごとに速い順のモデル一覧。要求されたモデルが一覧に無い場合は
+    そのまま使う。fast_phases のフェーズ（ワークフローが渡す "design" /
+    "implementation" / "conversation" のいずれか。既定は無し）と、large_prompt_tokens を
+    超える大きなプロンプトは最速の階層から、それ以外は最も高性能な階層から始め、
+    直近の応答時間のパーセンタイルが SLO（slo_seconds）を超えている階層は1段ずつ
+    速い階層へ落とす。選んだ結果と理由は呼び出し元が会話のメタデータに記録する。
+    """
+
+    def __init__(self, latency: LatencyTracker, tiers: Dict[str, List[str]] = None,
+                 slo_seconds: float = 30.0, percentile: float = 95.0, min_samples: int = 5,
+                 large_prompt_tokens: int = 12000, fast_phases: List[str] = None, enabled: bool = True):
+        self.latency = latency
+        self.tiers = tiers or {}
+        self.slo_seconds = slo_seconds
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.large_prompt_tokens = large_prompt_tokens
+        self.fast_phases = set(fast_phases or [])
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reasons = Counter()
+
+    def route(self, provider: str, requested_model: str, prompt_tokens: int,
+              phase: str = "conversation") -> Dict[str, Any]:
+        """使うモデルを選び、判断の記録（model に選んだモデル）を返す"""
+        tiers = self.tiers.get(provider, [])
+        decision = {
+            "provider": provider,
+            "requested": requested_model,
+            "model": requested_model,
+            "phase": phase,
+            "prompt_tokens": prompt_tokens,
+            "reason": "fixed",
+            "latency_p": None,
+            "slo_seconds": self.slo_seconds,
+            "timestamp": datetime.now().isoformat()
+        }
+        if not self.enabled or requested_model not in tiers:
+            return self._record(decision)
+
+        if phase in self.fast_phases:
+            index, reason = 0, "phase"
+        elif prompt_tokens > self.large_prompt_tokens:
+            index, reason = 0, "prompt_size"
+        else:
+            index, reason = len(tiers) - 1, "default"
+
+        # 応答時間が SLO を超えている階層は速い階層へ落とす
+        observed = self.latency.percentile(provider, tiers[index], self.percentile, self.min_samples)
+        while index > 0 and observed is not None and observed > self.slo_seconds:
+            index -= 1
+            reason = "latency_slo"
+            observed = self.latency.percentile(provider, tiers[index], self.percentile, self.min_samples)
+
+        decision.update({"model": tiers[index], "reason": reason, "latency_p": observed})
+        return self._record(decision)
+
+    def _record(self, decision: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.reasons[decision["reason"]] += 1
+        return decision
+
+    def get_stats(self) -> Dict[str, Any]:
+        """理由ごとの振り分け件数"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slo_seconds": self.slo_seconds,
+                "percentile": self.percentile,
+                "decisions": dict(self.reasons)
+            }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """共有の ModelRouter を取得（設定は ai.routing、応答時間はプロバイダーレジストリの記録を使う）"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            routing_config = ConfigManager().get("ai.routing", {})
+            _router = ModelRouter(
+                get_provider_registry().latency,
+                routing_config.get("tiers", {}),
+                routing_config.get("slo_seconds", 30.0),
+                routing_config.get("percentile", 95.0),
+                routing_config.get("min_samples", 5),
+                routing_config.get("large_prompt_tokens", 12000),
+                routing_config.get("fast_phases", []),
+                routing_config.get("enabled", True)
+            )
+        return _router
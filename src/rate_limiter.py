@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter - プロバイダーの RPM / TPM 上限に合わせて呼び出しを待たせるトークンバケット
+"""
+
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+
+class TokenBucket:
+    """1分あたり per_minute 単位ずつ補充され、最大 per_minute 単位まで貯まるバケット
+
+    残量が足りない呼び出しは失敗させずに補充されるまで待たせる。待っている呼び出しは
+    asyncio.Lock の順番どおり（先着順）に進む。使用量の補正で残量は負になりうる。
+    acquire / adjust ともにプロバイダーの専用イベントループ上で呼び出す。
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = None
+        self._refunded = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    async def acquire(self, amount: float):
+        """amount 単位を使う（上限を超える量は満タンになるまで待ってから使う）"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._refunded = asyncio.Event()
+        async with self._lock:
+            needed = min(amount, self.per_minute)
+            self._refill()
+            while self.tokens < needed:
+                # 補充を待つ間に見積もりが戻されたらすぐに確認し直す
+                self._refunded.clear()
+                try:
+                    await asyncio.wait_for(self._refunded.wait(),
+                                           (needed - self.tokens) * 60.0 / self.per_minute)
+                except asyncio.TimeoutError:
+                    pass
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float):
+        """見積もりとの差を反映（正なら追加で使い、負なら戻す）"""
+        self._refill()
+        self.tokens = min(self.per_minute, self.tokens - amount)
+        if amount < 0 and self._refunded is not None:
+            self._refunded.set()
+
+
+class RateLimiter:
+    """1つの (プロバイダー, APIキー, モデル) のリクエスト数（RPM）とトークン数（TPM）の上限"""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.waiting = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.used_tokens = 0
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """上限に空きができるまで待ち、待った秒数を返す
+
+        待っている間にキャンセルされた呼び出し（予備の呼び出しに負けた場合など）は送信されないので、
+        先に確保したリクエスト数・トークン数を戻す。
+        """
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        taken = []
+        try:
+            if self.requests is not None:
+                await self.requests.acquire(1)
+                taken.append((self.requests, 1))
+            if self.tokens is not None:
+                await self.tokens.acquire(estimated_tokens)
+                taken.append((self.tokens, estimated_tokens))
+        except BaseException:
+            for bucket, amount in taken:
+                bucket.adjust(-amount)
+            with self._lock:
+                self.waiting -= 1
+            raise
+
+        wait = time.monotonic() - started
+        with self._lock:
+            self.waiting -= 1
+            self.calls += 1
+            self.used_tokens += estimated_tokens
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait >= 0.001:
+                self.waited += 1
+        return wait
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """呼び出し後に実際の使用トークン数で補正（失敗した呼び出しは actual_tokens=0 で戻す）"""
+        with self._lock:
+            self.used_tokens += actual_tokens - estimated_tokens
+        if self.tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rpm": self.requests.per_minute if self.requests else None,
+                "tpm": self.tokens.per_minute if self.tokens else None,
+                "calls": self.calls,
+                "queued": self.waiting,
+                "waited": self.waited,
+                "average_wait": self.total_wait / self.calls if self.calls else 0.0,
+                "max_wait": self.max_wait,
+                "used_tokens": self.used_tokens
+            }
+
+
+class RateLimiterRegistry:
+    """(プロバイダー, APIキー, モデル) ごとの RateLimiter（上限は ai.<provider>.rpm / tpm）
+
+    モデルごとの上限は ai.<provider>.model_limits.<model>.rpm / tpm で上書きできる。
+    上限が設定されていない組み合わせは待たせない（None を返す）。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    @staticmethod
+    def key_id(api_key: Optional[str]) -> str:
+        """統計に生のAPIキーを出さないための識別子"""
+        if not api_key:
+            return "default"
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+
+    def limiter(self, provider: str, api_key: Optional[str], model: str) -> Optional[RateLimiter]:
+        key = (provider, self.key_id(api_key), model)
+        with self._lock:
+            if key not in self._limiters:
+                provider_config = self.config.get(f"ai.{provider}", {})
+                limits = provider_config.get("model_limits", {}).get(model, {})
+                rpm = limits.get("rpm", provider_config.get("rpm"))
+                tpm = limits.get("tpm", provider_config.get("tpm"))
+                self._limiters[key] = RateLimiter(rpm, tpm) if rpm or tpm else None
+            return self._limiters[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キーごとの待ち件数・待ち時間と全体の合計"""
+        with self._lock:
+            limiters = {f"{provider}/{key_id}/{model}": limiter
+                        for (provider, key_id, model), limiter in self._limiters.items() if limiter}
+        stats = {name: limiter.get_stats() for name, limiter in limiters.items()}
+        calls = sum(item["calls"] for item in stats.values())
+        return {
+            "queued": sum(item["queued"] for item in stats.values()),
+            "calls": calls,
+            "average_wait": sum(item["average_wait"] * item["calls"] for item in stats.values()) / calls if calls else 0.0,
+            "max_wait": max((item["max_wait"] for item in stats.values()), default=0.0),
+            "limits": stats
+        }
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Request Hedging - 遅い呼び出しに予備の呼び出しを重ねて応答時間の裾を抑える
+"""
+
+import asyncio
+import threading
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from latency_tracker import LatencyTracker
+
+
+class HedgePolicy:
+    """呼び出しが直近の p95 を過ぎても終わらなければ、別のモデル・プロバイダーへ同じ呼び出しを重ねる
+
+    先に成功した方を使い、もう一方はキャンセルする。重ねる呼び出しは呼び出し1件ごとに
+    max_hedge_rate ずつ貯まる予算（最大 burst 件）を1件ずつ使うので、呼び出し全体に対する
+    割合は max_hedge_rate を超えない。待ち時間は通常の呼び出しでは応答全体、ストリーミングでは
+    最初の断片までの応答時間のパーセンタイルで、記録が min_samples 件未満の間は重ねない。
+    """
+
+    def __init__(self, latency: LatencyTracker, first_token_latency: LatencyTracker,
+                 alternates: Dict[str, Dict[str, str]] = None, percentile: float = 95.0,
+                 min_samples: int = 20, max_hedge_rate: float = 0.1, burst: float = 5.0,
+                 enabled: bool = False):
+        self.latency = latency
+        self.first_token_latency = first_token_latency
+        self.alternates = alternates or {}
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedge_rate = max_hedge_rate
+        self.burst = burst
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._budget = burst
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def alternate(self, provider: str, model: str) -> Optional[Tuple[str, str]]:
+        """重ねる先の (プロバイダー, モデル)（設定が無い・同じモデルの場合は None）"""
+        if not self.enabled:
+            return None
+        alternate = self.alternates.get(provider)
+        if not alternate:
+            return None
+        target = (alternate.get("provider", provider), alternate.get("model", model))
+        return None if target == (provider, model) else target
+
+    def delay(self, provider: str, model: str, streaming: bool = False) -> Optional[float]:
+        """予備の呼び出しを重ねるまでの秒数（記録が足りない場合は None）"""
+        tracker = self.first_token_latency if streaming else self.latency
+        return tracker.percentile(provider, model, self.percentile, self.min_samples)
+
+    async def race(self, primary: Callable[[], Awaitable[Any]], secondary: Callable[[], Awaitable[Any]],
+                   delay: float, discard: Callable[[Any], None] = None) -> Tuple[Any, bool]:
+        """primary() が delay 秒で終わらなければ secondary() も始め、先に成功した結果と予備が勝ったかを返す
+
+        両方失敗した場合は primary の例外を送出する。同時に成功した場合、使わない方の結果は
+        discard(result) に渡す。
+        """
+        with self._lock:
+            self.calls += 1
+            self._budget = min(self.burst, self._budget + self.max_hedge_rate)
+
+        tasks = [asyncio.ensure_future(primary())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._take_budget():
+                tasks.append(asyncio.ensure_future(secondary()))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in tasks if task in done and task.exception() is None]
+                if not succeeded:
+                    continue
+                winner = succeeded[0]
+                for task in succeeded[1:]:
+                    if discard:
+                        discard(task.result())
+                won_by_hedge = winner is not tasks[0]
+                if won_by_hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return winner.result(), won_by_hedge
+
+            raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self._budget < 1:
+                self.budget_denied += 1
+                return False
+            self._budget -= 1
+            self.hedged += 1
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """重ねた件数・予備が勝った件数・予算不足で重ねなかった件数"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "hedge_win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+                "budget_denied": self.budget_denied,
+                "max_hedge_rate": self.max_hedge_rate
+            }
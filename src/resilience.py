@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Resilience - プロバイダーごとのサーキットブレーカーと、ジッター付き指数バックオフの再試行
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """直近の呼び出しの失敗率・遅延率がしきい値を超えたら一定時間呼び出しを止める
+
+    直近 window 件（min_calls 件以上）のうち失敗が failure_rate 以上、または slow_call_seconds を
+    超えた呼び出しが slow_call_rate 以上になると open になり、open_seconds の間は allow() が
+    False を返す（呼び出し側はすぐに失敗させる）。その後は half_open として試しの呼び出しを
+    1件だけ通し、成功すれば closed に戻り、失敗すれば再び open になる。
+    """
+
+    def __init__(self, name: str, failure_rate: float = 0.5, slow_call_seconds: float = 30.0,
+                 slow_call_rate: float = 0.5, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._trial_started = None
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """呼び出してよいか（open の間は False、half_open では試しの1件だけ True）"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._trial_started = None
+            if self.state == HALF_OPEN:
+                # 試しの呼び出しが結果を返さないまま open_seconds を過ぎたら次の呼び出しを試す
+                if self._trial_started is None or now - self._trial_started >= self.open_seconds:
+                    self._trial_started = now
+                    return True
+            elif self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success: bool, latency: float = 0.0):
+        """呼び出しの結果を記録"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if success and latency <= self.slow_call_seconds:
+                    self.state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open()
+                return
+
+            self._calls.append((not success, latency > self.slow_call_seconds))
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for failed, _ in self._calls if failed) / len(self._calls)
+                slow = sum(1 for _, slow in self._calls if slow) / len(self._calls)
+                if failures >= self.failure_rate or slow >= self.slow_call_rate:
+                    self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._trial_started = None
+        self._calls.clear()
+        self.opened += 1
+
+    def retry_after(self) -> float:
+        """open の場合、次に試せるまでの秒数"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def get_state(self) -> Dict[str, Any]:
+        retry_after = self.retry_after()
+        with self._lock:
+            calls = len(self._calls)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "failure_rate": sum(1 for failed, _ in self._calls if failed) / calls if calls else 0.0,
+                "slow_call_rate": sum(1 for _, slow in self._calls if slow) / calls if calls else 0.0,
+                "retry_after": retry_after,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
+
+
+class RetryPolicy:
+    """ジッター付き指数バックオフと再試行の予算
+
+    再試行の待ち時間は 0〜min(max_delay, base_delay * 2^attempt) の一様乱数（full jitter）で、
+    応答が Retry-After（429 / 503）を指定していればその秒数より短くはしない。ただし
+    Retry-After が max_retry_after（既定は max_delay）を超える場合は待たずに再試行をやめ、
+    呼び出し元（別のキー・次の呼び出し）に任せる。
+    最初の呼び出し1件ごとに budget_ratio 件分の再試行の予算が貯まり（最大 budget_burst 件）、
+    再試行ごとに1件使うので、障害時でも再試行は呼び出し全体の budget_ratio 程度に収まる。
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 budget_ratio: float = 0.2, budget_burst: float = 10.0, max_retry_after: float = None):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_delay if max_retry_after is None else max_retry_after
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self._lock = threading.Lock()
+        self._budget = budget_burst
+        self.calls = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.retry_after_exceeded = 0
+
+    def backoff(self, attempt: int) -> float:
+        """attempt 回目（0始まり）の失敗後に待つ秒数"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def delay(self, attempt: int, retry_after: float = None) -> Optional[float]:
+        """attempt 回目の失敗後に待つ秒数（max(バックオフ, Retry-After)）
+
+        Retry-After が max_retry_after を超える場合は None（待たずに失敗させる）。
+        """
+        if retry_after is not None and retry_after > self.max_retry_after:
+            with self._lock:
+                self.retry_after_exceeded += 1
+            return None
+        return max(self.backoff(attempt), retry_after or 0.0)
+
+    def note_call(self):
+        """最初の呼び出しを記録して再試行の予算を貯める"""
+        with self._lock:
+            self.calls += 1
+            self._budget = min(self.budget_burst, self._budget + self.budget_ratio)
+
+    def can_retry(self, attempt: int) -> bool:
+        """attempt 回目の失敗の後に再試行してよいか（回数と予算を確認し、予算を1件使う）"""
+        if attempt + 1 >= self.max_attempts:
+            return False
+        with self._lock:
+            if self._budget < 1:
+                self.budget_exhausted += 1
+                return False
+            self._budget -= 1
+            self.retries += 1
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "budget_exhausted": self.budget_exhausted,
+                "retry_after_exceeded": self.retry_after_exceeded,
+                "max_attempts": self.max_attempts
+            }
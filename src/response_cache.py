@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Response Cache - ペルソナ応答のキャッシュ（メモリLRU + ディスク）
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from conversation_store import ConversationCache
+
+
+class ResponseCache:
+    """(プロバイダー, モデル, 生成設定, プロンプト) のハッシュをキーに応答を保存する
+
+    メモリ上は件数とバイト数で上限を持つLRU、ディスク上は cache_dir/<先頭2文字>/<key>.json
+    に1応答1ファイルで保存し、合計が max_disk_bytes を超えたら古いものから削除する。
+    ttl 秒を過ぎた応答は期限切れとして扱い、読み出し時に削除する。
+    """
+
+    def __init__(self, cache_dir: Path, ttl: float = 86400.0, max_entries: int = 1024,
+                 max_bytes: int = 16 * 1024 * 1024, max_disk_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        # メモリ上は [本文, 保存時刻] を保持
+        self.memory = ConversationCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._lock = threading.Lock()
+        self._disk_index = {}
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.bypassed = 0
+        self.disk_evictions = 0
+        self._scan_disk()
+
+    @staticmethod
+    def make_key(provider: str, model: str, config: Dict[str, Any], system: Optional[str], prompt: str) -> str:
+        """キャッシュキー（生成設定はキー順に正規化）"""
+        material = json.dumps(
+            [provider, model, config, system or "", prompt], ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _scan_disk(self):
+        """ディスク上の応答のサイズと更新時刻を読み込む"""
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            self._disk_index[path.stem] = (stat.st_mtime, stat.st_size)
+            self._disk_bytes += stat.st_size
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュされた応答を取得（無い・期限切れは None）"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            if time.time() - entry[1] <= self.ttl:
+                with self._lock:
+                    self.memory_hits += 1
+                return entry[0]
+            self._remove(key)
+            return None
+
+        with self._lock:
+            on_disk = key in self._disk_index
+        if on_disk:
+            try:
+                with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Error reading cached response {key}: {e}")
+                self._remove(key)
+                return None
+            else:
+                if time.time() - record["created_at"] <= self.ttl:
+                    self.memory.put(key, [record["text"], record["created_at"]])
+                    with self._lock:
+                        self.disk_hits += 1
+                    return record["text"]
+                self._remove(key)
+                return None
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, text: str, provider: str = "", model: str = ""):
+        """応答を保存"""
+        created_at = time.time()
+        self.memory.put(key, [text, created_at])
+
+        path = self._entry_path(key)
+        record = {"created_at": created_at, "provider": provider, "model": model, "text": text}
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            size = path.stat().st_size
+        except OSError as e:
+            print(f"Error writing cached response {key}: {e}")
+            return
+
+        with self._lock:
+            previous = self._disk_index.get(key)
+            if previous:
+                self._disk_bytes -= previous[1]
+            self._disk_index[key] = (created_at, size)
+            self._disk_bytes += size
+            self.stores += 1
+            evict = self._select_disk_evictions()
+
+        for evicted_key in evict:
+            self._unlink(evicted_key)
+
+    def _select_disk_evictions(self) -> list:
+        """ディスク上限を超えた分を古い順に選んで索引から外す（ロック内で呼ぶ）"""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return []
+
+        evict = []
+        for key, (mtime, size) in sorted(self._disk_index.items(), key=lambda item: item[1][0]):
+            if self._disk_bytes <= self.max_disk_bytes or len(self._disk_index) <= 1:
+                break
+            del self._disk_index[key]
+            self._disk_bytes -= size
+            self.disk_evictions += 1
+            evict.append(key)
+        return evict
+
+    def _remove(self, key: str):
+        """期限切れ・破損した応答を削除"""
+        self.memory.discard(key)
+        with self._lock:
+            self.expired += 1
+            self.misses += 1
+            entry = self._disk_index.pop(key, None)
+            if entry:
+                self._disk_bytes -= entry[1]
+        self._unlink(key)
+
+    def _unlink(self, key: str):
+        try:
+            self._entry_path(key).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing cached response {key}: {e}")
+
+    def note_bypass(self):
+        """キャッシュを使わずに呼び出した件数を記録"""
+        with self._lock:
+            self.bypassed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory": self.memory.get_stats(),
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "ttl": self.ttl,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "expired": self.expired,
+                "bypassed": self.bypassed,
+                "disk_evictions": self.disk_evictions
+            }
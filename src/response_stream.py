@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Response Stream - AI応答のストリーミング補助
+"""
+
+import time
+from typing import Iterator
+
+
+def iter_text_chunks(text: str, chunk_size: int = 16, delay: float = 0.0) -> Iterator[str]:
+    """完成済みのテキストを断片に分けて順に返す（シミュレーション応答・テスト用のローカルストリーム）"""
+    for start in range(0, len(text), chunk_size):
+        if delay and start:
+            time.sleep(delay)
+        yield text[start:start + chunk_size]
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Search Index - 会話メッセージの全文検索インデックス
+"""
+
+import re
+import json
+import math
+import heapq
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+# 英数字の単語と、日本語（ひらがな・カタカナ・漢字）の連続部分
+WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """英語は単語単位、日本語は文字バイグラムでトークン化"""
+    text = text.lower()
+    tokens = WORD_PATTERN.findall(text)
+
+    for run in CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    return tokens
+
+
+class ConversationSearchIndex:
+    """ユーザーごとの転置インデックス（BM25でランキング）
+
+    インデックス済みのドキュメント（メッセージ）は語頻度付きで index_path に
+    1行ずつ追記され、起動時は再トークン化せずに再生して復元する。
+    """
+
+    K1 = 1.2
+    B = 0.75
+    PREVIEW_LENGTH = 200
+
+    def __init__(self, index_path: Optional[Path] = None):
+        self.index_path = Path(index_path) if index_path else None
+        self._lock = threading.Lock()
+        self._docs = []
+        self._postings = {}
+        self._user_stats = {}
+        self._indexed_messages = set()
+        self._pending_lines = []
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _load(self):
+        """永続化されたドキュメントを再生"""
+        if not self.index_path or not self.index_path.exists():
+            return
+
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping corrupt search index entry in {self.index_path}")
+                    continue
+                self._add_record(record)
+
+    def _add_record(self, record: Dict[str, Any]) -> bool:
+        """ドキュメントをメモリ上のインデックスに追加（ロックは呼び出し側、登録済みなら False）"""
+        key = (record["conversation_id"], record["message_id"])
+        if key in self._indexed_messages:
+            return False
+        self._indexed_messages.add(key)
+
+        doc_id = len(self._docs)
+        terms = record.pop("terms")
+        self._docs.append(record)
+
+        user_id = record["user_id"]
+        user_postings = self._postings.setdefault(user_id, {})
+        for term, frequency in terms.items():
+            user_postings.setdefault(term, {})[doc_id] = frequency
+
+        stats = self._user_stats.setdefault(user_id, {"documents": 0, "total_length": 0})
+        stats["documents"] += 1
+        stats["total_length"] += record["length"]
+        return True
+
+    def add_document(self, conversation_id: str, user_id: str, message: Dict[str, Any]):
+        """メッセージをインデックスに追加"""
+        content = message.get("content", "")
+        tokens = tokenize(content)
+        if not tokens:
+            return
+
+        terms = {}
+        for token in tokens:
+            terms[token] = terms.get(token, 0) + 1
+
+        record = {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "message_id": message.get("id", ""),
+            "seq": message.get("seq", 0),
+            "type": message.get("type", ""),
+            "timestamp": message.get("timestamp", ""),
+            "preview": content[:self.PREVIEW_LENGTH],
+            "length": len(tokens),
+            "terms": terms
+        }
+        line = json.dumps(record, ensure_ascii=False)
+
+        with self._lock:
+            if self._add_record(record) and self.index_path:
+                self._pending_lines.append(line)
+
+    def flush(self):
+        """未書き出しのドキュメントを追記"""
+        with self._lock:
+            lines = self._pending_lines
+            self._pending_lines = []
+
+        if not lines or not self.index_path:
+            return
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def rebuild(self, conversations) -> int:
+        """会話データからインデックスを再構築"""
+        with self._lock:
+            self._docs = []
+            self._postings = {}
+            self._user_stats = {}
+            self._indexed_messages = set()
+            self._pending_lines = []
+        if self.index_path and self.index_path.exists():
+            self.index_path.unlink()
+
+        for conversation in conversations:
+            user_id = conversation.get("user_id", "default")
+            for message in conversation.get("messages", []):
+                self.add_document(conversation["id"], user_id, message)
+
+        self.flush()
+        return len(self._docs)
+
+    def search(self, query: str, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """ユーザーの会話を検索してスコア順に返す"""
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            user_postings = self._postings.get(user_id, {})
+            stats = self._user_stats.get(user_id)
+            if not stats or not stats["documents"]:
+                return []
+
+            document_count = stats["documents"]
+            average_length = stats["total_length"] / document_count
+            scores = {}
+
+            # よく出現する語も寄与は小さいが省くと順位が変わるため、一致した語は全て加算する
+            for postings in (user_postings[term] for term in query_terms if term in user_postings):
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self._docs[doc_id]["length"]
+                    norm = self.K1 * (1 - self.B + self.B * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+            return [
+                {
+                    "conversation_id": self._docs[doc_id]["conversation_id"],
+                    "message_id": self._docs[doc_id]["message_id"],
+                    "seq": self._docs[doc_id]["seq"],
+                    "type": self._docs[doc_id]["type"],
+                    "timestamp": self._docs[doc_id]["timestamp"],
+                    "preview": self._docs[doc_id]["preview"],
+                    "score": round(score, 4)
+                }
+                for doc_id, score in top
+            ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """インデックス統計"""
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "users": len(self._user_stats),
+                "terms": sum(len(postings) for postings in self._postings.values()),
+                "pending_writes": len(self._pending_lines)
+            }
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Single Flight - 同じ内容の実行中のAI呼び出しを1つにまとめる
+"""
+
+import queue
+import asyncio
+import threading
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+
+class StreamFlight:
+    """1つのストリーミング呼び出しの断片を複数の受信者へ配る
+
+    途中から参加した受信者には受信済みの断片をまとめて渡してから続きを配る。
+    各受信者のキューには ("delta", text) / ("error", exc) / ("end", None) が入る。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.parts = []
+        self.finished = False
+        self.error = None
+        self.future = None
+
+    def subscribe(self) -> queue.Queue:
+        subscription = queue.Queue()
+        with self._lock:
+            for part in self.parts:
+                subscription.put(("delta", part))
+            if self.finished:
+                subscription.put(("error", self.error) if self.error else ("end", None))
+            else:
+                self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: queue.Queue) -> int:
+        """受信者を外し、残りの受信者数を返す"""
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+            return len(self._subscribers)
+
+    def publish(self, delta: str):
+        with self._lock:
+            self.parts.append(delta)
+            for subscription in self._subscribers:
+                subscription.put(("delta", delta))
+
+    def finish(self, error: Exception = None):
+        with self._lock:
+            self.finished = True
+            self.error = error
+            for subscription in self._subscribers:
+                subscription.put(("error", error) if error else ("end", None))
+            self._subscribers = []
+
+
+class SingleFlight:
+    """キーごとに実行中の呼び出しを1つだけにする
+
+    do() はイベントループ上の通常の呼び出しを、join_stream() は任意のスレッドからの
+    ストリーミング呼び出しをまとめる。先に始まった呼び出し（leader）の結果を、
+    同じキーで後から来た呼び出しが共有し、その件数を coalesced に数える。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """同じキーの呼び出しが実行中ならその結果を待ち、無ければ factory() を実行する"""
+        with self._lock:
+            task = self._calls.get(key)
+            if task is None:
+                task = asyncio.ensure_future(factory())
+                self._calls[key] = task
+                self.leaders += 1
+                task.add_done_callback(lambda done: self._forget_call(key, done))
+                coalesced = False
+            else:
+                self.coalesced += 1
+                coalesced = True
+
+        # 待っている呼び出しがキャンセルされても共有の呼び出しは続ける
+        result = dict(await asyncio.shield(task))
+        result["coalesced"] = coalesced
+        return result
+
+    def _forget_call(self, key: str, task: asyncio.Future):
+        with self._lock:
+            if self._calls.get(key) is task:
+                del self._calls[key]
+
+    def join_stream(self, key: str, start: Callable[[StreamFlight], Any]) -> tuple:
+        """実行中のストリームに参加し、無ければ start(flight) で開始して (flight, 受信キュー) を返す"""
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = StreamFlight()
+                self._streams[key] = flight
+                self.leaders += 1
+                flight.future = start(flight)
+            else:
+                self.coalesced += 1
+            return flight, flight.subscribe()
+
+    def leave_stream(self, key: str, flight: StreamFlight, subscription: queue.Queue):
+        """受信をやめる（全員が途中でやめたストリームは呼び出しごとキャンセル）"""
+        with self._lock:
+            if flight.unsubscribe(subscription) > 0 or flight.finished:
+                return
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+        if flight.future is not None:
+            flight.future.cancel()
+
+    def end_stream(self, key: str, flight: StreamFlight, error: Optional[Exception] = None):
+        """ストリームの完了（または失敗）を全受信者に通知"""
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+        flight.finish(error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._streams),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced
+            }
@@ -431,8 +431,14 @@ class UserInteractionManager:
         """対話履歴の要約を取得"""
         total_interactions = len(self.interaction_history)
         
+        # JSONに保存できるよう InteractionType は値の文字列にする
+        history = [
+            {**interaction, "type": InteractionType(interaction["type"]).value}
+            for interaction in self.interaction_history
+        ]
+        
         by_type = {}
-        for interaction in self.interaction_history:
+        for interaction in history:
             interaction_type = interaction["type"]
             if interaction_type not in by_type:
                 by_type[interaction_type] = 0
@@ -441,7 +447,7 @@ class UserInteractionManager:
         return {
             "total_interactions": total_interactions,
             "by_type": by_type,
-            "history": self.interaction_history,
+            "history": history,
             "generated_at": datetime.now().isoformat()
         }
 
@@ -7,7 +7,7 @@ import os
 import json
 import yaml
 from pathlib import Path
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, Union
 
 class ConfigManager:
     """Manage configuration for AI Collaboration System"""
@@ -21,6 +21,11 @@ class ConfigManager:
             "system": {
                 "auto_approve": True,
                 "max_iterations": 20,
+                "design_turns": 2,
+                "implementation_turns": 3,
+                "max_retries": 3,
+                "retry_base_delay": 1.0,
+                "retry_max_delay": 30.0,
                 "output_directory": "./generated_projects",
                 "temp_directory": "./temp",
                 "log_level": "INFO"
@@ -29,19 +34,133 @@ class ConfigManager:
                 "openai": {
                     "model": "gpt-4",
                     "max_tokens": 2000,
-                    "temperature": 0.7
+                    "temperature": 0.7,
+                    "timeout": 60.0,
+                    "max_concurrent": 4,
+                    "rpm": None,
+                    "tpm": None,
+                    "model_limits": {}
                 },
                 "anthropic": {
                     "model": "claude-3-sonnet-20240229",
                     "max_tokens": 2000,
-                    "temperature": 0.7
+                    "temperature": 0.7,
+                    "timeout": 60.0,
+                    "max_concurrent": 4,
+                    "rpm": None,
+                    "tpm": None,
+                    "model_limits": {}
+                },
+                "gemini": {
+                    "model": "gemini-1.5-pro",
+                    "max_tokens": 2048,
+                    "temperature": 0.7,
+                    "timeout": 60.0,
+                    "max_concurrent": 4,
+                    "rpm": None,
+                    "tpm": None,
+                    "model_limits": {}
+                },
+                "http": {
+                    "max_connections": 100,
+                    "max_connections_per_host": 20,
+                    "keepalive_timeout": 60.0
+                },
+                "keys": {
+                    "cooldown_seconds": 60.0,
+                    "auth_cooldown_seconds": 600.0,
+                    "failure_threshold": 3,
+                    "max_wait_seconds": 10.0
+                },
+                "cache": {
+                    "enabled": True,
+                    "directory": "cache/responses",
+                    "ttl": 86400,
+                    "max_entries": 1024,
+                    "max_bytes": 16 * 1024 * 1024,
+                    "max_disk_bytes": 256 * 1024 * 1024
+                },
+                "context": {
+                    "max_input_tokens": 8000,
+                    "reserve_tokens": 256,
+                    "context_windows": {}
+                },
+                "summary": {
+                    "enabled": True,
+                    "interval": 4,
+                    "keep_recent": 4,
+                    "max_tokens": 400,
+                    "provider": "gemini",
+                    "model": None
+                },
+                "routing": {
+                    "enabled": True,
+                    "tiers": {
+                        "gemini": ["gemini-1.5-flash", "gemini-1.5-pro"]
+                    },
+                    "slo_seconds": 30.0,
+                    "percentile": 95.0,
+                    "min_samples": 5,
+                    "large_prompt_tokens": 12000,
+                    "fast_phases": [],
+                    "latency_window": 200,
+                    "latency_max_age_seconds": 300.0
+                },
+                "hedging": {
+                    "enabled": False,
+                    "percentile": 95.0,
+                    "min_samples": 20,
+                    "max_hedge_rate": 0.1,
+                    "burst": 5.0,
+                    "alternates": {
+                        "openai": {"provider": "anthropic", "model": "claude-3-haiku-20240307"},
+                        "anthropic": {"provider": "openai", "model": "gpt-4o-mini"},
+                        "gemini": {"provider": "gemini", "model": "gemini-1.5-flash"}
+                    }
+                },
+                "resilience": {
+                    "retry": {
+                        "max_attempts": 3,
+                        "base_delay": 0.5,
+                        "max_delay": 8.0,
+                        "budget_ratio": 0.2,
+                        "budget_burst": 10.0,
+                        "max_retry_after": 30.0
+                    },
+                    "breaker": {
+                        "failure_rate": 0.5,
+                        "slow_call_seconds": 30.0,
+                        "slow_call_rate": 0.5,
+                        "window": 20,
+                        "min_calls": 5,
+                        "open_seconds": 30.0
+                    }
                 }
             },
             "ui": {
                 "theme": "dark",
                 "show_progress": True,
                 "auto_refresh": 2000,
-                "port": 8080
+                "port": 8080,
+                "max_concurrent_workflows": 4,
+                "max_workflows_per_user": 2,
+                "user_weights": {},
+                "decision_timeout": 300,
+                "subscriber_queue_size": 256,
+                "slow_client_timeout": 10.0
+            },
+            "storage": {
+                "backend": "jsonl",
+                "conversations_dir": "conversations",
+                "snapshot_interval": 50,
+                "sqlite_path": None,
+                "cache_max_entries": 256,
+                "cache_max_bytes": 64 * 1024 * 1024,
+                "write_behind": True,
+                "flush_interval": 1.0,
+                "flush_threshold": 20,
+                "blob_threshold": 4096,
+                "blob_cache_max_bytes": 16 * 1024 * 1024
             },
             "templates": {
                 "design_template": "default",
@@ -141,13 +260,23 @@ class ConfigManager:
         """Get AI provider specific configuration"""
         config = self.get(f"ai.{provider}", {})
         
-        # Add API key from environment
-        api_key_env = f"{provider.upper()}_API_KEY"
-        if api_key_env in os.environ:
-            config["api_key"] = os.environ[api_key_env]
+        # Add API keys from environment
+        api_keys = self.get_api_keys(provider)
+        if api_keys:
+            config["api_key"] = api_keys[0]
+            config["api_keys"] = api_keys
         
         return config
 
+    def get_api_keys(self, provider: str) -> List[str]:
+        """Get all API keys for a provider ({PROVIDER}_API_KEYS, {PROVIDER}_API_KEY, ai.<provider>.api_keys)"""
+        keys = os.getenv(f"{provider.upper()}_API_KEYS", "").split(",")
+        keys.append(os.getenv(f"{provider.upper()}_API_KEY", ""))
+        keys.extend(self.get(f"ai.{provider}.api_keys", []) or [])
+        
+        # Remove blanks and duplicates, keeping order
+        return list(dict.fromkeys(key.strip() for key in keys if key and key.strip()))
+
     def get_system_config(self) -> Dict[str, Any]:
         """Get system configuration"""
         return self.get("system", {})
@@ -196,10 +325,10 @@ class ConfigManager:
                 issues.append(f"Missing required setting: {path}")
         
         # Check API keys
-        if not os.getenv("OPENAI_API_KEY"):
+        if not self.get_api_keys("openai"):
             warnings.append("OPENAI_API_KEY environment variable not set")
         
-        if not os.getenv("ANTHROPIC_API_KEY"):
+        if not self.get_api_keys("anthropic"):
             warnings.append("ANTHROPIC_API_KEY environment variable not set")
         
         # Check directories
@@ -222,6 +351,8 @@ class ConfigManager:
             "system": {
                 "auto_approve": True,
                 "max_iterations": 20,
+                "design_turns": 2,
+                "implementation_turns": 3,
                 "output_directory": "./generated_projects"
             },
             "ai": {
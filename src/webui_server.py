@@ -7,27 +7,82 @@ import os
 import json
 import uuid
 import asyncio
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from enhanced_ai_collaboration import EnhancedAICollaboration
-from user_interaction import UserInteractionManager
+from user_interaction import UserInteractionManager, InteractionType
 from offline_simulator import OfflineAISimulator
+from utils.config_manager import ConfigManager
+from search_index import ConversationSearchIndex
+from blob_store import BlobStore
+from workflow_runner import WorkflowRunner
+from decision_broker import DecisionBroker, DecisionCancelled
+from conversation_hub import ConversationHub, ConversationChannel, Subscriber
+from collaboration_scheduler import CollaborationScheduler, PRIORITY_INTERACTIVE
+from ai_providers import get_provider_registry
+from context_packer import get_context_packer
+from model_router import get_model_router
+from conversation_store import (
+    create_conversation_store, make_event, apply_event, estimate_size, snapshot_copy, ConversationCache,
+    encode_cursor, decode_cursor, items_since,
+    EVENT_MESSAGE_ADDED, EVENT_DECISION_RECORDED, EVENT_MODELS_CHANGED, EVENT_STATUS_CHANGED
+)
 
 class ConversationManager:
     """会話の保存と管理"""
     
-    def __init__(self):
-        self.conversations_dir = Path("conversations")
+    def __init__(self, conversations_dir: str = "conversations", snapshot_interval: int = 50,
+                 storage_backend: str = "jsonl", sqlite_path: str = None,
+                 cache_max_entries: int = 256, cache_max_bytes: int = 64 * 1024 * 1024,
+                 write_behind: bool = False, flush_threshold: int = 20,
+                 search_index: ConversationSearchIndex = None, blob_store: BlobStore = None,
+                 blob_threshold: int = 4096):
+        self.conversations_dir = Path(conversations_dir)
         self.conversations_dir.mkdir(exist_ok=True)
-        self.active_conversations = {}
+        self.store = create_conversation_store(
+            storage_backend, self.conversations_dir, snapshot_interval, sqlite_path
+        )
+        # アクティブな会話のLRUキャッシュ（ミス時はストアから読み込む）
+        self.cache = ConversationCache(cache_max_entries, cache_max_bytes, on_evict=self._on_evict)
+        
+        # write_behind 時はイベントをメモリに溜め、flush() でまとめて書き出す
+        self.write_behind = write_behind
+        self.flush_threshold = flush_threshold
+        self.on_flush_needed = None
+        self._pending_events = {}
+        self._pending_count = 0
+        # キャッシュから追い出され、書き出し（チェックポイント）待ちの会話
+        self._evicted = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        
+        # blob_threshold バイトを超える本文は BlobStore に置き、メッセージにはダイジェストのみ残す
+        self.blob_store = blob_store
+        self.blob_threshold = blob_threshold
+        if self.blob_store is not None and not self.blob_store.has_refcounts():
+            self.blob_store.rebuild_refcounts(
+                message["content_digest"]
+                for conversation in self.store.iter_conversations()
+                for message in conversation.get("messages", [])
+                if "content_digest" in message
+            )
+        
+        # 全文検索インデックス（add_message で逐次更新）
+        self.search_index = search_index
+        if self.search_index is not None and len(self.search_index) == 0:
+            self.search_index.rebuild(
+                self._materialize(conversation) for conversation in self.store.iter_conversations()
+            )
         
     def create_conversation(self, user_id: str, project_request: str) -> str:
         """新しい会話を作成"""
@@ -42,17 +97,18 @@ class ConversationManager:
             "messages": [],
             "ai_interactions": [],
             "generated_files": [],
-            "user_decisions": []
+            "user_decisions": [],
+            "event_seq": 0
         }
         
-        self.active_conversations[conversation_id] = conversation_data
-        self._save_conversation(conversation_id)
+        self.store.save_snapshot(conversation_data)
+        self.cache.put(conversation_id, conversation_data)
         
         return conversation_id
     
     def add_message(self, conversation_id: str, message_type: str, content: str, metadata: Dict = None):
         """メッセージを追加"""
-        if conversation_id not in self.active_conversations:
+        if self._get_or_load(conversation_id) is None:
             return False
         
         message = {
@@ -63,14 +119,30 @@ class ConversationManager:
             "timestamp": datetime.now().isoformat()
         }
         
-        self.active_conversations[conversation_id]["messages"].append(message)
-        self._save_conversation(conversation_id)
+        stored = message
+        if self.blob_store is not None and len(content.encode('utf-8')) > self.blob_threshold:
+            stored = {
+                ("content_digest" if key == "content" else key): value
+                for key, value in message.items()
+            }
+            stored["content_digest"] = self.blob_store.put(content)
+            if not self.write_behind:
+                self.blob_store.flush()
+        
+        self._record_event(conversation_id, EVENT_MESSAGE_ADDED, {"message": stored})
+        message["seq"] = stored["seq"]
+        
+        if self.search_index is not None:
+            conversation = self._get_or_load(conversation_id)
+            self.search_index.add_document(conversation_id, conversation.get("user_id", "default"), message)
+            if not self.write_behind:
+                self.search_index.flush()
         
         return True
     
     def add_user_decision(self, conversation_id: str, question: str, answer: str, context: Dict = None):
         """ユーザー決定を記録"""
-        if conversation_id not in self.active_conversations:
+        if self._get_or_load(conversation_id) is None:
             return False
         
         decision = {
@@ -81,63 +153,515 @@ class ConversationManager:
             "timestamp": datetime.now().isoformat()
         }
         
-        self.active_conversations[conversation_id]["user_decisions"].append(decision)
-        self._save_conversation(conversation_id)
+        self._record_event(conversation_id, EVENT_DECISION_RECORDED, {"decision": decision})
         
         return True
     
+    def update_selected_models(self, conversation_id: str, models: Dict) -> bool:
+        """選択モデルを更新"""
+        if self._get_or_load(conversation_id) is None:
+            return False
+        
+        self._record_event(conversation_id, EVENT_MODELS_CHANGED, {"models": models})
+        return True
+    
+    def update_status(self, conversation_id: str, status: str) -> bool:
+        """会話ステータスを更新"""
+        if self._get_or_load(conversation_id) is None:
+            return False
+        
+        self._record_event(conversation_id, EVENT_STATUS_CHANGED, {"status": status})
+        return True
+    
     def get_conversation(self, conversation_id: str) -> Optional[Dict]:
         """会話を取得"""
-        return self.active_conversations.get(conversation_id)
+        conversation = self._get_or_load(conversation_id)
+        if conversation is None:
+            return None
+        
+        with self._lock:
+            return self._materialize(conversation)
+    
+    def get_conversation_delta(self, conversation_id: str, since_seq: int) -> Optional[Dict]:
+        """since_seq より新しいメッセージと決定のみを取得"""
+        conversation = self._get_or_load(conversation_id)
+        if conversation is None:
+            return None
+        
+        with self._lock:
+            return {
+                "id": conversation_id,
+                "since_seq": since_seq,
+                "latest_seq": conversation.get("event_seq", 0),
+                "status": conversation.get("status"),
+                "selected_models": conversation.get("selected_models"),
+                "messages": self._resolve_messages(items_since(conversation.get("messages", []), since_seq)),
+                "user_decisions": items_since(conversation.get("user_decisions", []), since_seq)
+            }
+    
+    def get_latest_seq(self, conversation_id: str) -> int:
+        """会話の最新シーケンス番号"""
+        conversation = self._get_or_load(conversation_id)
+        return conversation.get("event_seq", 0) if conversation else 0
     
     def get_all_conversations(self, user_id: str = None) -> List[Dict]:
         """全ての会話を取得"""
-        conversations = []
+        return self.store.list_summaries(user_id)
+    
+    def get_conversations_page(self, user_id: str = None, statuses: List[str] = None,
+                               limit: int = 50, cursor: str = None) -> Dict[str, Any]:
+        """会話一覧をカーソルでページング取得（不正なカーソルは ValueError）"""
+        after = decode_cursor(cursor) if cursor else None
+        page = self.store.page_summaries(user_id, statuses, limit, after)
         
-        for file_path in self.conversations_dir.glob("*.json"):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    conversation = json.load(f)
-                    
-                if user_id is None or conversation.get("user_id") == user_id:
-                    # サマリー情報のみ返す
-                    conversations.append({
-                        "id": conversation["id"],
-                        "project_request": conversation["project_request"],
-                        "created_at": conversation["created_at"],
-                        "status": conversation["status"],
-                        "message_count": len(conversation.get("messages", [])),
-                        "decision_count": len(conversation.get("user_decisions", []))
-                    })
-            except Exception as e:
-                print(f"Error loading conversation {file_path}: {e}")
+        return {
+            "conversations": page["items"],
+            "next_cursor": encode_cursor(page["next"]) if page["next"] else None,
+            "total": page["total"]
+        }
+    
+    def _resolve_messages(self, messages: List[Dict]) -> List[Dict]:
+        """ダイジェストで保存された本文を元に戻したメッセージ一覧"""
+        if self.blob_store is None:
+            return list(messages)
         
-        return sorted(conversations, key=lambda x: x["created_at"], reverse=True)
+        resolved = []
+        for message in messages:
+            if "content_digest" in message:
+                content = self.blob_store.get(message["content_digest"])
+                message = {
+                    ("content" if key == "content_digest" else key): (content if key == "content_digest" else value)
+                    for key, value in message.items()
+                }
+            resolved.append(message)
+        return resolved
+    
+    def _materialize(self, conversation: Dict) -> Dict:
+        """API出力用に本文を展開した会話のコピー"""
+        materialized = snapshot_copy(conversation)
+        materialized["messages"] = self._resolve_messages(conversation.get("messages", []))
+        return materialized
+    
+    def _record_event(self, conversation_id: str, event_type: str, data: Dict):
+        """イベントをメモリ上の会話に適用しログに追記"""
+        conversation = self._get_or_load(conversation_id)
+        
+        event = make_event(event_type, data)
+        
+        with self._lock:
+            event["seq"] = conversation.get("event_seq", 0) + 1
+            # メッセージと決定にも会話内で単調増加する seq を付与（差分同期用）
+            for key in ("message", "decision"):
+                if key in data:
+                    data[key]["seq"] = event["seq"]
+            apply_event(conversation, event)
+            
+            if self.write_behind:
+                pending = self._pending_events.setdefault(conversation_id, (conversation, []))
+                pending[1].append(event)
+                self._pending_count += 1
+                flush_needed = self._pending_count >= self.flush_threshold
+            else:
+                self.store.append_event(conversation, event)
+                flush_needed = False
+        
+        self.cache.grow(conversation_id, estimate_size(data))
+        
+        if flush_needed and self.on_flush_needed:
+            self.on_flush_needed()
+    
+    def flush(self, conversation_id: str = None) -> int:
+        """溜まっているイベントをストアに書き出す（書き出したイベント数を返す）"""
+        with self._flush_lock:
+            with self._lock:
+                if conversation_id is None:
+                    pending = self._pending_events
+                    self._pending_events = {}
+                else:
+                    pending = {}
+                    if conversation_id in self._pending_events:
+                        pending[conversation_id] = self._pending_events.pop(conversation_id)
+                
+                batches = []
+                for conversation, events in pending.values():
+                    self._pending_count -= len(events)
+                    batches.append((snapshot_copy(conversation), events))
+                
+                if conversation_id is None:
+                    evicted = [snapshot_copy(conversation) for conversation in self._evicted.values()]
+                    self._evicted = {}
+                else:
+                    conversation = self._evicted.pop(conversation_id, None)
+                    evicted = [snapshot_copy(conversation)] if conversation is not None else []
+            
+            # イベントが参照する本文を先に書き出す
+            if self.blob_store is not None:
+                try:
+                    self.blob_store.flush()
+                except Exception as e:
+                    print(f"Error flushing blob store: {e}")
+            
+            flushed = 0
+            for conversation, events in batches:
+                try:
+                    self.store.append_events(conversation, events)
+                    flushed += len(events)
+                except Exception as e:
+                    print(f"Error flushing conversation {conversation['id']}: {e}")
+            
+            # 追い出された会話は未統合のイベントをスナップショットに統合
+            for conversation in evicted:
+                try:
+                    self.store.checkpoint(conversation)
+                except Exception as e:
+                    print(f"Error checkpointing evicted conversation {conversation['id']}: {e}")
+            
+            if self.search_index is not None:
+                try:
+                    self.search_index.flush()
+                except Exception as e:
+                    print(f"Error flushing search index: {e}")
+            
+            return flushed
+    
+    def get_pending_count(self) -> int:
+        """未書き出しのイベント数"""
+        return self._pending_count
+    
+    def has_pending_writes(self) -> bool:
+        """書き出し待ちのイベント・追い出された会話があるか"""
+        return self._pending_count > 0 or bool(self._evicted)
+    
+    def _get_or_load(self, conversation_id: str) -> Optional[Dict]:
+        """キャッシュから取得し、無ければストアから読み込む"""
+        conversation = self.cache.get(conversation_id)
+        if conversation is not None:
+            return conversation
+        
+        # 追い出し後まだ書き出されていない会話はストアより新しいのでそのまま戻す
+        with self._lock:
+            conversation = self._evicted.pop(conversation_id, None)
+        if conversation is not None:
+            self.cache.put(conversation_id, conversation)
+            return conversation
+        
+        # flush() は追い出された会話を取り出してから書き出すので、書き出し中は終わるのを待って読み込む
+        # （待たずに読むと書き出し前の古い内容になり、seq が重複する）
+        with self._flush_lock:
+            with self._lock:
+                conversation = self._evicted.pop(conversation_id, None)
+            if conversation is None:
+                try:
+                    conversation = self.store.load(conversation_id)
+                except Exception as e:
+                    print(f"Error loading conversation {conversation_id}: {e}")
+                    return None
+        
+        if conversation is not None:
+            self.cache.put(conversation_id, conversation)
+        return conversation
+    
+    def _on_evict(self, conversation_id: str, conversation: Dict):
+        """追い出す会話の未統合のイベントを書き出す
+
+        バックグラウンドの書き出し（on_flush_needed）がある場合は書き出しを任せ、
+        キャッシュを更新した呼び出し元（イベントループ）でディスクI/Oを行わない。
+        """
+        if self.on_flush_needed is None:
+            self.flush(conversation_id)
+            with self._flush_lock:
+                self.store.checkpoint(snapshot_copy(conversation))
+            return
+        
+        with self._lock:
+            self._evicted[conversation_id] = conversation
+        self.on_flush_needed()
     
     def _save_conversation(self, conversation_id: str):
-        """会話をファイルに保存"""
-        if conversation_id not in self.active_conversations:
+        """会話のスナップショットを保存（イベントログはコンパクションされる）"""
+        conversation = self._get_or_load(conversation_id)
+        if conversation is None:
             return
         
-        file_path = self.conversations_dir / f"{conversation_id}.json"
+        self.flush(conversation_id)
+        with self._flush_lock:
+            self.store.save_snapshot(snapshot_copy(conversation))
+    
+    def search(self, query: str, user_id: str, limit: int = 20) -> List[Dict]:
+        """会話メッセージを全文検索"""
+        if self.search_index is None:
+            return []
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.active_conversations[conversation_id], f, 
-                     indent=2, ensure_ascii=False)
+        results = self.search_index.search(query, user_id, limit)
+        for result in results:
+            summary = self.store.get_summary(result["conversation_id"])
+            if summary:
+                result["project_request"] = summary["project_request"]
+        return results
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計を取得"""
+        return self.cache.get_stats()
+
+class ConversationFlusher:
+    """ダーティな会話をバックグラウンドでまとめて書き出す
+
+    flush_interval 秒ごと、または未書き出しイベントが閾値に達した時点で
+    ConversationManager.flush() をスレッドプールで実行し、イベントループを
+    ディスクI/Oでブロックしない。
+    """
+    
+    def __init__(self, conversation_manager: ConversationManager, flush_interval: float = 1.0):
+        self.conversation_manager = conversation_manager
+        self.flush_interval = flush_interval
+        self.flush_count = 0
+        self._task = None
+        self._wakeup = None
+        self._loop = None
+    
+    async def start(self):
+        """バックグラウンドタスクを開始"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.conversation_manager.on_flush_needed = self._notify
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """タスクを停止し、残りを全て書き出す"""
+        self.conversation_manager.on_flush_needed = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+    
+    def _notify(self):
+        """閾値到達時に書き出しを前倒し（どのスレッドからでも呼べる）"""
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            if self.conversation_manager.has_pending_writes():
+                await self.flush()
+    
+    async def flush(self, conversation_id: str = None):
+        """スレッドプールで書き出しを実行"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.conversation_manager.flush, conversation_id)
+        self.flush_count += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """書き出し統計"""
+        return {
+            "pending_events": self.conversation_manager.get_pending_count(),
+            "flush_count": self.flush_count,
+            "flush_interval": self.flush_interval,
+            "flush_threshold": self.conversation_manager.flush_threshold
+        }
+
+class WebSocketInteractionManager(UserInteractionManager):
+    """ワークフローの確認・質問・入力・エラー対応をブラウザに送り、DecisionBroker で回答を待つ
+
+    メソッドはワークフローのスレッドから呼ばれ、標準入力は使わない。確認（request_confirmation）と
+    エラー対応（handle_error）は ask_user_decision を経由するため、同じ経路で回答を待つ。
+    """
+    
+    def __init__(self, channel: ConversationChannel, conversation_id: str, conversation_manager: ConversationManager,
+                 decision_broker: DecisionBroker, loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self.channel = channel
+        self.conversation_id = conversation_id
+        self.conversation_manager = conversation_manager
+        self.decision_broker = decision_broker
+        self.loop = loop
+    
+    def ask_user_decision(self, question: str, options: List[str] = None, default: str = None, context: Dict = None) -> str:
+        """イベントループ上でブラウザに決定を求め、回答を待つ"""
+        response = WorkflowRunner.call_in_loop(
+            self.loop, self.ask_user_decision_async(question, options, default, context), timeout=None
+        )
+        self.interaction_history.append({
+            "type": InteractionType.DECISION,
+            "question": question,
+            "options": options or [],
+            "default": default,
+            "context": context or {},
+            "timestamp": datetime.now().isoformat(),
+            "response": response
+        })
+        return response
+    
+    async def ask_user_decision_async(self, question: str, options: List[str] = None, default: str = None, context: Dict = None):
+        """非同期でユーザー決定を求める"""
+        try:
+            # user_decision メッセージで解決されるまで待つ（記録は受信側で行う）
+            return await self._wait_for_answer(question, options, default, context)
+        except asyncio.TimeoutError:
+            # タイムアウト時はデフォルト値を使用
+            response = default or "timeout"
+        except (DecisionCancelled, WebSocketDisconnect, RuntimeError):
+            response = default or "no_response"
+        
+        # 決定を記録
+        self.conversation_manager.add_user_decision(
+            self.conversation_id, question, response, context
+        )
+        
+        return response
+    
+    def ask_for_input(self, prompt: str, input_type: str = "text", validation: Optional[callable] = None,
+                      context: Dict[str, Any] = None) -> Any:
+        """ブラウザに自由入力を求める（回答が無い・形式が合わない場合は None）"""
+        answer = WorkflowRunner.call_in_loop(
+            self.loop, self.ask_for_input_async(prompt, input_type, context), timeout=None
+        )
+        user_input = self._parse_input(answer, input_type)
+        if user_input is not None and validation and not validation(user_input):
+            user_input = None
+        
+        self.interaction_history.append({
+            "type": InteractionType.INPUT_REQUEST,
+            "prompt": prompt,
+            "input_type": input_type,
+            "context": context or {},
+            "timestamp": datetime.now().isoformat(),
+            "user_input": user_input
+        })
+        return user_input
+    
+    async def ask_for_input_async(self, prompt: str, input_type: str = "text", context: Dict[str, Any] = None) -> Optional[str]:
+        """非同期で自由入力を求める"""
+        try:
+            return await self._wait_for_answer(prompt, [], None, {**(context or {}), "input_type": input_type})
+        except (asyncio.TimeoutError, DecisionCancelled, WebSocketDisconnect, RuntimeError):
+            return None
+    
+    @staticmethod
+    def _parse_input(answer: Optional[str], input_type: str) -> Any:
+        """回答を input_type の値に変換"""
+        answer = (answer or "").strip()
+        if not answer:
+            return None
+        if input_type == "number":
+            try:
+                return float(answer)
+            except ValueError:
+                return None
+        if input_type == "yes_no":
+            if answer.lower() in ("y", "yes", "n", "no"):
+                return answer.lower() in ("y", "yes")
+            return None
+        if input_type == "file_path" and not Path(answer).exists():
+            return None
+        return answer
+    
+    def show_warning(self, message: str, context: Dict[str, Any] = None, require_confirmation: bool = False) -> bool:
+        """警告をブラウザに表示（確認が必要な場合は決定を求める）"""
+        if require_confirmation:
+            return super().show_warning(message, context, require_confirmation)
+        
+        self.interaction_history.append({
+            "type": InteractionType.WARNING,
+            "message": message,
+            "context": context or {},
+            "require_confirmation": False,
+            "timestamp": datetime.now().isoformat()
+        })
+        WorkflowRunner.call_in_loop(self.loop, self.channel.send_json({
+            "type": "system_message",
+            "content": f"Warning: {message}"
+        }))
+        return True
+    
+    async def _wait_for_answer(self, question: str, options: List[str], default: Optional[str], context: Optional[Dict]) -> str:
+        """質問を全購読者に送り、decision_id の Future が解決されるまで待つ"""
+        decision_id = self.decision_broker.create(self.conversation_id, question, context, options, default)
+        
+        try:
+            await self.channel.send_json({
+                "type": "user_decision_required",
+                "decision_id": decision_id,
+                "question": question,
+                "options": options or [],
+                "default": default,
+                "context": context or {},
+                "pending_decisions": self.decision_broker.pending_count(self.conversation_id)
+            })
+            return await self.decision_broker.wait(decision_id)
+        finally:
+            self.decision_broker.discard(decision_id)
 
 class WebUIServer:
     """WebUI サーバー"""
     
     def __init__(self):
-        self.app = FastAPI(title="AI Collaboration WebUI")
-        self.conversation_manager = ConversationManager()
-        self.active_websockets = {}
-        self.ai_system = None
+        self.app = FastAPI(title="AI Collaboration WebUI", lifespan=self._lifespan)
+        self.config = ConfigManager()
+        storage_config = self.config.get("storage", {})
+        self.conversation_manager = ConversationManager(
+            conversations_dir=storage_config.get("conversations_dir", "conversations"),
+            snapshot_interval=storage_config.get("snapshot_interval", 50),
+            storage_backend=storage_config.get("backend", "jsonl"),
+            sqlite_path=storage_config.get("sqlite_path"),
+            cache_max_entries=storage_config.get("cache_max_entries", 256),
+            cache_max_bytes=storage_config.get("cache_max_bytes", 64 * 1024 * 1024),
+            write_behind=storage_config.get("write_behind", True),
+            flush_threshold=storage_config.get("flush_threshold", 20),
+            search_index=ConversationSearchIndex(
+                Path(storage_config.get("conversations_dir", "conversations")) / "search_index.jsonl"
+            ),
+            blob_store=BlobStore(
+                Path(storage_config.get("conversations_dir", "conversations")) / "blobs",
+                storage_config.get("blob_cache_max_bytes", 16 * 1024 * 1024)
+            ) if storage_config.get("blob_threshold", 4096) > 0 else None,
+            blob_threshold=storage_config.get("blob_threshold", 4096)
+        )
+        self.flusher = ConversationFlusher(
+            self.conversation_manager, storage_config.get("flush_interval", 1.0)
+        )
+        # 会話ごとのWebSocket購読者（複数タブ・複数ユーザーで同じ会話を閲覧可能）
+        self.hub = ConversationHub(
+            self.config.get("ui.subscriber_queue_size", 256), self.config.get("ui.slow_client_timeout", 10.0)
+        )
+        # ブロッキングなAIワークフローはイベントループ外のスレッドプールで実行
+        self.workflow_runner = WorkflowRunner(self.config.get("ui.max_concurrent_workflows", 4))
+        # 実行枠をユーザー間で公平に割り当てる（全体の上限はスレッドプールと同じ）
+        self.scheduler = CollaborationScheduler(
+            self.config.get("ui.max_concurrent_workflows", 4),
+            self.config.get("ui.max_workflows_per_user", 2),
+            self.config.get("ui.user_weights", {})
+        )
+        # ユーザー決定待ち（decision_id ごとの Future）
+        self.decision_broker = DecisionBroker(self.config.get("ui.decision_timeout", 300))
+        # AIプロバイダーの共有クライアント（keep-alive 接続プールをペルソナ間で共有）
+        self.providers = get_provider_registry()
         self.offline_simulator = OfflineAISimulator()
         
         self._setup_routes()
         self._setup_middleware()
     
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """起動時に書き出しタスクを開始し、終了時に全て書き出す"""
+        if self.conversation_manager.write_behind:
+            await self.flusher.start()
+        try:
+            yield
+        finally:
+            self.workflow_runner.shutdown()
+            await self.flusher.stop()
+            self.providers.close()
+    
     def _setup_middleware(self):
         """ミドルウェアの設定"""
         self.app.add_middleware(
@@ -146,6 +670,7 @@ class WebUIServer:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=["X-Total-Count"],
         )
     
     def _setup_routes(self):
@@ -157,14 +682,31 @@ class WebUIServer:
             return FileResponse("templates/webui_main.html")
         
         @self.app.get("/api/conversations")
-        async def get_conversations(user_id: str = "default"):
-            """会話履歴を取得"""
-            conversations = self.conversation_manager.get_all_conversations(user_id)
-            return {"conversations": conversations}
+        async def get_conversations(response: Response, user_id: str = "default", limit: int = 50,
+                                    cursor: Optional[str] = None, status: Optional[str] = None):
+            """会話履歴を取得（limit/cursor でページング、status はカンマ区切りで絞り込み）"""
+            if limit < 1 or limit > 500:
+                raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+            
+            statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+            
+            try:
+                page = self.conversation_manager.get_conversations_page(user_id, statuses, limit, cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            response.headers["X-Total-Count"] = str(page["total"])
+            return {"conversations": page["conversations"], "next_cursor": page["next_cursor"]}
         
         @self.app.get("/api/conversations/{conversation_id}")
-        async def get_conversation(conversation_id: str):
-            """特定の会話を取得"""
+        async def get_conversation(conversation_id: str, since_seq: Optional[int] = None):
+            """特定の会話を取得（since_seq 指定時は差分のみ）"""
+            if since_seq is not None:
+                delta = self.conversation_manager.get_conversation_delta(conversation_id, since_seq)
+                if not delta:
+                    raise HTTPException(status_code=404, detail="Conversation not found")
+                return delta
+            
             conversation = self.conversation_manager.get_conversation(conversation_id)
             if not conversation:
                 raise HTTPException(status_code=404, detail="Conversation not found")
@@ -185,10 +727,7 @@ class WebUIServer:
             conversation_id = self.conversation_manager.create_conversation(user_id, project_request)
             
             # モデル選択を会話に保存
-            conversation = self.conversation_manager.get_conversation(conversation_id)
-            if conversation:
-                conversation["selected_models"] = models
-                self.conversation_manager._save_conversation(conversation_id)
+            self.conversation_manager.update_selected_models(conversation_id, models)
             
             # 開始メッセージを追加
             self.conversation_manager.add_message(
@@ -199,43 +738,74 @@ class WebUIServer:
             
             return {"conversation_id": conversation_id, "status": "started"}
         
+        @self.app.get("/api/search")
+        async def search_conversations(q: str, user_id: str = "default", limit: int = 20):
+            """過去の会話を全文検索"""
+            if limit < 1 or limit > 100:
+                raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+            
+            results = self.conversation_manager.search(q, user_id, limit)
+            return {"query": q, "results": results}
+        
+        @self.app.get("/api/metrics")
+        async def get_metrics():
+            """サーバー内部のメトリクスを取得"""
+            return {
+                "conversation_cache": self.conversation_manager.get_cache_stats(),
+                "conversation_flusher": self.flusher.get_stats(),
+                "ai_workflows": self.workflow_runner.get_stats(),
+                "scheduler": self.scheduler.get_stats(),
+                "user_decisions": self.decision_broker.get_stats(),
+                "websocket_hub": self.hub.get_stats(),
+                "ai_providers": self.providers.get_stats(),
+                "context_packer": get_context_packer().get_stats(),
+                "model_routing": get_model_router().get_stats(),
+                "search_index": self.conversation_manager.search_index.get_stats(),
+                "blob_store": self.conversation_manager.blob_store.get_stats() if self.conversation_manager.blob_store else None
+            }
+        
         @self.app.get("/api/check-api-status")
         async def check_api_status():
-            """API接続状態をチェック"""
-            import os
+            """API接続状態をチェック（プロバイダーごとのサーキットブレーカーの状態を含む）"""
             return {
-                "openai": bool(os.getenv("OPENAI_API_KEY")),
-                "anthropic": bool(os.getenv("ANTHROPIC_API_KEY")),
-                "gemini": bool(os.getenv("GEMINI_API_KEY"))
+                "openai": self.providers.has_api_key("openai"),
+                "anthropic": self.providers.has_api_key("anthropic"),
+                "gemini": self.providers.has_api_key("gemini"),
+                "circuit_breakers": self.providers.get_breaker_states()
             }
         
         @self.app.websocket("/ws/{conversation_id}")
-        async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
-            """WebSocket接続"""
+        async def websocket_endpoint(websocket: WebSocket, conversation_id: str, since_seq: Optional[int] = None):
+            """WebSocket接続（再接続時は since_seq で差分のみ受信）"""
             await websocket.accept()
-            self.active_websockets[conversation_id] = websocket
+            subscriber = self.hub.subscribe(conversation_id, websocket)
             
             try:
-                # 既存の会話データを送信
-                conversation = self.conversation_manager.get_conversation(conversation_id)
-                if conversation:
-                    await websocket.send_json({
-                        "type": "conversation_data",
-                        "data": conversation
+                # 既存の会話データと、回答待ちの質問を送信（遅延で切断された後の再接続でも質問を失わない）
+                await self._send_conversation(conversation_id, subscriber, since_seq)
+                for pending in self.decision_broker.pending_for(conversation_id):
+                    await subscriber.send_json({
+                        "type": "user_decision_required",
+                        **pending,
+                        "pending_decisions": self.decision_broker.pending_count(conversation_id)
                     })
                 
                 # メッセージループ
                 while True:
                     data = await websocket.receive_json()
-                    await self._handle_websocket_message(conversation_id, data, websocket)
+                    await self._handle_websocket_message(conversation_id, data, subscriber)
                     
             except WebSocketDisconnect:
-                if conversation_id in self.active_websockets:
-                    del self.active_websockets[conversation_id]
+                pass
+            finally:
+                # 最後の購読者が切断したら、回答できなくなった決定待ちを取り消す
+                if await self.hub.unsubscribe(subscriber) == 0:
+                    self.decision_broker.cancel_conversation(conversation_id)
     
-    async def _handle_websocket_message(self, conversation_id: str, data: dict, websocket: WebSocket):
-        """WebSocketメッセージの処理"""
+    async def _handle_websocket_message(self, conversation_id: str, data: dict, subscriber: Subscriber):
+        """WebSocketメッセージの処理（会話イベントは全購読者に配信）"""
         
+        channel = self.hub.channel(conversation_id)
         message_type = data.get("type")
         content = data.get("content", "")
         
@@ -252,15 +822,13 @@ class WebUIServer:
             models = data.get("models", {})
             if models:
                 # 会話にモデル選択を保存
-                conversation = self.conversation_manager.get_conversation(conversation_id)
-                if conversation:
-                    conversation["selected_models"] = models
-                    self.conversation_manager._save_conversation(conversation_id)
+                self.conversation_manager.update_selected_models(conversation_id, models)
             
             # 確認応答
-            await websocket.send_json({
+            await channel.send_json({
                 "type": "message_received",
-                "content": "Message received"
+                "content": "Message received",
+                "seq": self.conversation_manager.get_latest_seq(conversation_id)
             })
             
             # メッセージが実際のプロジェクトリクエストの場合、AI協調作業を開始
@@ -275,13 +843,13 @@ class WebUIServer:
                     "mode": "full",
                     "models": models
                 }
-                await self._start_ai_process(conversation_id, ai_data, websocket)
+                await self._start_ai_process(conversation_id, ai_data, channel)
             else:
                 print(f"[DEBUG] Message too short, not starting AI process: '{content}'")
         
         elif message_type == "start_ai_collaboration":
             # AI協調作業を開始
-            await self._start_ai_process(conversation_id, data, websocket)
+            await self._start_ai_process(conversation_id, data, channel)
         
         elif message_type == "user_decision":
             # ユーザー決定を処理
@@ -289,23 +857,26 @@ class WebUIServer:
             answer = data.get("answer", "")
             context = data.get("context", {})
             
+            # 待機中の質問への回答なら Future を解決し、質問内容を引き継ぐ
+            pending = self.decision_broker.resolve(conversation_id, data.get("decision_id", ""), answer)
+            if pending:
+                question = question or pending["question"]
+                context = context or pending["context"]
+            
             self.conversation_manager.add_user_decision(
                 conversation_id, question, answer, context
             )
             
-            await websocket.send_json({
+            await channel.send_json({
                 "type": "decision_recorded",
-                "content": f"Decision recorded: {answer}"
+                "content": f"Decision recorded: {answer}",
+                "seq": self.conversation_manager.get_latest_seq(conversation_id)
             })
         
         elif message_type == "model_selection":
             # モデル選択を更新
             models = data.get("models", {})
-            conversation = self.conversation_manager.get_conversation(conversation_id)
-            if conversation:
-                conversation["selected_models"] = models
-                self.conversation_manager._save_conversation(conversation_id)
-                
+            if self.conversation_manager.update_selected_models(conversation_id, models):
                 # システムメッセージを追加
                 self.conversation_manager.add_message(
                     conversation_id, 
@@ -313,16 +884,41 @@ class WebUIServer:
                     f"Models updated: {models.get('openai', 'N/A')} + {models.get('anthropic', 'N/A')} + {models.get('gemini', 'N/A')}"
                 )
                 
-                await websocket.send_json({
+                await channel.send_json({
                     "type": "model_updated",
                     "content": "Model selection updated",
-                    "models": models
+                    "models": models,
+                    "seq": self.conversation_manager.get_latest_seq(conversation_id)
                 })
         
         elif message_type == "get_conversation":
-            # 会話データを送信
-            conversation = self.conversation_manager.get_conversation(conversation_id)
-            await websocket.send_json({
+            # 会話データを送信（since_seq 指定時は差分のみ）
+            await self._send_conversation(conversation_id, subscriber, data.get("since_seq"))
+    
+    async def _send_conversation(self, conversation_id: str, subscriber: Subscriber, since_seq: Optional[int] = None):
+        """会話全体、または since_seq 以降の差分を要求した購読者にだけ送信"""
+        if since_seq is not None:
+            # クライアントから届いた値なので、整数でなければ接続は維持したままエラーを返す
+            try:
+                since_seq = int(since_seq)
+            except (TypeError, ValueError):
+                await subscriber.send_json({
+                    "type": "error",
+                    "content": f"Invalid since_seq: {since_seq!r}"
+                })
+                return
+            
+            delta = self.conversation_manager.get_conversation_delta(conversation_id, since_seq)
+            if delta:
+                await subscriber.send_json({
+                    "type": "conversation_delta",
+                    "data": delta
+                })
+            return
+        
+        conversation = self.conversation_manager.get_conversation(conversation_id)
+        if conversation:
+            await subscriber.send_json({
                 "type": "conversation_data",
                 "data": conversation
             })
@@ -330,9 +926,9 @@ class WebUIServer:
     def _check_api_availability(self) -> Dict[str, bool]:
         """APIキーの利用可能性をチェック"""
         return {
-            "openai": bool(os.getenv("OPENAI_API_KEY")),
-            "anthropic": bool(os.getenv("ANTHROPIC_API_KEY")),
-            "gemini": bool(os.getenv("GEMINI_API_KEY"))
+            "openai": self.providers.has_api_key("openai"),
+            "anthropic": self.providers.has_api_key("anthropic"),
+            "gemini": self.providers.has_api_key("gemini")
         }
     
     def _has_required_apis(self, ai_mode: str, api_status: Dict[str, bool]) -> bool:
@@ -347,12 +943,12 @@ class WebUIServer:
             return any(api_status.values())  # 少なくとも1つのAPIが利用可能
         return False
     
-    async def _run_offline_simulation(self, conversation_id: str, project_request: str, websocket: WebSocket):
+    async def _run_offline_simulation(self, conversation_id: str, project_request: str, channel: ConversationChannel):
         """オフラインモードでのシミュレーション実行"""
         try:
             print(f"[DEBUG] Running offline simulation for: '{project_request}'")
             
-            await websocket.send_json({
+            await channel.send_json({
                 "type": "system_message", 
                 "content": f"オフラインシミュレーションモードでプロジェクト「{project_request}」を開始します..."
             })
@@ -360,33 +956,35 @@ class WebUIServer:
             # オフライン応答を生成
             response = self.offline_simulator.simulate_offline_response(project_request)
             
-            # 応答をWebSocketに送信
-            await websocket.send_json({
-                "type": "ai_response",
-                "speaker": response["speaker"],
-                "content": response["message"],
-                "simulated": True
-            })
-            
             # 会話に保存
             self.conversation_manager.add_message(
                 conversation_id, response["speaker"], response["message"], 
                 {"simulated": True}
             )
             
-            await websocket.send_json({
+            # 応答をWebSocketに送信
+            await channel.send_json({
+                "type": "ai_response",
+                "speaker": response["speaker"],
+                "content": response["message"],
+                "simulated": True,
+                "seq": self.conversation_manager.get_latest_seq(conversation_id)
+            })
+            await self.flusher.flush(conversation_id)
+            
+            await channel.send_json({
                 "type": "ai_process_complete",
                 "status": "completed",
                 "mode": "offline"
             })
             
         except Exception as e:
-            await websocket.send_json({
+            await channel.send_json({
                 "type": "error",
                 "content": f"オフライン処理エラー: {str(e)}"
             })
     
-    async def _start_ai_process(self, conversation_id: str, data: dict, websocket: WebSocket):
+    async def _start_ai_process(self, conversation_id: str, data: dict, channel: ConversationChannel):
         """AI処理を開始"""
         
         try:
@@ -399,117 +997,112 @@ class WebUIServer:
             
             # オフラインモードの場合
             if ai_mode == "offline":
-                await self._run_offline_simulation(conversation_id, project_request, websocket)
+                await self._run_offline_simulation(conversation_id, project_request, channel)
                 return
             
             # API利用可能性チェック
             api_status = self._check_api_availability()
             if not self._has_required_apis(ai_mode, api_status):
                 # APIキーが不足している場合はオフラインモードに切り替え
-                await websocket.send_json({
+                await channel.send_json({
                     "type": "system_message",
                     "content": f"選択されたモード「{ai_mode}」に必要なAPIキーが不足しています。オフラインシミュレーションモードに切り替えます。"
                 })
-                await self._run_offline_simulation(conversation_id, project_request, websocket)
+                await self._run_offline_simulation(conversation_id, project_request, channel)
                 return
             
-            # AI システムを初期化
-            if not self.ai_system:
-                self.ai_system = EnhancedAICollaboration()
-            
             # もしモデルが指定されていない場合、会話から取得
             if not models:
                 conversation = self.conversation_manager.get_conversation(conversation_id)
                 models = conversation.get("selected_models", {"openai": "gpt-4", "anthropic": "claude-3-sonnet-20240229", "gemini": "gemini-1.5-pro"})
             
             # 処理開始を通知
-            await websocket.send_json({
+            await channel.send_json({
                 "type": "ai_process_started",
                 "content": f"Starting AI collaboration in {mode} mode...\nUsing: {models.get('openai', 'N/A')} + {models.get('anthropic', 'N/A')} + {models.get('gemini', 'N/A')}"
             })
             
-            # AI処理を実行（非同期で）
+            # AI処理を実行（非同期で、スケジューラの実行枠が空いてから開始）
             asyncio.create_task(
-                self._run_ai_collaboration(conversation_id, project_request, mode, websocket, models)
+                self._schedule_ai_collaboration(
+                    conversation_id, project_request, mode, channel, models,
+                    data.get("priority", PRIORITY_INTERACTIVE), bool(data.get("bypass_cache", False))
+                )
             )
             
         except Exception as e:
-            await websocket.send_json({
+            await channel.send_json({
                 "type": "error",
                 "content": f"Error starting AI process: {str(e)}"
             })
     
-    async def _run_ai_collaboration(self, conversation_id: str, project_request: str, mode: str, websocket: WebSocket, models: dict = None):
+    async def _schedule_ai_collaboration(self, conversation_id: str, project_request: str, mode: str,
+                                         channel: ConversationChannel, models: dict = None,
+                                         priority: str = PRIORITY_INTERACTIVE, bypass_cache: bool = False):
+        """スケジューラで実行枠を確保してからAI協調作業を実行（待機中は順番を通知）"""
+        conversation = self.conversation_manager.get_conversation(conversation_id)
+        user_id = conversation.get("user_id", "default") if conversation else "default"
+        
+        def report_position(position: int, waiting: int):
+            self.hub.publish(conversation_id, {
+                "type": "queue_position",
+                "position": position,
+                "waiting": waiting,
+                "priority": priority
+            })
+        
+        async with self.scheduler.slot(user_id, priority, report_position):
+            await self._run_ai_collaboration(conversation_id, project_request, mode, channel, models, bypass_cache)
+    
+    async def _run_ai_collaboration(self, conversation_id: str, project_request: str, mode: str, channel: ConversationChannel,
+                                    models: dict = None, bypass_cache: bool = False):
         """AI協調作業を実行"""
         
         try:
-            # カスタム WebSocket 対話マネージャー
-            class WebSocketInteractionManager(UserInteractionManager):
-                def __init__(self, websocket, conversation_id, conversation_manager):
-                    super().__init__()
-                    self.websocket = websocket
-                    self.conversation_id = conversation_id
-                    self.conversation_manager = conversation_manager
-                    self.pending_decisions = {}
-                
-                async def ask_user_decision_async(self, question: str, options: List[str] = None, default: str = None, context: Dict = None):
-                    """非同期でユーザー決定を求める"""
-                    
-                    decision_id = str(uuid.uuid4())
-                    
-                    # 質問を送信
-                    await self.websocket.send_json({
-                        "type": "user_decision_required",
-                        "decision_id": decision_id,
-                        "question": question,
-                        "options": options or [],
-                        "default": default,
-                        "context": context or {}
-                    })
-                    
-                    # 応答を待機
-                    self.pending_decisions[decision_id] = None
-                    
-                    # タイムアウト付きで応答を待つ
-                    timeout = 300  # 5分
-                    start_time = asyncio.get_event_loop().time()
-                    
-                    while self.pending_decisions[decision_id] is None:
-                        if asyncio.get_event_loop().time() - start_time > timeout:
-                            # タイムアウト時はデフォルト値を使用
-                            response = default or "timeout"
-                            break
-                        
-                        await asyncio.sleep(0.5)
-                    
-                    response = self.pending_decisions.pop(decision_id, default or "no_response")
-                    
-                    # 決定を記録
-                    self.conversation_manager.add_user_decision(
-                        self.conversation_id, question, response, context
-                    )
-                    
-                    return response
+            loop = asyncio.get_running_loop()
             
             # WebSocket対話マネージャーを設定
             websocket_interaction = WebSocketInteractionManager(
-                websocket, conversation_id, self.conversation_manager
+                channel, conversation_id, self.conversation_manager, self.decision_broker, loop
             )
             
-            # AI システムに WebSocket 対話マネージャーを設定
-            self.ai_system.user_interaction = websocket_interaction
-            
             # 進捗更新を送信する関数
             async def send_progress(phase: str, message: str):
-                await websocket.send_json({
+                self.conversation_manager.add_message(
+                    conversation_id, "system", f"[{phase}] {message}"
+                )
+                
+                await channel.send_json({
                     "type": "progress_update",
                     "phase": phase,
-                    "content": message
+                    "content": message,
+                    "seq": self.conversation_manager.get_latest_seq(conversation_id)
                 })
-                
+            
+            # AI応答の断片を全購読者へ配信（保存はせず、完成した応答だけを保存する）
+            def publish_delta(speaker: str, turn: int, delta: str):
+                self.hub.publish(conversation_id, {
+                    "type": "ai_response_delta",
+                    "stream_id": f"{speaker}:{turn}",
+                    "speaker": speaker,
+                    "turn": turn,
+                    "delta": delta
+                })
+            
+            # 完成した応答を1件のメッセージとして保存して送信（使ったモデルの振り分け結果もメタデータに記録）
+            async def send_ai_response(speaker: str, turn: int, content: str, metadata: Dict = None):
                 self.conversation_manager.add_message(
-                    conversation_id, "system", f"[{phase}] {message}"
+                    conversation_id, speaker, content, {"turn": turn, **(metadata or {})}
                 )
+                
+                await channel.send_json({
+                    "type": "ai_response",
+                    "stream_id": f"{speaker}:{turn}",
+                    "speaker": speaker,
+                    "turn": turn,
+                    "content": content,
+                    "seq": self.conversation_manager.get_latest_seq(conversation_id)
+                })
             
             # デフォルトモデル設定
             if not models:
@@ -518,20 +1111,26 @@ class WebUIServer:
             # 各フェーズで進捗を送信
             await send_progress("initialization", f"Initializing AI collaboration system...\nUsing models: {models['openai']} + {models['anthropic']} + {models['gemini']}")
             
-            if mode in ["full", "design"]:
-                await send_progress("design", "Starting design phase with o4...")
-            
-            if mode in ["full", "implementation"]:
-                await send_progress("implementation", "ChatGPT and Claude starting implementation...")
-            
-            # 実際のAI処理を実行
-            results = self.ai_system.run_complete_workflow_with_interaction(project_request, mode)
+            def run_workflow():
+                # 実行ごとに独立したインスタンスを使い、並行実行中の対話マネージャーが混ざらないようにする
+                ai_system = EnhancedAICollaboration()
+                ai_system.user_interaction = websocket_interaction
+                ai_system.models = models
+                ai_system.bypass_cache = bypass_cache
+                ai_system.progress_callback = lambda phase, message: WorkflowRunner.call_in_loop(
+                    loop, send_progress(phase, message)
+                )
+                # 断片は待たずにループへ渡し、完成時の保存はそれまでの断片の配信後に行われる
+                ai_system.delta_callback = lambda speaker, turn, delta: loop.call_soon_threadsafe(
+                    publish_delta, speaker, turn, delta
+                )
+                ai_system.response_callback = lambda speaker, turn, content, metadata: WorkflowRunner.call_in_loop(
+                    loop, send_ai_response(speaker, turn, content, metadata)
+                )
+                return ai_system.run_complete_workflow_with_interaction(project_request, mode)
             
-            # 結果を送信
-            await websocket.send_json({
-                "type": "ai_process_completed",
-                "results": results
-            })
+            # 実際のAI処理をスレッドプールで実行（進捗はイベントループ経由で送信）
+            results = await self.workflow_runner.run(run_workflow)
             
             # 最終メッセージを保存
             self.conversation_manager.add_message(
@@ -539,18 +1138,30 @@ class WebUIServer:
                 "system", 
                 f"AI collaboration completed. Status: {results.get('status', 'unknown')}"
             )
+            self.conversation_manager.update_status(conversation_id, "completed")
+            
+            # 結果を送信
+            await channel.send_json({
+                "type": "ai_process_completed",
+                "results": results,
+                "seq": self.conversation_manager.get_latest_seq(conversation_id)
+            })
+            await self.flusher.flush(conversation_id)
             
         except Exception as e:
             error_message = f"AI collaboration error: {str(e)}"
             
-            await websocket.send_json({
-                "type": "error",
-                "content": error_message
-            })
-            
             self.conversation_manager.add_message(
                 conversation_id, "error", error_message
             )
+            self.conversation_manager.update_status(conversation_id, "error")
+            await self.flusher.flush(conversation_id)
+            
+            await channel.send_json({
+                "type": "error",
+                "content": error_message,
+                "seq": self.conversation_manager.get_latest_seq(conversation_id)
+            })
     
     def run(self, host: str = "localhost", port: int = 8080):
         """サーバーを起動"""
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Workflow Runner - 同期的なAIワークフローをイベントループ外で実行
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable
+
+
+class WorkflowRunner:
+    """上限付きスレッドプールでブロッキングなワークフローを実行する
+
+    ワークフロー内のAPI呼び出しや入力待ちがイベントループを止めないよう、
+    max_workers 件までを並行実行し、それ以上は空きが出るまで待たせる。
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-workflow")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self, func: Callable, *args) -> Any:
+        """func(*args) をスレッドプールで実行して結果を待つ"""
+        loop = asyncio.get_running_loop()
+        state = {"started": False, "cancelled": False}
+        with self._lock:
+            self.queued += 1
+
+        try:
+            return await loop.run_in_executor(self._executor, self._call, func, args, state)
+        except asyncio.CancelledError:
+            with self._lock:
+                # 開始前にキャンセルされた場合は実行せずに待機数から外す
+                if not state["started"]:
+                    state["cancelled"] = True
+                    self.queued -= 1
+            raise
+
+    def _call(self, func: Callable, args: tuple, state: Dict[str, bool]) -> Any:
+        with self._lock:
+            if state["cancelled"]:
+                return None
+            state["started"] = True
+            self.queued -= 1
+            self.running += 1
+
+        try:
+            result = func(*args)
+        except BaseException:
+            with self._lock:
+                self.running -= 1
+                self.failed += 1
+            raise
+
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+        return result
+
+    @staticmethod
+    def call_in_loop(loop: asyncio.AbstractEventLoop, coro, timeout: float = 30.0) -> Any:
+        """ワーカースレッドからイベントループ上のコルーチンを実行して結果を待つ"""
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return future.result(timeout)
+
+    def shutdown(self):
+        """未開始のワークフローを破棄してプールを閉じる"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """実行統計"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed
+            }
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+"""
+テスト共通設定 - src/ をインポートパスに追加
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
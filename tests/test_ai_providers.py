@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+AI Providers（プロバイダー共通クライアント）のテスト - FakeTransport で通信せずに確認
+"""
+
+import pytest
+
+from ai_providers import PROVIDERS, FakeTransport, ProviderError, ProviderRegistry, stream_with_fallback
+from utils.config_manager import ConfigManager
+
+
+@pytest.fixture
+def make_registry(tmp_path, monkeypatch):
+    """設定ファイル・環境変数のAPIキーを読まないレジストリを作る（テスト後にイベントループを停止）"""
+    monkeypatch.chdir(tmp_path)
+    for provider in PROVIDERS:
+        monkeypatch.delenv(f"{provider.upper()}_API_KEY", raising=False)
+        monkeypatch.delenv(f"{provider.upper()}_API_KEYS", raising=False)
+    registries = []
+
+    def make(transport=None, settings=None):
+        config = ConfigManager()
+        for key, value in (settings or {}).items():
+            config.set(key, value)
+        registry = ProviderRegistry(config, transport=transport or FakeTransport())
+        registries.append(registry)
+        return registry
+
+    yield make
+    for registry in registries:
+        registry.close()
+
+
+def failing_responder(status, failures, retry_after=None):
+    """最初の failures 回は HTTP status で失敗し、その後は成功する responder（呼び出し回数を数える）"""
+    calls = []
+
+    def responder(provider, payload):
+        calls.append(provider)
+        if len(calls) <= failures:
+            raise ProviderError(provider, "fake failure", status, retry_after)
+        return f"ok after {len(calls)}"
+    return responder, calls
+
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_generate_parses_each_provider_format(make_registry, provider):
+    """各プロバイダーの応答形式からテキストと使用トークン数を取り出す"""
+    registry = make_registry(FakeTransport(lambda provider, payload: "hello world, from fake"))
+
+    result = registry.generate(provider, "model-a", "prompt", system="be brief")
+
+    assert result["provider"] == provider and result["model"] == "model-a"
+    assert result["text"] == "hello world, from fake"
+    assert result["usage"]["output_tokens"] == len("hello world, from fake") // 4
+    assert result["cached"] is False
+    assert registry.get_stats()["providers"][provider]["requests"] == 1
+
+
+def test_requests_carry_system_prompt_in_provider_format(make_registry):
+    """システムプロンプトと生成設定を各APIのリクエスト形式で送る"""
+    transport = FakeTransport()
+    registry = make_registry(transport)
+
+    for provider in PROVIDERS:
+        registry.generate(provider, "model-a", "prompt", system="be brief", temperature=0.2, max_tokens=50)
+
+    openai, anthropic, gemini = (request["payload"] for request in transport.requests)
+    assert openai["messages"] == [{"role": "system", "content": "be brief"},
+                                  {"role": "user", "content": "prompt"}]
+    assert (openai["temperature"], openai["max_tokens"], openai["stream"]) == (0.2, 50, False)
+    assert anthropic["system"] == "be brief" and anthropic["max_tokens"] == 50
+    assert gemini["systemInstruction"] == {"parts": [{"text": "be brief"}]}
+    assert gemini["generationConfig"] == {"temperature": 0.2, "maxOutputTokens": 50}
+    assert transport.requests[2]["url"].endswith("/model-a:generateContent")
+
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_iter_stream_yields_deltas_in_order(make_registry, provider):
+    """ストリーミング応答は断片として順に返り、つなぐと応答全体になる"""
+    text = "streamed response that spans several chunks"
+    registry = make_registry(FakeTransport(lambda provider, payload: text, chunk_size=8))
+
+    deltas = list(registry.iter_stream(provider, "model-a", "prompt"))
+
+    assert len(deltas) > 1
+    assert "".join(deltas) == text
+    assert registry.transport.requests[0]["payload"].get("stream", True) is True
+
+
+def test_request_errors_are_not_retried(make_registry):
+    """リクエスト自体の誤り（4xx）は再試行せずに失敗を返し、エラーとして数える"""
+    responder, calls = failing_responder(400, failures=1)
+    registry = make_registry(FakeTransport(responder))
+
+    with pytest.raises(ProviderError) as error:
+        registry.generate("openai", "model-a", "prompt")
+
+    assert error.value.status == 400 and error.value.retryable is False
+    assert len(calls) == 1
+    assert registry.get_stats()["providers"]["openai"]["errors"] == 1
+
+
+def test_registry_without_transport_is_unavailable(make_registry):
+    """トランスポートが無いプロバイダーは呼び出せない"""
+    registry = make_registry()
+    registry.transport = None
+
+    assert not any(registry.is_available(provider) for provider in PROVIDERS)
+
+
+def test_stream_with_fallback_uses_fallback_when_nothing_received(make_registry):
+    """何も受信できなかった場合だけ fallback の応答を返す"""
+    responder, _ = failing_responder(400, failures=10)
+    registry = make_registry(FakeTransport(responder))
+
+    failed = "".join(stream_with_fallback(registry, "openai", "model-a", "prompt", lambda: "canned"))
+    registry.transport.responder = lambda provider, payload: "live"
+    live = "".join(stream_with_fallback(registry, "openai", "model-a", "prompt", lambda: "canned"))
+
+    assert (failed, live) == ("canned", "live")
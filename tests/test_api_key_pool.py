@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+API Key Pool（複数のAPIキーへの振り分けと休止）のテスト
+"""
+
+import time
+
+import pytest
+
+from ai_providers import PROVIDERS, FakeTransport, KeysCoolingError, ProviderError, ProviderRegistry
+from api_key_pool import ApiKeyPool
+from utils.config_manager import ConfigManager
+
+
+def test_acquire_prefers_least_loaded_key():
+    """実行中の件数、同じなら累計の呼び出し件数が少ないキーを選ぶ"""
+    pool = ApiKeyPool("openai", ["a", "b"])
+
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    third = pool.acquire()
+
+    assert (first, second, third) == ("a", "b", "a")
+    assert ApiKeyPool("openai", []).acquire() is None
+
+
+def test_rate_limited_key_cools_for_retry_after_and_is_skipped():
+    """429 を受けたキーは Retry-After の間は選ばず、他のキーを使う"""
+    pool = ApiKeyPool("openai", ["a", "b"], cooldown_seconds=60.0)
+    pool.release(pool.acquire(), ProviderError("openai", "slow down", 429, 5.0))
+
+    assert 4.0 < pool.cooling_for("a") <= 5.0
+    assert [pool.acquire() for _ in range(3)] == ["b", "b", "b"]
+    assert pool.has_ready_key()
+    assert pool.get_stats()["available"] == 1
+
+
+def test_every_key_cooling_returns_earliest_ready_key():
+    """全てのキーが休止中なら休止が最も早く終わるキーを返す（cooling_for で待ち時間が分かる）"""
+    pool = ApiKeyPool("openai", ["a", "b"])
+    pool.release(pool.acquire(), ProviderError("openai", "slow down", 429, 30.0))
+    pool.release(pool.acquire(), ProviderError("openai", "slow down", 429, 5.0))
+
+    assert not pool.has_ready_key()
+    assert pool.acquire() == "b"
+    assert 0 < pool.cooling_for("b") <= 5.0
+
+
+def test_auth_errors_and_repeated_failures_cool_keys():
+    """認証エラーは長く休止し、再試行できる失敗は failure_threshold 回続くと休止する（4xx は数えない）"""
+    pool = ApiKeyPool("openai", ["a", "b"], cooldown_seconds=60.0, auth_cooldown_seconds=600.0,
+                      failure_threshold=2)
+    pool.release("a", ProviderError("openai", "unauthorized", 401))
+    for _ in range(5):
+        pool.release("b", ProviderError("openai", "bad request", 400))
+    assert pool.cooling_for("a") > 500 and pool.cooling_for("b") == 0
+
+    pool.release("b", ProviderError("openai", "unavailable", 503))
+    pool.release("b")
+    pool.release("b", ProviderError("openai", "unavailable", 503))
+    assert pool.cooling_for("b") == 0
+    pool.release("b", ProviderError("openai", "unavailable", 503))
+    assert 50 < pool.cooling_for("b") <= 60
+
+
+class KeyedTransport(FakeTransport):
+    """throttled のキーでの呼び出しを Retry-After 付きの 429 で失敗させ、使われたキーを記録する"""
+
+    def __init__(self, throttled, retry_after):
+        super().__init__(lambda provider, payload: "ok")
+        self.throttled = set(throttled)
+        self.retry_after = retry_after
+        self.used_keys = []
+
+    async def post_json(self, provider, url, headers, payload, timeout):
+        key = headers["Authorization"].split(" ", 1)[1]
+        self.used_keys.append((key, time.monotonic()))
+        if key in self.throttled:
+            self.throttled.discard(key)
+            raise ProviderError(provider, "slow down", 429, self.retry_after)
+        return await super().post_json(provider, url, headers, payload, timeout)
+
+
+@pytest.fixture
+def make_registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for provider in PROVIDERS:
+        monkeypatch.delenv(f"{provider.upper()}_API_KEY", raising=False)
+        monkeypatch.delenv(f"{provider.upper()}_API_KEYS", raising=False)
+    registries = []
+
+    def make(transport, keys, max_attempts=3):
+        config = ConfigManager()
+        config.set("ai.openai.api_keys", keys)
+        config.set("ai.resilience.retry", {"max_attempts": max_attempts, "base_delay": 0.001, "max_delay": 0.002})
+        config.set("ai.keys.max_wait_seconds", 1.0)
+        registry = ProviderRegistry(config, transport=transport)
+        registries.append(registry)
+        return registry
+
+    yield make
+    for registry in registries:
+        registry.close()
+
+
+def test_retry_after_429_uses_another_key_without_waiting(make_registry):
+    """429 の再試行は休止していない別のキーで、Retry-After を待たずに行う"""
+    transport = KeyedTransport({"sk-a"}, 30.0)
+    registry = make_registry(transport, ["sk-a", "sk-b"])
+
+    registry.generate("openai", "gpt", "first")
+    registry.generate("openai", "gpt", "second")
+
+    keys = [key for key, _ in transport.used_keys]
+    assert keys == ["sk-a", "sk-b", "sk-b"]
+    assert transport.used_keys[1][1] - transport.used_keys[0][1] < 1.0
+    assert registry.key_pool("openai").cooling_for("sk-a") > 25
+
+
+def test_single_key_retry_waits_for_cooldown(make_registry):
+    """キーが1つなら、429 の再試行は Retry-After（キーの休止）が終わるまで待つ"""
+    transport = KeyedTransport({"sk-a"}, 0.2)
+    registry = make_registry(transport, ["sk-a"])
+
+    assert registry.generate("openai", "gpt", "prompt")["text"] == "ok"
+
+    (_, failed_at), (_, retried_at) = transport.used_keys
+    assert retried_at - failed_at >= 0.2
+
+
+def test_long_cooldown_fails_without_calling(make_registry):
+    """全てのキーの休止が max_wait_seconds より長ければ、呼び出さずにすぐ失敗させる"""
+    transport = KeyedTransport({"sk-a"}, 30.0)
+    registry = make_registry(transport, ["sk-a"], max_attempts=1)
+    with pytest.raises(ProviderError):
+        registry.generate("openai", "gpt", "first")
+
+    started = time.monotonic()
+    with pytest.raises(KeysCoolingError) as error:
+        registry.generate("openai", "gpt", "second")
+
+    assert time.monotonic() - started < 1.0
+    assert error.value.retryable is False and error.value.retry_after > 25
+    assert len(transport.used_keys) == 1
+    assert registry.key_pool("openai").get_stats()["cooling_rejections"] == 1
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Blob Store のテスト
+"""
+
+import json
+import zlib
+
+from blob_store import BlobStore
+from webui_server import ConversationManager
+
+
+def test_round_trip_after_flush(tmp_path):
+    """flush() 後は別のインスタンスからも圧縮された本文を読み出せる"""
+    store = BlobStore(tmp_path)
+    content = "大きな本文 " * 1000
+    digest = store.put(content)
+    assert store.get(digest) == content
+    assert not store._blob_path(digest).exists()
+    store.flush()
+
+    path = store._blob_path(digest)
+    assert path.parent.name == digest[:2]
+    assert zlib.decompress(path.read_bytes()).decode("utf-8") == content
+    reopened = BlobStore(tmp_path)
+    assert reopened.has_refcounts()
+    assert reopened.get(digest) == content
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    """同じ本文は1つのファイルに重複排除し、参照数だけ数える"""
+    store = BlobStore(tmp_path)
+    content = "x" * 5000
+    assert store.put(content) == store.put(content)
+    store.flush()
+
+    stats = store.get_stats()
+    assert (stats["blobs"], stats["references"]) == (1, 2)
+    assert stats["logical_bytes"] == 10000 and stats["unique_bytes"] == 5000
+    assert stats["stored_bytes"] < stats["unique_bytes"]
+    assert len([p for p in tmp_path.glob("*/*")]) == 1
+
+
+def test_release_deletes_blob_after_last_reference(tmp_path):
+    """最後の参照を外すと本文を削除し、書き出し前の本文はファイルを作らない"""
+    store = BlobStore(tmp_path)
+    digest = store.put("shared")
+    store.put("shared")
+    store.flush()
+
+    store.release(digest)
+    assert store._blob_path(digest).exists()
+    store.release(digest)
+    assert not store._blob_path(digest).exists()
+    store.release(digest)
+
+    pending = store.put("never written")
+    store.release(pending)
+    store.flush()
+    assert not store._blob_path(pending).exists()
+    assert json.loads((tmp_path / BlobStore.REFCOUNTS_FILE).read_text()) == {}
+
+
+def test_rebuild_refcounts_removes_unreferenced_blobs(tmp_path):
+    """会話から参照されている本文だけを残して参照数を数え直す"""
+    store = BlobStore(tmp_path)
+    kept = store.put("kept")
+    orphan = store.put("orphan")
+    store.flush()
+
+    assert store.rebuild_refcounts([kept, kept]) == 1
+    assert not store._blob_path(orphan).exists()
+    stats = BlobStore(tmp_path).get_stats()
+    assert (stats["blobs"], stats["references"]) == (1, 2)
+
+
+def test_corrupt_blob_reads_as_empty(tmp_path):
+    """壊れた本文ファイルは例外にせず空文字列を返す"""
+    store = BlobStore(tmp_path)
+    digest = store.put("will be corrupted")
+    store.flush()
+    store._blob_path(digest).write_bytes(b"not zlib")
+
+    assert BlobStore(tmp_path).get(digest) == ""
+
+
+def test_corrupt_refcounts_are_rebuilt_from_conversations(tmp_path):
+    """参照数のファイルが壊れていたら、起動時に会話から数え直す"""
+    def open_manager():
+        return ConversationManager(str(tmp_path), blob_store=BlobStore(tmp_path / "blobs"), blob_threshold=10)
+
+    manager = open_manager()
+    conversation_id = manager.create_conversation("alice", "request")
+    manager.add_message(conversation_id, "assistant", "long response body")
+    (tmp_path / "blobs" / BlobStore.REFCOUNTS_FILE).write_text('{"truncated', encoding="utf-8")
+
+    assert not BlobStore(tmp_path / "blobs").has_refcounts()
+    reopened = open_manager()
+    assert reopened.blob_store.get_stats()["references"] == 1
+    assert reopened.get_conversation(conversation_id)["messages"][0]["content"] == "long response body"
+
+
+def test_manager_stores_large_bodies_by_digest(tmp_path):
+    """閾値を超える本文はスナップショットにダイジェストだけを残す"""
+    manager = ConversationManager(str(tmp_path), blob_store=BlobStore(tmp_path / "blobs"), blob_threshold=10)
+    conversation_id = manager.create_conversation("alice", "request")
+    manager.add_message(conversation_id, "assistant", "long response body")
+    manager.add_message(conversation_id, "user", "short")
+    manager.store.compact(conversation_id)
+
+    snapshot = json.loads((tmp_path / f"{conversation_id}.json").read_text(encoding="utf-8"))
+    assert "content" not in snapshot["messages"][0] and "content_digest" in snapshot["messages"][0]
+    assert snapshot["messages"][1]["content"] == "short"
+    loaded = ConversationManager(str(tmp_path), blob_store=BlobStore(tmp_path / "blobs"), blob_threshold=10)
+    assert [m["content"] for m in loaded.get_conversation(conversation_id)["messages"]] == ["long response body", "short"]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Collaboration Scheduler のテスト
+"""
+
+import asyncio
+
+from collaboration_scheduler import CollaborationScheduler, MIN_WEIGHT, PRIORITY_BATCH
+
+
+async def dispatch_order(scheduler, requests):
+    """1枠のスケジューラに requests=(user_id, priority) を順に積み、実行された順を返す"""
+    order = []
+    release = asyncio.Event()
+
+    async def run(user_id, priority):
+        async with scheduler.slot(user_id, priority):
+            order.append(user_id)
+            await release.wait()
+            release.clear()
+
+    blocker = asyncio.ensure_future(run("blocker", "interactive"))
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(run(user_id, priority)) for user_id, priority in requests]
+    await asyncio.sleep(0)
+    while len(order) < len(requests) + 1:
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    return order[1:]
+
+
+def test_users_take_turns_instead_of_first_come_first_served():
+    """1人が先に大量に積んでも、他のユーザーの要求が順番に割り込む"""
+    scheduler = CollaborationScheduler(max_concurrent=1, max_per_user=1)
+    order = asyncio.run(dispatch_order(scheduler, [("alice", "interactive")] * 3 + [("bob", "interactive")] * 2))
+    assert order == ["alice", "bob", "alice", "bob", "alice"]
+
+
+def test_interactive_requests_run_before_batch():
+    """batch の要求は interactive の要求より後に実行する"""
+    scheduler = CollaborationScheduler(max_concurrent=1, max_per_user=1)
+    order = asyncio.run(dispatch_order(scheduler, [("alice", PRIORITY_BATCH), ("bob", "interactive")]))
+    assert order == ["bob", "alice"]
+
+
+def test_weights_give_heavier_users_more_turns():
+    """重み2のユーザーは重み1のユーザーの2倍の頻度で順番が回る"""
+    scheduler = CollaborationScheduler(max_concurrent=1, max_per_user=1, user_weights={"alice": 2.0})
+    order = asyncio.run(dispatch_order(scheduler, [("alice", "interactive")] * 4 + [("bob", "interactive")] * 2))
+    assert order[:3].count("alice") == 2 and order[:3].count("bob") == 1
+
+
+def test_invalid_weights_are_rejected_at_load():
+    """0・負の重みは最小値に切り上げ、数値でない重みは無視する（ZeroDivisionError にしない）"""
+    scheduler = CollaborationScheduler(user_weights={
+        "zero": 0, "negative": -3, "text": "heavy", "nan": float("nan"), "ok": "2.5"
+    })
+    assert scheduler.user_weights == {"zero": MIN_WEIGHT, "negative": MIN_WEIGHT, "ok": 2.5}
+
+    order = asyncio.run(dispatch_order(
+        CollaborationScheduler(max_concurrent=1, max_per_user=1, user_weights={"zero": 0, "negative": -1}),
+        [("zero", "interactive"), ("negative", "interactive"), ("other", "interactive")]
+    ))
+    assert order[0] == "other" and sorted(order[1:]) == ["negative", "zero"]
+
+
+def test_per_user_limit_lets_other_users_run():
+    """ユーザーごとの上限に達したユーザーの要求は飛ばして他のユーザーに枠を回す"""
+    async def scenario():
+        scheduler = CollaborationScheduler(max_concurrent=3, max_per_user=1)
+        await scheduler.acquire("alice")
+        waiting = asyncio.ensure_future(scheduler.acquire("alice"))
+        await asyncio.sleep(0)
+        await scheduler.acquire("bob")
+        stats = scheduler.get_stats()
+        scheduler.release("alice")
+        await waiting
+        return stats, scheduler.get_stats()
+
+    before, after = asyncio.run(scenario())
+    assert before["running_by_user"] == {"alice": 1, "bob": 1}
+    assert before["waiting_by_user"] == {"alice": 1}
+    assert after["running_by_user"] == {"alice": 1, "bob": 1} and after["waiting"] == 0
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Context Packer（会話履歴のトークン予算への詰め込み）のテスト
+"""
+
+from context_packer import JAPANESE_LABELS, ContextPacker, estimate_tokens, truncate_to_tokens
+
+
+def message(speaker, content):
+    return {"speaker": speaker, "content": content}
+
+
+def test_estimate_tokens_counts_ascii_and_japanese():
+    """ASCIIは4文字で1トークン、日本語は1文字1トークンとして数える"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("設計") == 2
+    assert estimate_tokens("ab設計") == 3
+
+
+def test_truncate_to_tokens_fits_budget_with_marker():
+    """切り詰めた文字列は目印込みで予算に収まる"""
+    text = "word " * 200
+
+    truncated = truncate_to_tokens(text, 20, "...")
+    assert truncated.endswith("...") and estimate_tokens(truncated) <= 20
+    assert truncate_to_tokens("short", 20, "...") == "short"
+
+
+def test_context_window_uses_longest_prefix():
+    """コンテキスト長はモデル名の最も長い接頭辞で決まり、設定で上書きできる"""
+    packer = ContextPacker(context_windows={"custom-model": 1000})
+
+    assert packer.context_window("gpt-4o-mini") == 128000
+    assert packer.context_window("gpt-4-0613") == 8192
+    assert packer.context_window("custom-model-v2") == 1000
+    assert packer.context_window("unknown") == 8192
+    assert packer.budget("custom-model", max_output_tokens=200) == 1000 - 200 - 256
+
+
+def test_everything_fits_within_budget():
+    """予算内なら全メッセージを会話の順に入れる"""
+    packer = ContextPacker()
+    log = [message("chatgpt", "first"), message("claude", "second")]
+
+    text, stats = packer.pack(log, "todo app", "gpt-4o")
+
+    assert text == "Project request: todo app\n\nConversation so far:\nchatgpt: first\nclaude: second"
+    assert (stats["included_messages"], stats["dropped_messages"], stats["dropped_tokens"]) == (2, 0, 0)
+
+
+def test_over_budget_keeps_pinned_and_newest_messages():
+    """予算を超えたら最新・最新のコード・最新の決定事項を優先し、古いものから省略する"""
+    packer = ContextPacker(max_input_tokens=120, reserve_tokens=0)
+    log = [message("chatgpt", "We decided to use SQLite.")]
+    log += [message("claude", f"filler {index} " + "x" * 80) for index in range(6)]
+    log += [message("gemini", "```python\nprint('hi')\n```"), message("chatgpt", "latest")]
+
+    text, stats = packer.pack(log, "todo app", "gpt-4o")
+
+    assert estimate_tokens(text) <= 120
+    assert "We decided to use SQLite." in text and "print('hi')" in text and "latest" in text
+    assert "filler 0" not in text
+    assert text.index("SQLite") < text.index("print('hi')") < text.index("latest")
+    assert f"({stats['dropped_messages']} messages omitted)" in text
+    assert stats["dropped_messages"] > 0 and stats["dropped_tokens"] > 0
+    assert packer.get_stats()["packs"] == 1
+
+
+def test_japanese_labels_and_reserved_text_shrink_budget():
+    """日本語の見出しを使え、別に送る文の分だけ予算が減る"""
+    packer = ContextPacker(max_input_tokens=1000, reserve_tokens=0)
+
+    text, stats = packer.pack([message("claude", "了解")], "タスク管理", "gpt-4o",
+                              reserved_text="x" * 400, labels=JAPANESE_LABELS)
+
+    assert text.startswith("プロジェクトリクエスト: タスク管理\n\n会話履歴:")
+    assert stats["budget"] == 1000 - 100
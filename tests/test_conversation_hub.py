@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Conversation Hub（WebSocket購読者への配信）のテスト
+"""
+
+import asyncio
+import json
+
+from conversation_hub import ConversationHub
+
+
+class FakeWebSocket:
+    """送信したテキストを記録する WebSocket（gate を閉じると送信が止まる遅いクライアント）"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def send_text(self, text):
+        await self.gate.wait()
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def drain():
+    """送信タスクにキューを捌かせる"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_publish_fans_out_to_every_subscriber_in_order():
+    """会話の全購読者に同じ順序で配信し、他の会話には送らない"""
+    async def scenario():
+        hub = ConversationHub()
+        first, second, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        hub.subscribe("c1", first)
+        hub.subscribe("c1", second)
+        hub.subscribe("c2", other)
+
+        assert hub.publish("c1", {"type": "ai_response", "seq": 1}) == 2
+        await hub.channel("c1").send_json({"type": "decision_recorded", "seq": 2})
+        await drain()
+        return hub, first, second, other
+
+    hub, first, second, other = asyncio.run(scenario())
+    assert first.sent == second.sent == [{"type": "ai_response", "seq": 1}, {"type": "decision_recorded", "seq": 2}]
+    assert other.sent == []
+    stats = hub.get_stats()
+    assert (stats["conversations"], stats["subscribers"], stats["published"]) == (2, 3, 2)
+
+
+def test_subscriber_send_json_reaches_only_that_subscriber():
+    """購読者への直接送信（会話データの応答）は他の購読者に届かない"""
+    async def scenario():
+        hub = ConversationHub()
+        first, second = FakeWebSocket(), FakeWebSocket()
+        subscriber = hub.subscribe("c1", first)
+        hub.subscribe("c1", second)
+        await subscriber.send_json({"type": "conversation_data"})
+        await drain()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.sent == [{"type": "conversation_data"}] and second.sent == []
+
+
+def test_unsubscribe_reports_remaining_subscribers():
+    """購読解除は残りの購読者数を返し、最後の購読者が抜けると会話を削除する"""
+    async def scenario():
+        hub = ConversationHub()
+        first = hub.subscribe("c1", FakeWebSocket())
+        second = hub.subscribe("c1", FakeWebSocket())
+        remaining = [await hub.unsubscribe(first), await hub.unsubscribe(second)]
+        return hub, first, remaining
+
+    hub, first, remaining = asyncio.run(scenario())
+    assert remaining == [1, 0]
+    assert hub.subscriber_count("c1") == 0 and first.closed
+    assert hub.publish("c1", {"type": "ai_response"}) == 0
+
+
+def test_slow_subscriber_does_not_delay_others():
+    """送信が止まった購読者がいても他の購読者には届く"""
+    async def scenario():
+        hub = ConversationHub(max_queue=10)
+        slow, fast = FakeWebSocket(), FakeWebSocket()
+        slow.gate.clear()
+        hub.subscribe("c1", slow)
+        hub.subscribe("c1", fast)
+        for seq in range(1, 4):
+            hub.publish("c1", {"type": "ai_response", "seq": seq})
+        await drain()
+        return hub, slow, fast
+
+    hub, slow, fast = asyncio.run(scenario())
+    assert [frame["seq"] for frame in fast.sent] == [1, 2, 3]
+    assert slow.sent == []
+    assert hub.get_stats()["queued"] == 2
+
+
+def test_full_queue_drops_only_deltas_and_disconnects_for_other_frames():
+    """満杯の間は断片だけを破棄し、決定の要求などを積めない場合は切断する"""
+    async def scenario():
+        hub = ConversationHub(max_queue=2, slow_client_timeout=60.0)
+        websocket = FakeWebSocket()
+        websocket.gate.clear()
+        subscriber = hub.subscribe("c1", websocket)
+        for seq in range(1, 4):
+            hub.publish("c1", {"type": "ai_response", "seq": seq})
+            await drain()
+        delta_queued = hub.publish("c1", {"type": "ai_response_delta", "delta": "x"})
+        still_connected = not subscriber.closed
+        decision_queued = hub.publish("c1", {"type": "user_decision_required", "decision_id": "d1"})
+        await drain()
+        return hub, websocket, subscriber, delta_queued, still_connected, decision_queued
+
+    hub, websocket, subscriber, delta_queued, still_connected, decision_queued = asyncio.run(scenario())
+    assert delta_queued == 0 and still_connected
+    assert decision_queued == 0 and subscriber.closed
+    assert websocket.closed_with == 1013
+    stats = hub.get_stats()
+    assert (stats["dropped"], stats["slow_client_disconnects"]) == (1, 1)
+
+
+def test_saturated_subscriber_is_disconnected_after_timeout():
+    """満杯が slow_client_timeout を超えて続くと、断片であっても切断する"""
+    async def scenario():
+        hub = ConversationHub(max_queue=1, slow_client_timeout=0.0)
+        websocket = FakeWebSocket()
+        websocket.gate.clear()
+        subscriber = hub.subscribe("c1", websocket)
+        hub.publish("c1", {"type": "ai_response", "seq": 1})
+        hub.publish("c1", {"type": "ai_response", "seq": 2})
+        await drain()
+        hub.publish("c1", {"type": "ai_response_delta", "delta": "a"})
+        await asyncio.sleep(0.01)
+        hub.publish("c1", {"type": "ai_response_delta", "delta": "b"})
+        await drain()
+        return websocket, subscriber
+
+    websocket, subscriber = asyncio.run(scenario())
+    assert subscriber.closed and websocket.closed_with == 1013
+
+
+def test_progress_updates_are_all_delivered():
+    """同じフェーズの進捗も保存済みのイベントなので間引かずに全て送る"""
+    async def scenario():
+        hub = ConversationHub()
+        websocket = FakeWebSocket()
+        websocket.gate.clear()
+        hub.subscribe("c1", websocket)
+        for seq in range(1, 4):
+            hub.publish("c1", {"type": "progress_update", "phase": "design", "seq": seq})
+        websocket.gate.set()
+        await drain()
+        return websocket
+
+    websocket = asyncio.run(scenario())
+    assert [frame["seq"] for frame in websocket.sent] == [1, 2, 3]
+
+
+def test_full_queue_keeps_latest_progress_per_phase_without_disconnecting():
+    """満杯の間の進捗は同じフェーズの未送信の進捗を最新のものに置き換え、切断しない"""
+    async def scenario():
+        hub = ConversationHub(max_queue=3, slow_client_timeout=60.0)
+        websocket = FakeWebSocket()
+        websocket.gate.clear()
+        subscriber = hub.subscribe("c1", websocket)
+        hub.publish("c1", {"type": "ai_response", "seq": 1})
+        await drain()
+        hub.publish("c1", {"type": "progress_update", "phase": "design", "seq": 2})
+        hub.publish("c1", {"type": "progress_update", "phase": "implementation", "seq": 3})
+        hub.publish("c1", {"type": "ai_response", "seq": 4})
+        for seq in range(5, 8):
+            hub.publish("c1", {"type": "progress_update", "phase": "design", "seq": seq})
+        hub.publish("c1", {"type": "progress_update", "phase": "implementation", "seq": 8})
+        still_connected = not subscriber.closed
+        websocket.gate.set()
+        await drain()
+        return hub, websocket, still_connected
+
+    hub, websocket, still_connected = asyncio.run(scenario())
+    assert still_connected and websocket.closed_with is None
+    assert [frame["seq"] for frame in websocket.sent] == [1, 4, 7, 8]
+    stats = hub.get_stats()
+    assert (stats["coalesced"], stats["dropped"], stats["slow_client_disconnects"]) == (4, 0, 0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+WebUI の ConversationManager（キャッシュ・書き込みの集約・差分同期）のテスト
+"""
+
+import asyncio
+import threading
+
+from webui_server import ConversationManager, ConversationFlusher
+
+
+def test_evicted_conversation_is_reloaded_from_disk(tmp_path):
+    """キャッシュから追い出した会話は次のアクセスでストアから読み直す"""
+    manager = ConversationManager(str(tmp_path), cache_max_entries=1)
+    first = manager.create_conversation("alice", "first")
+    manager.add_message(first, "user", "hello")
+    second = manager.create_conversation("alice", "second")
+
+    assert first not in manager.cache
+    conversation = manager.get_conversation(first)
+    assert [m["content"] for m in conversation["messages"]] == ["hello"]
+    assert first in manager.cache and second not in manager.cache
+    assert manager.get_conversation("missing") is None
+
+
+def make_write_behind_manager(tmp_path, **kwargs):
+    """書き出しをテスト側で制御する write_behind の ConversationManager と書き出し要求の記録"""
+    manager = ConversationManager(str(tmp_path), write_behind=True, **kwargs)
+    notified = []
+    manager.on_flush_needed = lambda: notified.append(True)
+    return manager, notified
+
+
+def record_store_writes(store):
+    """ストアへの書き込みメソッドの呼び出しを記録する"""
+    writes = []
+
+    def recording(name, method):
+        def wrapper(*args):
+            writes.append(name)
+            return method(*args)
+        return wrapper
+
+    for name in ("append_events", "checkpoint", "save_snapshot"):
+        setattr(store, name, recording(name, getattr(store, name)))
+    return writes
+
+
+def test_write_behind_batches_events_until_flush(tmp_path):
+    """イベントは flush() までメモリに溜め、閾値に達したら書き出しを要求する"""
+    manager, notified = make_write_behind_manager(tmp_path, flush_threshold=3)
+    conversation_id = manager.create_conversation("alice", "request")
+    manager.add_message(conversation_id, "user", "one")
+    manager.add_message(conversation_id, "user", "two")
+    assert not (tmp_path / f"{conversation_id}.events.jsonl").exists()
+    assert notified == []
+
+    manager.add_message(conversation_id, "user", "three")
+    assert notified == [True]
+    assert manager.flush() == 3
+    assert manager.get_pending_count() == 0
+
+    reloaded = ConversationManager(str(tmp_path)).get_conversation(conversation_id)
+    assert [m["content"] for m in reloaded["messages"]] == ["one", "two", "three"]
+
+
+def test_eviction_hands_writes_to_background_flusher(tmp_path):
+    """追い出しでは書き出さず、バックグラウンドの書き出しで統合する"""
+    manager, notified = make_write_behind_manager(tmp_path, cache_max_entries=1)
+    writes = record_store_writes(manager.store)
+
+    first = manager.create_conversation("alice", "first")
+    manager.add_message(first, "user", "hello")
+    writes.clear()
+    manager.create_conversation("alice", "second")
+    evicting_writes = [name for name in writes if name != "save_snapshot"]
+
+    assert first not in manager.cache
+    assert evicting_writes == []
+    assert notified and manager.has_pending_writes()
+
+    manager.flush()
+    assert "append_events" in writes and "checkpoint" in writes
+    assert not manager.has_pending_writes()
+    assert not (tmp_path / f"{first}.events.jsonl").exists()
+    reloaded = ConversationManager(str(tmp_path)).get_conversation(first)
+    assert [m["content"] for m in reloaded["messages"]] == ["hello"]
+
+
+def test_evicted_conversation_is_served_before_it_is_flushed(tmp_path):
+    """書き出し前に追い出された会話へのアクセスは、ディスクの古い内容ではなく最新の内容を返す"""
+    manager, _ = make_write_behind_manager(tmp_path, cache_max_entries=1)
+    first = manager.create_conversation("alice", "first")
+    manager.add_message(first, "user", "unflushed")
+    manager.create_conversation("alice", "second")
+
+    conversation = manager.get_conversation(first)
+    assert [m["content"] for m in conversation["messages"]] == ["unflushed"]
+    manager.add_message(first, "user", "more")
+    manager.flush()
+
+    reloaded = ConversationManager(str(tmp_path)).get_conversation(first)
+    assert [m["content"] for m in reloaded["messages"]] == ["unflushed", "more"]
+
+
+def test_flusher_writes_in_background_on_threshold(tmp_path):
+    """ConversationFlusher は閾値到達で前倒しして書き出し、停止時に残りを書き出す"""
+    manager = ConversationManager(str(tmp_path), write_behind=True, flush_threshold=2)
+    flusher = ConversationFlusher(manager, flush_interval=60.0)
+
+    async def scenario():
+        await flusher.start()
+        conversation_id = manager.create_conversation("alice", "request")
+        manager.add_message(conversation_id, "user", "one")
+        manager.add_message(conversation_id, "user", "two")
+        for _ in range(100):
+            if manager.get_pending_count() == 0:
+                break
+            await asyncio.sleep(0.01)
+        flushed_by_threshold = manager.get_pending_count() == 0
+        manager.add_message(conversation_id, "user", "three")
+        await flusher.stop()
+        return conversation_id, flushed_by_threshold
+
+    conversation_id, flushed_by_threshold = asyncio.run(scenario())
+    assert flushed_by_threshold
+    reloaded = ConversationManager(str(tmp_path)).get_conversation(conversation_id)
+    assert [m["content"] for m in reloaded["messages"]] == ["one", "two", "three"]
+
+
+def test_load_during_flush_waits_for_the_write(tmp_path):
+    """書き出し中に追い出された会話を読むと書き出しの完了を待ち、古い内容で seq を重複させない"""
+    manager, _ = make_write_behind_manager(tmp_path, cache_max_entries=1)
+    first = manager.create_conversation("alice", "first")
+    manager.add_message(first, "user", "one")
+    manager.add_message(first, "user", "two")
+    manager.create_conversation("alice", "second")
+
+    writing, release = threading.Event(), threading.Event()
+    append_events = manager.store.append_events
+
+    def slow_append_events(conversation, events):
+        writing.set()
+        release.wait(5)
+        return append_events(conversation, events)
+
+    manager.store.append_events = slow_append_events
+    flushing = threading.Thread(target=manager.flush)
+    flushing.start()
+    assert writing.wait(5)
+
+    adding = threading.Thread(target=manager.add_message, args=(first, "user", "three"))
+    adding.start()
+    adding.join(0.1)
+    assert adding.is_alive()
+    release.set()
+    flushing.join(5)
+    adding.join(5)
+    manager.flush()
+
+    messages = ConversationManager(str(tmp_path)).get_conversation(first)["messages"]
+    assert [(m["content"], m["seq"]) for m in messages] == [("one", 1), ("two", 2), ("three", 3)]
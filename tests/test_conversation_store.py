@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Conversation Store のテスト
+"""
+
+import json
+
+import pytest
+
+from conversation_store import (
+    JSONLConversationStore, SQLiteConversationStore, ConversationManifest, ConversationCache, estimate_size,
+    EVENT_MESSAGE_ADDED, EVENT_DECISION_RECORDED, EVENT_STATUS_CHANGED, make_event,
+    paginate_summaries, encode_cursor, decode_cursor, items_since
+)
+
+
+def new_conversation(conversation_id, created_at="2024-01-01T00:00:00", user_id="default"):
+    return {
+        "id": conversation_id,
+        "user_id": user_id,
+        "project_request": f"request {conversation_id}",
+        "created_at": created_at,
+        "status": "active",
+        "messages": [],
+        "user_decisions": [],
+        "event_seq": 0
+    }
+
+
+def add_message(store, conversation, content):
+    """メッセージを会話に追加してイベントとして追記"""
+    seq = conversation["event_seq"] + 1
+    message = {"id": f"m{seq}", "type": "user", "content": content, "timestamp": "t", "seq": seq}
+    conversation["messages"].append(message)
+    conversation["event_seq"] = seq
+    event = make_event(EVENT_MESSAGE_ADDED, {"message": message})
+    event["seq"] = seq
+    store.append_event(conversation, event)
+    return message
+
+
+def test_jsonl_round_trip_replays_event_log(tmp_path):
+    """スナップショット + イベントログから会話を復元"""
+    store = JSONLConversationStore(tmp_path, snapshot_interval=50)
+    conversation = new_conversation("c1")
+    store.save_snapshot(conversation)
+    for i in range(3):
+        add_message(store, conversation, f"hello {i}")
+    status = make_event(EVENT_STATUS_CHANGED, {"status": "completed"})
+    status["seq"] = 4
+    conversation["status"] = "completed"
+    store.append_event(conversation, status)
+
+    loaded = JSONLConversationStore(tmp_path, snapshot_interval=50).load("c1")
+    assert [m["content"] for m in loaded["messages"]] == ["hello 0", "hello 1", "hello 2"]
+    assert loaded["status"] == "completed"
+    assert loaded["event_seq"] == 4
+    assert (tmp_path / "c1.events.jsonl").exists()
+
+
+def test_jsonl_compacts_after_snapshot_interval(tmp_path):
+    """イベント数が snapshot_interval に達するとログを切り詰める"""
+    store = JSONLConversationStore(tmp_path, snapshot_interval=3)
+    conversation = new_conversation("c1")
+    store.save_snapshot(conversation)
+    for i in range(3):
+        add_message(store, conversation, f"m{i}")
+
+    assert not (tmp_path / "c1.events.jsonl").exists()
+    snapshot = json.loads((tmp_path / "c1.json").read_text(encoding="utf-8"))
+    assert len(snapshot["messages"]) == 3
+    assert store.load("c1")["event_seq"] == 3
+
+
+def test_jsonl_skips_corrupt_and_torn_event_lines(tmp_path):
+    """壊れた行・書きかけの末尾行は無視して残りを再生"""
+    store = JSONLConversationStore(tmp_path)
+    conversation = new_conversation("c1")
+    store.save_snapshot(conversation)
+    add_message(store, conversation, "first")
+    with open(tmp_path / "c1.events.jsonl", "a", encoding="utf-8") as f:
+        f.write("{not json}\n")
+    add_message(store, conversation, "second")
+    with open(tmp_path / "c1.events.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"type": "message_added", "data": {"mes')
+
+    loaded = JSONLConversationStore(tmp_path).load("c1")
+    assert [m["content"] for m in loaded["messages"]] == ["first", "second"]
+
+
+def test_jsonl_does_not_reapply_events_already_in_snapshot(tmp_path):
+    """スナップショット書き込み後・ログ削除前のクラッシュでもイベントを二重適用しない"""
+    store = JSONLConversationStore(tmp_path)
+    conversation = new_conversation("c1")
+    store.save_snapshot(conversation)
+    add_message(store, conversation, "once")
+    log = (tmp_path / "c1.events.jsonl").read_text(encoding="utf-8")
+    store.save_snapshot(conversation)
+    (tmp_path / "c1.events.jsonl").write_text(log, encoding="utf-8")
+
+    loaded = JSONLConversationStore(tmp_path).load("c1")
+    assert [m["content"] for m in loaded["messages"]] == ["once"]
+
+
+def test_jsonl_checkpoint_only_writes_pending_events(tmp_path):
+    """未統合のイベントがある場合だけスナップショットに統合"""
+    store = JSONLConversationStore(tmp_path)
+    conversation = new_conversation("c1")
+    store.save_snapshot(conversation)
+    store.checkpoint(conversation)
+    add_message(store, conversation, "pending")
+    store.checkpoint(conversation)
+
+    assert not (tmp_path / "c1.events.jsonl").exists()
+    assert JSONLConversationStore(tmp_path).load("c1")["messages"][0]["content"] == "pending"
+    assert store.load("missing") is None
+
+
+def test_sqlite_round_trip_and_events(tmp_path):
+    """SQLiteストアで会話・メッセージ・決定・ステータスを保存して読み戻す"""
+    store = SQLiteConversationStore(tmp_path / "conversations.db")
+    conversation = new_conversation("c1")
+    conversation["selected_models"] = {"gemini": "gemini-1.5-pro"}
+    conversation["custom"] = {"kept": True}
+    store.save_snapshot(conversation)
+    add_message(store, conversation, "こんにちは")
+    decision = {"id": "d1", "question": "q?", "answer": "yes", "context": {"a": 1}, "timestamp": "t", "seq": 2}
+    event = make_event(EVENT_DECISION_RECORDED, {"decision": decision})
+    event["seq"] = 2
+    store.append_event(conversation, event)
+    store.close()
+
+    reopened = SQLiteConversationStore(tmp_path / "conversations.db")
+    loaded = reopened.load("c1")
+    assert loaded["messages"][0]["content"] == "こんにちは"
+    assert loaded["user_decisions"][0]["answer"] == "yes"
+    assert loaded["user_decisions"][0]["context"] == {"a": 1}
+    assert loaded["selected_models"] == {"gemini": "gemini-1.5-pro"}
+    assert loaded["custom"] == {"kept": True}
+    assert loaded["event_seq"] == 2
+    summary = reopened.get_summary("c1")
+    assert (summary["message_count"], summary["decision_count"]) == (1, 1)
+    assert reopened.load("missing") is None
+    reopened.close()
+
+
+def test_sqlite_lists_by_user_newest_first(tmp_path):
+    """一覧はユーザーで絞り込み、作成日時の降順"""
+    store = SQLiteConversationStore(tmp_path / "conversations.db")
+    store.import_conversations([
+        new_conversation("a", "2024-01-01T00:00:00", "alice"),
+        new_conversation("b", "2024-01-03T00:00:00", "alice"),
+        new_conversation("c", "2024-01-02T00:00:00", "bob"),
+    ])
+
+    assert [s["id"] for s in store.list_summaries("alice")] == ["b", "a"]
+    assert [s["id"] for s in store.list_summaries()] == ["b", "c", "a"]
+    store.close()
+
+
+def test_sqlite_imports_json_directory(tmp_path):
+    """既存のJSONスナップショットとイベントログを一括インポート"""
+    source = JSONLConversationStore(tmp_path / "json", use_manifest=False)
+    conversation = new_conversation("c1")
+    source.save_snapshot(conversation)
+    add_message(source, conversation, "from log")
+
+    store = SQLiteConversationStore(tmp_path / "conversations.db")
+    assert store.import_json_directory(tmp_path / "json") == 1
+    assert store.load("c1")["messages"][0]["content"] == "from log"
+    store.close()
+
+
+def test_manifest_lists_without_reading_bodies(tmp_path):
+    """一覧はマニフェストだけから返す（会話本体が無くても一覧できる）"""
+    store = JSONLConversationStore(tmp_path)
+    for i, created_at in enumerate(["2024-01-02", "2024-01-01", "2024-01-03"]):
+        conversation = new_conversation(f"c{i}", created_at)
+        store.save_snapshot(conversation)
+        add_message(store, conversation, "x")
+    (tmp_path / "c0.json").unlink()
+
+    summaries = JSONLConversationStore(tmp_path).list_summaries()
+    assert [s["id"] for s in summaries] == ["c2", "c0", "c1"]
+    assert summaries[0]["message_count"] == 1
+
+
+def test_manifest_truncates_long_requests_to_record_size(tmp_path):
+    """長い依頼内容は固定長レコードに収まるよう切り詰める"""
+    manifest = ConversationManifest(tmp_path / "manifest.dat")
+    conversation = new_conversation("long")
+    conversation["project_request"] = "長い依頼" * 500
+    manifest.update(conversation)
+
+    assert (tmp_path / "manifest.dat").stat().st_size == ConversationManifest.RECORD_SIZE
+    record = ConversationManifest(tmp_path / "manifest.dat").get("long")
+    assert conversation["project_request"].startswith(record["project_request"])
+
+
+def test_manifest_corrupt_record_does_not_lose_other_conversations(tmp_path):
+    """壊れたレコードの後に追加した会話が、有効なレコードのスロットを上書きしない"""
+    path = tmp_path / "manifest.dat"
+    manifest = ConversationManifest(path)
+    for conversation_id in ("c0", "c1", "c2"):
+        manifest.update(new_conversation(conversation_id))
+    with open(path, "r+b") as f:
+        f.seek(ConversationManifest.RECORD_SIZE)
+        f.write(b"\xff" * 10)
+
+    reloaded = ConversationManifest(path)
+    assert sorted(s["id"] for s in reloaded.summaries()) == ["c0", "c2"]
+    reloaded.update(new_conversation("c3"))
+    reloaded.update(new_conversation("c4"))
+
+    final = ConversationManifest(path)
+    assert sorted(s["id"] for s in final.summaries()) == ["c0", "c2", "c3", "c4"]
+    assert path.stat().st_size == 4 * ConversationManifest.RECORD_SIZE
+
+
+def test_store_restores_corrupt_manifest_record_from_snapshot(tmp_path):
+    """壊れたレコードの会話は起動時にスナップショットから追加し直す"""
+    store = JSONLConversationStore(tmp_path)
+    for conversation_id in ("c0", "c1", "c2"):
+        store.save_snapshot(new_conversation(conversation_id))
+    with open(tmp_path / "manifest.dat", "r+b") as f:
+        f.seek(ConversationManifest.RECORD_SIZE)
+        f.write(b'{"broken": ')
+
+    reopened = JSONLConversationStore(tmp_path)
+    assert sorted(s["id"] for s in reopened.list_summaries()) == ["c0", "c1", "c2"]
+    assert sorted(s["id"] for s in JSONLConversationStore(tmp_path).list_summaries()) == ["c0", "c1", "c2"]
+
+
+def test_manifest_rebuild_from_conversations(tmp_path):
+    """マニフェストを削除すると会話データから再構築"""
+    store = JSONLConversationStore(tmp_path)
+    for conversation_id in ("c0", "c1"):
+        store.save_snapshot(new_conversation(conversation_id))
+    (tmp_path / "manifest.dat").unlink()
+
+    reopened = JSONLConversationStore(tmp_path)
+    assert sorted(s["id"] for s in reopened.list_summaries()) == ["c0", "c1"]
+    assert reopened.rebuild_manifest() == 2
+
+
+def test_cache_evicts_least_recently_used_entry():
+    """件数の上限を超えると最も長く使われていない会話を on_evict に渡して追い出す"""
+    evicted = []
+    cache = ConversationCache(max_entries=2, on_evict=lambda cid, conversation: evicted.append(cid))
+    cache.put("a", new_conversation("a"))
+    cache.put("b", new_conversation("b"))
+    assert cache.get("a") is not None
+    cache.put("c", new_conversation("c"))
+
+    assert evicted == ["b"]
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.get("b") is None
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+
+
+def test_cache_byte_limit_keeps_most_recent_entry():
+    """バイト数の上限を超えても直近の1件は残す"""
+    conversation = new_conversation("a")
+    cache = ConversationCache(max_entries=10, max_bytes=estimate_size(conversation) + 10)
+    cache.put("a", conversation)
+    cache.put("b", new_conversation("b"))
+    assert len(cache) == 1 and "b" in cache
+
+    cache.grow("b", 10 ** 6)
+    assert "b" in cache
+    cache.discard("b")
+    assert len(cache) == 0 and cache.get_stats()["bytes"] == 0
+
+
+def paged_ids(store, **kwargs):
+    """カーソルをたどって全ページの会話IDを集める"""
+    pages = []
+    after = None
+    while True:
+        page = store.page_summaries(after=after, **kwargs)
+        pages.append([item["id"] for item in page["items"]])
+        if page["next"] is None:
+            return pages, page["total"]
+        after = page["next"]
+
+
+def seed_for_paging(store):
+    """同じ作成日時を含む5件（c3 のみ完了済み、c4 のみ bob）"""
+    for conversation_id, created_at in [("c0", "2024-01-01"), ("c1", "2024-01-02"), ("c2", "2024-01-02"),
+                                        ("c3", "2024-01-03"), ("c4", "2024-01-04")]:
+        conversation = new_conversation(conversation_id, created_at, "bob" if conversation_id == "c4" else "alice")
+        if conversation_id == "c3":
+            conversation["status"] = "completed"
+        store.save_snapshot(conversation)
+
+
+def test_manifest_and_sqlite_page_in_the_same_order(tmp_path):
+    """マニフェストと SQLite は同じ (created_at, id) の降順でページングする"""
+    stores = [
+        JSONLConversationStore(tmp_path / "jsonl"),
+        JSONLConversationStore(tmp_path / "plain", use_manifest=False),
+        SQLiteConversationStore(tmp_path / "conversations.db"),
+    ]
+    for store in stores:
+        seed_for_paging(store)
+        assert paged_ids(store, limit=2) == ([["c4", "c3"], ["c2", "c1"], ["c0"]], 5)
+        assert paged_ids(store, user_id="alice", limit=3) == ([["c3", "c2", "c1"], ["c0"]], 4)
+        assert paged_ids(store, user_id="alice", statuses=["active"], limit=2) == ([["c2", "c1"], ["c0"]], 3)
+        assert paged_ids(store, statuses=["completed"], limit=1) == ([["c3"]], 1)
+        assert paged_ids(store, user_id="nobody") == ([[]], 0)
+    stores[2].close()
+
+
+def test_page_exact_multiple_has_no_empty_trailing_page(tmp_path):
+    """件数が limit ちょうどの場合は次のカーソルを返さない"""
+    store = JSONLConversationStore(tmp_path)
+    seed_for_paging(store)
+    page = store.page_summaries(limit=5)
+    assert len(page["items"]) == 5 and page["next"] is None
+    assert "user_id" not in page["items"][0]
+
+
+def test_cursor_round_trip_and_invalid_cursor():
+    """カーソルはページングキーに戻せ、不正な文字列は ValueError"""
+    key = ("2024-01-02T00:00:00", "会話-1")
+    cursor = encode_cursor(key)
+    assert "=" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor) == key
+
+    for invalid in ["", "not-a-cursor", encode_cursor(("only-one",)), "!!!"]:
+        with pytest.raises(ValueError):
+            decode_cursor(invalid)
+
+
+def test_paginate_summaries_after_key():
+    """メモリ上の一覧も after キーより後ろだけを返し、total は絞り込み前の件数"""
+    summaries = [{"id": f"c{i}", "created_at": f"2024-01-0{i + 1}"} for i in range(4)]
+    first = paginate_summaries(summaries, limit=3)
+    assert [s["id"] for s in first["items"]] == ["c3", "c2", "c1"]
+    second = paginate_summaries(summaries, limit=3, after=first["next"])
+    assert [s["id"] for s in second["items"]] == ["c0"]
+    assert (second["next"], second["total"]) == (None, 4)
+
+
+def test_items_since_returns_only_newer_items():
+    """since_seq より大きい seq の要素だけを返し、0 以下なら全件"""
+    items = [{"seq": seq} for seq in (1, 2, 5, 7)]
+    assert items_since(items, 2) == [{"seq": 5}, {"seq": 7}]
+    assert items_since(items, 7) == []
+    assert items_since(items, 0) == items and items_since(items, -3) == items
+    assert items_since([], 4) == []
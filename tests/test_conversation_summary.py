@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Conversation Summary（古いターンのローリング要約）のテスト
+"""
+
+import time
+
+from ai_providers import FakeTransport, ProviderError, ProviderRegistry
+from context_packer import ContextPacker, estimate_tokens
+from conversation_summary import RollingSummary, create_rolling_summary, extract_summary_lines
+from utils.config_manager import ConfigManager
+
+
+def conversation(count):
+    return [{"speaker": "claude", "content": f"Message number {index} about the storage layer design"}
+            for index in range(count)]
+
+
+def wait_for_fold(summary, folds=1):
+    """別スレッドでの要約の更新を待つ"""
+    deadline = time.monotonic() + 5
+    while summary.get_stats()["folds"] < folds and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_extract_summary_lines_prefers_decisions_and_skips_code():
+    """決定事項の行は重要度が高く、コードブロックの中身と重複した行は候補にしない"""
+    messages = [
+        {"speaker": "chatgpt", "content": "Some general chatter here\nWe decided to use SQLite storage\n"
+                                          "```python\nprint('this is code')\n```"},
+        {"speaker": "claude", "content": "We decided to use SQLite storage"}
+    ]
+
+    scored = dict((line, score) for score, line in extract_summary_lines(messages))
+
+    assert list(scored) == ["chatgpt: Some general chatter here", "chatgpt: We decided to use SQLite storage"]
+    assert scored["chatgpt: We decided to use SQLite storage"] > scored["chatgpt: Some general chatter here"]
+
+
+def test_update_folds_every_interval_and_keeps_recent_messages():
+    """直近 keep_recent 件より前のメッセージが interval 件たまるごとに要約へ畳み込む"""
+    summary = RollingSummary(interval=4, keep_recent=2, max_tokens=40)
+
+    summary.update(conversation(5))
+    assert summary.snapshot() == ("", 0)
+    summary.update(conversation(6))
+    text, covered = summary.snapshot()
+    assert covered == 4 and "Message number 3" in text
+    summary.update(conversation(40))
+    text, covered = summary.snapshot()
+    assert covered == 38 and estimate_tokens(text) <= 40
+    assert summary.get_stats()["folds"] == 2
+
+
+def test_packer_replaces_folded_messages_with_summary():
+    """要約に畳み込み済みのメッセージの代わりに要約をプロンプトに入れる"""
+    summary = RollingSummary(interval=4, keep_recent=2)
+    log = conversation(6)
+    summary.update(log)
+
+    text, stats = ContextPacker().pack(log, "todo app", "gpt-4o", summary=summary)
+
+    assert "Summary of earlier conversation:" in text
+    assert "claude: Message number 4" in text and "claude: Message number 5" in text
+    assert (stats["summarized_messages"], stats["included_messages"]) == (4, 2)
+
+
+def make_registry(tmp_path, monkeypatch, responder):
+    monkeypatch.chdir(tmp_path)
+    return ProviderRegistry(ConfigManager(), transport=FakeTransport(responder))
+
+
+def test_model_summary_runs_in_background(tmp_path, monkeypatch):
+    """model を指定すると安価なモデルで要約する"""
+    registry = make_registry(tmp_path, monkeypatch, lambda provider, payload: "- storage uses SQLite")
+    summary = RollingSummary(interval=4, keep_recent=2, provider="gemini", model="gemini-flash",
+                             providers=registry)
+    try:
+        summary.update(conversation(6))
+        wait_for_fold(summary)
+    finally:
+        registry.close()
+
+    assert summary.snapshot() == ("- storage uses SQLite", 4)
+    assert summary.get_stats()["model_folds"] == 1
+    assert "Message number 0" in registry.transport.requests[0]["payload"]["contents"][0]["parts"][0]["text"]
+
+
+def test_model_failure_falls_back_to_extractive_summary(tmp_path, monkeypatch):
+    """モデルでの要約に失敗したら抽出型の要約を使う"""
+    def responder(provider, payload):
+        raise ProviderError(provider, "bad request", 400)
+
+    registry = make_registry(tmp_path, monkeypatch, responder)
+    summary = RollingSummary(interval=4, keep_recent=2, provider="gemini", model="gemini-flash",
+                             providers=registry)
+    try:
+        summary.update(conversation(6))
+        wait_for_fold(summary)
+    finally:
+        registry.close()
+
+    text, covered = summary.snapshot()
+    assert covered == 4 and "Message number 0" in text
+    assert summary.get_stats()["model_errors"] == 1
+
+
+def test_create_rolling_summary_can_be_disabled(tmp_path, monkeypatch):
+    """ai.summary.enabled が false なら要約しない"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager()
+    config.set("ai.summary", {"enabled": False})
+
+    assert create_rolling_summary(config) is None
+    assert create_rolling_summary(ConfigManager()).model is None
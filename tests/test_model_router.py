@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Model Router（フェーズ・プロンプトの大きさ・応答時間によるモデルの階層の選択）のテスト
+"""
+
+import time
+
+import pytest
+
+from ai_providers import get_provider_registry
+from conversation_engine import ConversationEngine
+from latency_tracker import LatencyTracker
+from model_router import ModelRouter
+from utils.config_manager import ConfigManager
+
+TIERS = {"gemini": ["gemini-1.5-flash", "gemini-1.5-pro"]}
+
+
+def make_router(latency=None, **kwargs):
+    return ModelRouter(latency or LatencyTracker(), TIERS, slo_seconds=10.0, min_samples=3, **kwargs)
+
+
+def test_default_keeps_design_and_implementation_on_strongest_tier():
+    """既定では設計・実装フェーズとも最も高性能な階層を使う"""
+    router = make_router(fast_phases=ConfigManager().get("ai.routing.fast_phases"))
+
+    for phase in ("design", "implementation", "conversation"):
+        decision = router.route("gemini", "gemini-1.5-flash", 100, phase)
+        assert (decision["model"], decision["reason"]) == ("gemini-1.5-pro", "default")
+    assert router.get_stats()["decisions"] == {"default": 3}
+
+
+def test_configured_fast_phase_uses_fast_tier():
+    """fast_phases に指定したフェーズだけが速い階層を使う"""
+    router = make_router(fast_phases=["conversation"])
+
+    conversation = router.route("gemini", "gemini-1.5-pro", 100)
+    design = router.route("gemini", "gemini-1.5-pro", 100, "design")
+
+    assert (conversation["model"], conversation["reason"]) == ("gemini-1.5-flash", "phase")
+    assert (design["model"], design["reason"]) == ("gemini-1.5-pro", "default")
+
+
+def test_large_prompts_use_fast_tier():
+    """large_prompt_tokens を超えるプロンプトは速い階層を使う"""
+    router = make_router(large_prompt_tokens=1000)
+
+    decision = router.route("gemini", "gemini-1.5-pro", 5000, "implementation")
+
+    assert (decision["model"], decision["reason"]) == ("gemini-1.5-flash", "prompt_size")
+
+
+def test_slow_tier_falls_back_when_over_slo():
+    """応答時間の p95 が SLO を超えた階層は速い階層へ切り替える"""
+    latency = LatencyTracker()
+    router = make_router(latency)
+    for _ in range(3):
+        latency.record("gemini", "gemini-1.5-pro", 20.0)
+
+    decision = router.route("gemini", "gemini-1.5-pro", 100, "implementation")
+
+    assert (decision["model"], decision["reason"]) == ("gemini-1.5-flash", "latency_slo")
+    assert decision["latency_p"] is None
+
+
+
+def test_slow_tier_is_used_again_after_its_samples_expire(monkeypatch):
+    """SLO を超えて切り替えた階層も、記録が max_age 秒より古くなれば再び使い、速くなっていれば使い続ける"""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    latency = LatencyTracker(max_age=300.0)
+    router = make_router(latency)
+    for _ in range(3):
+        latency.record("gemini", "gemini-1.5-pro", 60.0)
+
+    stepped_down = [router.route("gemini", "gemini-1.5-pro", 100)["model"] for _ in range(1000)]
+    now[0] += 301.0
+    probe = router.route("gemini", "gemini-1.5-pro", 100)
+    for _ in range(3):
+        latency.record("gemini", "gemini-1.5-pro", 2.0)
+    recovered = router.route("gemini", "gemini-1.5-pro", 100)
+
+    assert set(stepped_down) == {"gemini-1.5-flash"}
+    assert (probe["model"], probe["reason"]) == ("gemini-1.5-pro", "default")
+    assert (recovered["model"], recovered["latency_p"]) == ("gemini-1.5-pro", 2.0)
+    assert latency.count("gemini", "gemini-1.5-pro") == 3
+
+@pytest.mark.parametrize("provider, model, enabled", [
+    ("gemini", "gemini-custom", True),
+    ("openai", "gpt-4o", True),
+    ("gemini", "gemini-1.5-pro", False)
+])
+def test_unlisted_models_and_disabled_routing_are_fixed(provider, model, enabled):
+    """階層に無いモデル・振り分けが無効な場合は要求されたモデルを使う"""
+    decision = make_router(enabled=enabled).route(provider, model, 100, "design")
+
+    assert (decision["model"], decision["reason"]) == (model, "fixed")
+
+
+def test_design_conversation_records_routing_on_strongest_tier(tmp_path, monkeypatch):
+    """設計フェーズの会話の Gemini の呼び出しは高性能な階層のまま振り分けられ、メタデータに記録される"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(get_provider_registry(), "is_available", lambda provider: False)
+    engine = ConversationEngine(ConfigManager())
+
+    log = engine.start_conversation("todo app", max_turns=3, models={"gemini": "gemini-1.5-pro"},
+                                    phase="design")["conversation_log"]
+
+    routing = log[2]["routing"]
+    assert log[2]["speaker"] == "gemini"
+    assert (routing["phase"], routing["model"], routing["reason"]) == ("design", "gemini-1.5-pro", "default")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter（RPM / TPM のトークンバケット）と、キャンセル・失敗した呼び出しの見積もりの返却のテスト
+"""
+
+import time
+import asyncio
+
+import pytest
+
+from ai_providers import PROVIDERS, FakeTransport, ProviderError, ProviderRegistry
+from rate_limiter import RateLimiter, RateLimiterRegistry, TokenBucket
+from utils.config_manager import ConfigManager
+
+
+def test_refund_wakes_waiting_caller():
+    """残量が足りない呼び出しは待ち、見積もりが戻されるとすぐに進む"""
+    async def scenario():
+        bucket = TokenBucket(60)
+        await bucket.acquire(60)
+        waiter = asyncio.ensure_future(bucket.acquire(30))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        started = time.monotonic()
+        bucket.adjust(-60)
+        await asyncio.wait_for(waiter, 1)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.5
+
+
+def test_reconcile_replaces_estimate_with_actual_usage():
+    """呼び出し後に見積もりを実際の使用トークン数で置き換える"""
+    async def scenario():
+        limiter = RateLimiter(rpm=10, tpm=1000)
+        await limiter.acquire(400)
+        limiter.reconcile(400, 100)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.get_stats()["used_tokens"] == 100
+    assert limiter.tokens.tokens == pytest.approx(900, abs=1)
+
+
+def test_cancelled_wait_returns_reserved_request():
+    """トークン数の空きを待つ間にキャンセルされた呼び出しは、確保したリクエスト数を戻す"""
+    async def scenario():
+        limiter = RateLimiter(rpm=10, tpm=100)
+        await limiter.acquire(100)
+        waiter = asyncio.ensure_future(limiter.acquire(50))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.requests.tokens == pytest.approx(9, abs=0.1)
+    stats = limiter.get_stats()
+    assert (stats["calls"], stats["queued"], stats["used_tokens"]) == (1, 0, 100)
+
+
+def test_registry_reads_model_limits(tmp_path, monkeypatch):
+    """モデルごとの上限はプロバイダーの上限を上書きし、上限の無い組み合わせは待たせない"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager()
+    config.set("ai.openai.rpm", 100)
+    config.set("ai.openai.model_limits", {"gpt-mini": {"rpm": 500, "tpm": 9000}})
+    registry = RateLimiterRegistry(config)
+
+    assert registry.limiter("openai", "key", "gpt").requests.per_minute == 100
+    assert registry.limiter("openai", "key", "gpt-mini").tokens.per_minute == 9000
+    assert registry.limiter("gemini", "key", "gemini-pro") is None
+    assert "openai/" + RateLimiterRegistry.key_id("key") + "/gpt" in registry.get_stats()["limits"]
+
+
+class SlowModelTransport(FakeTransport):
+    """slow_models のモデルへの呼び出し（ストリーミングは最初の断片）だけ遅いトランスポート"""
+
+    def __init__(self, slow_models, delay, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_models = slow_models
+        self.delay = delay
+
+    async def post_json(self, provider, url, headers, payload, timeout):
+        if payload.get("model") in self.slow_models:
+            await asyncio.sleep(self.delay)
+        return await super().post_json(provider, url, headers, payload, timeout)
+
+    async def stream_events(self, provider, url, headers, payload, timeout):
+        if payload.get("model") in self.slow_models:
+            await asyncio.sleep(self.delay)
+        async for event in super().stream_events(provider, url, headers, payload, timeout):
+            yield event
+
+
+@pytest.fixture
+def make_registry(tmp_path, monkeypatch):
+    """openai / anthropic に RPM・TPM の上限を設定したレジストリを作る"""
+    monkeypatch.chdir(tmp_path)
+    for provider in PROVIDERS:
+        monkeypatch.delenv(f"{provider.upper()}_API_KEY", raising=False)
+        monkeypatch.delenv(f"{provider.upper()}_API_KEYS", raising=False)
+    registries = []
+
+    def make(transport, hedging=False):
+        config = ConfigManager()
+        for provider in ("openai", "anthropic"):
+            config.set(f"ai.{provider}.rpm", 1000)
+            config.set(f"ai.{provider}.tpm", 100000)
+        config.set("ai.resilience.retry.max_attempts", 1)
+        config.set("ai.hedging", {"enabled": hedging, "min_samples": 3,
+                                  "alternates": {"openai": {"provider": "anthropic", "model": "claude-haiku"}}})
+        registry = ProviderRegistry(config, transport=transport)
+        for _ in range(3):
+            registry.latency.record("openai", "gpt", 0.01)
+            registry.first_token_latency.record("openai", "gpt", 0.01)
+        registries.append(registry)
+        return registry
+
+    yield make
+    for registry in registries:
+        registry.close()
+
+
+def settled_usage(registry, provider, model):
+    """ループ上のキャンセル処理が終わってから、そのモデルの使用トークン数を返す"""
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), registry._get_loop()).result(5)
+    return registry.rate_limits.limiter(provider, None, model).get_stats()["used_tokens"]
+
+
+def test_failed_call_returns_estimate(make_registry):
+    """失敗した呼び出しはトークンを使っていないものとして見積もりを戻す"""
+    def responder(provider, payload):
+        raise ProviderError(provider, "unavailable", 503)
+
+    registry = make_registry(FakeTransport(responder))
+    with pytest.raises(ProviderError):
+        registry.generate("openai", "gpt", "prompt")
+
+    assert settled_usage(registry, "openai", "gpt") == 0
+
+
+def test_cancelled_hedge_loser_returns_estimate(make_registry):
+    """予備の呼び出しに負けてキャンセルされた呼び出しの見積もりを戻す"""
+    registry = make_registry(SlowModelTransport({"gpt"}, 5.0), hedging=True)
+
+    result = registry.generate("openai", "gpt", "prompt")
+
+    assert result["provider"] == "anthropic"
+    assert settled_usage(registry, "openai", "gpt") == 0
+    assert settled_usage(registry, "anthropic", "claude-haiku") > 0
+
+
+def test_cancelled_streaming_hedge_loser_returns_estimate(make_registry):
+    """予備のストリームに負けて最初の断片の前にキャンセルされたストリームの見積もりを戻す"""
+    registry = make_registry(SlowModelTransport({"gpt"}, 5.0), hedging=True)
+
+    text = "".join(registry.iter_stream("openai", "gpt", "prompt"))
+
+    assert text == "[anthropic] fake response"
+    assert settled_usage(registry, "openai", "gpt") == 0
+
+
+def test_abandoned_stream_keeps_only_received_usage(make_registry):
+    """途中で受信をやめたストリームは、受信した分だけを使用量として見積もりを戻す"""
+    registry = make_registry(FakeTransport(lambda provider, payload: "x" * 400, latency=0.02, chunk_size=8))
+    estimate = registry._estimate_tokens("openai", "prompt", None, {})
+
+    stream = registry.iter_stream("openai", "gpt", "prompt")
+    first = next(stream)
+    stream.close()
+
+    used = settled_usage(registry, "openai", "gpt")
+    assert first == "x" * 8
+    assert 0 < used < estimate
+    assert registry.client("openai").in_flight == 0
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Request Hedging（遅い呼び出しへの予備の呼び出し）のテスト
+"""
+
+import asyncio
+
+import pytest
+
+from ai_providers import FakeTransport, ProviderRegistry
+from latency_tracker import LatencyTracker
+from request_hedging import HedgePolicy
+from response_cache import ResponseCache
+from utils.config_manager import ConfigManager
+
+ALTERNATES = {"openai": {"provider": "anthropic", "model": "claude-haiku"},
+              "gemini": {"model": "gemini-flash"}}
+
+
+def make_policy(**kwargs):
+    return HedgePolicy(LatencyTracker(), LatencyTracker(), ALTERNATES, min_samples=3, enabled=True, **kwargs)
+
+
+def answer(value, delay=0.0, fail=False):
+    """delay 秒後に value を返す（fail なら失敗する）呼び出し。開始・キャンセルを記録する"""
+    events = []
+
+    async def call():
+        events.append("started")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+        if fail:
+            raise RuntimeError(value)
+        return value
+    return call, events
+
+
+def test_alternate_requires_enabled_policy_and_another_model():
+    """無効な場合・設定が無い場合・同じモデルの場合は重ねない"""
+    policy = make_policy()
+
+    assert policy.alternate("openai", "gpt") == ("anthropic", "claude-haiku")
+    assert policy.alternate("gemini", "gemini-pro") == ("gemini", "gemini-flash")
+    assert policy.alternate("gemini", "gemini-flash") is None
+    assert policy.alternate("anthropic", "claude") is None
+    assert HedgePolicy(LatencyTracker(), LatencyTracker(), ALTERNATES).alternate("openai", "gpt") is None
+
+
+def test_delay_waits_for_enough_samples():
+    """記録が min_samples 件たまるまでは待ち時間を決めない（ストリーミングは最初の断片までの時間）"""
+    policy = make_policy()
+    for _ in range(2):
+        policy.latency.record("openai", "gpt", 1.0)
+    assert policy.delay("openai", "gpt") is None
+
+    policy.latency.record("openai", "gpt", 1.0)
+    assert policy.delay("openai", "gpt") == pytest.approx(1.0)
+    assert policy.delay("openai", "gpt", streaming=True) is None
+
+
+def test_fast_primary_is_not_hedged():
+    """待ち時間までに終わった呼び出しには重ねない"""
+    policy = make_policy()
+    primary, _ = answer("primary")
+    secondary, secondary_events = answer("secondary")
+
+    result = asyncio.run(policy.race(primary, secondary, 0.5))
+
+    assert result == ("primary", False)
+    assert secondary_events == []
+    assert policy.get_stats()["hedged"] == 0
+
+
+def test_slow_primary_loses_to_hedge_and_is_cancelled():
+    """待ち時間を過ぎた呼び出しに予備を重ね、先に終わった予備を使ってもう一方をキャンセルする"""
+    policy = make_policy()
+    primary, primary_events = answer("primary", delay=5.0)
+    secondary, _ = answer("secondary")
+
+    result = asyncio.run(policy.race(primary, secondary, 0.01))
+
+    assert result == ("secondary", True)
+    assert primary_events == ["started", "cancelled"]
+    stats = policy.get_stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_budget_limits_hedge_rate():
+    """予算を使い切ると重ねずに元の呼び出しを待つ"""
+    policy = make_policy(burst=1.0, max_hedge_rate=0.0)
+
+    async def scenario():
+        results = []
+        for _ in range(2):
+            primary, _ = answer("primary", delay=0.03)
+            secondary, _ = answer("secondary")
+            results.append(await policy.race(primary, secondary, 0.01))
+        return results
+
+    assert asyncio.run(scenario()) == [("secondary", True), ("primary", False)]
+    assert policy.get_stats()["budget_denied"] == 1
+
+
+def test_failed_hedge_falls_back_to_primary_and_double_failure_raises_primary_error():
+    """予備が失敗しても元の呼び出しを待ち、両方失敗したら元の呼び出しの例外を送出する"""
+    policy = make_policy()
+    primary, _ = answer("primary", delay=0.05)
+    secondary, _ = answer("secondary", fail=True)
+    assert asyncio.run(policy.race(primary, secondary, 0.01)) == ("primary", False)
+
+    primary, _ = answer("primary error", delay=0.05, fail=True)
+    secondary, _ = answer("secondary error", fail=True)
+    with pytest.raises(RuntimeError, match="primary error"):
+        asyncio.run(policy.race(primary, secondary, 0.01))
+
+
+class SlowModelTransport(FakeTransport):
+    """slow_models のモデルへの呼び出しだけ遅いトランスポート"""
+
+    def __init__(self, slow_models, delay):
+        super().__init__(lambda provider, payload: f"{provider}:{payload['model']}")
+        self.slow_models = slow_models
+        self.delay = delay
+
+    async def post_json(self, provider, url, headers, payload, timeout):
+        if payload.get("model") in self.slow_models:
+            await asyncio.sleep(self.delay)
+        return await super().post_json(provider, url, headers, payload, timeout)
+
+
+def test_registry_hedges_slow_generate_and_skips_caching_alternate(tmp_path, monkeypatch):
+    """遅いモデルへの呼び出しは予備のプロバイダーの応答を返し、別モデルの応答はキャッシュしない"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager()
+    config.set("ai.hedging", {"enabled": True, "min_samples": 3, "alternates": ALTERNATES})
+    registry = ProviderRegistry(config, transport=SlowModelTransport({"gpt"}, 5.0),
+                                cache=ResponseCache(tmp_path / "cache"))
+    for _ in range(3):
+        registry.latency.record("openai", "gpt", 0.01)
+    try:
+        result = registry.generate("openai", "gpt", "prompt")
+    finally:
+        registry.close()
+
+    assert (result["provider"], result["model"], result["text"]) == ("anthropic", "claude-haiku",
+                                                                     "anthropic:claude-haiku")
+    assert registry.cache.get_stats()["stores"] == 0
+    assert registry.hedging.get_stats()["hedge_wins"] == 1
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Resilience（サーキットブレーカー・ジッター付き再試行）のテスト
+"""
+
+import time
+import email.utils
+
+import pytest
+
+import enhanced_ai_collaboration
+from ai_providers import PROVIDERS, FakeTransport, ProviderError, ProviderRegistry, _retry_after
+from enhanced_ai_collaboration import EnhancedAICollaboration
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, RetryPolicy
+from utils.config_manager import ConfigManager
+
+
+def test_backoff_is_jittered_within_cap():
+    """待ち時間は 0〜min(max_delay, base_delay * 2^attempt) の範囲"""
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+
+    delays = [policy.backoff(attempt) for attempt in range(6) for _ in range(20)]
+
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert all(policy.backoff(0) <= 0.5 for _ in range(20))
+
+
+def test_delay_honours_retry_after():
+    """Retry-After が指定されていればバックオフより短くは待たない"""
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0, max_retry_after=60.0)
+
+    assert all(policy.delay(0, 30.0) == 30.0 for _ in range(20))
+    assert all(policy.delay(0, None) <= 0.5 for _ in range(20))
+
+
+def test_delay_refuses_retry_after_over_cap():
+    """Retry-After が max_retry_after（既定は max_delay）を超えれば待たずに None を返す"""
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+
+    assert policy.delay(0, 2.0) == 2.0
+    assert policy.delay(0, 3600.0) is None
+    assert policy.get_stats()["retry_after_exceeded"] == 1
+
+
+def test_retries_limited_by_attempts_and_budget():
+    """再試行は max_attempts 回まで、予算を使い切ったらしない"""
+    policy = RetryPolicy(max_attempts=3, budget_ratio=0.0, budget_burst=2.0)
+
+    assert [policy.can_retry(attempt) for attempt in range(3)] == [True, True, False]
+    assert policy.can_retry(0) is False
+    assert policy.get_stats()["budget_exhausted"] == 1
+
+
+def test_breaker_opens_on_failures_and_recovers_through_half_open(monkeypatch):
+    """失敗率がしきい値を超えると open、open_seconds 後の試しの1件が成功すると closed に戻る"""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("openai", failure_rate=0.5, window=4, min_calls=4, open_seconds=10.0)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success)
+
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(10.0)
+    now[0] += 10.0
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.get_state()["rejected"] == 2
+
+
+def test_retry_after_header_accepts_seconds_and_dates():
+    """Retry-After は秒数と日時のどちらの形式でも秒数にする"""
+    class Response:
+        def __init__(self, value):
+            self.headers = {"Retry-After": value} if value is not None else {}
+
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+
+    assert _retry_after(Response("12")) == 12.0
+    assert 25.0 <= _retry_after(Response(date)) <= 30.0
+    assert _retry_after(Response("soon")) is None
+    assert _retry_after(Response(None)) is None
+
+
+@pytest.fixture
+def make_registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for provider in PROVIDERS:
+        monkeypatch.delenv(f"{provider.upper()}_API_KEY", raising=False)
+        monkeypatch.delenv(f"{provider.upper()}_API_KEYS", raising=False)
+    registries = []
+
+    def make(responder):
+        config = ConfigManager()
+        config.set("ai.resilience.retry", {"base_delay": 0.001, "max_delay": 0.002})
+        registry = ProviderRegistry(config, transport=FakeTransport(responder))
+        registries.append(registry)
+        return registry
+
+    yield make
+    for registry in registries:
+        registry.close()
+
+
+def throttled_once(status, retry_after):
+    """最初の呼び出しだけ status（Retry-After 付き）で失敗し、各呼び出しの時刻を記録する responder"""
+    calls = []
+
+    def responder(provider, payload):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise ProviderError(provider, "slow down", status, retry_after)
+        return "ok"
+    return responder, calls
+
+
+@pytest.mark.parametrize("status", [429, 503])
+@pytest.mark.parametrize("streaming", [False, True])
+def test_provider_retry_waits_for_retry_after(make_registry, status, streaming):
+    """429 / 503 の再試行はバックオフが短くても Retry-After の秒数まで待つ"""
+    responder, calls = throttled_once(status, 0.2)
+    registry = make_registry(responder)
+
+    if streaming:
+        text = "".join(registry.iter_stream("openai", "gpt", "prompt"))
+    else:
+        text = registry.generate("openai", "gpt", "prompt")["text"]
+
+    assert text == "ok"
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.2
+    assert registry.get_stats()["retries"]["retries"] == 1
+
+
+def test_phase_retry_waits_for_retry_after(tmp_path, monkeypatch):
+    """フェーズの再試行もプロバイダーの Retry-After 以上待つ"""
+    monkeypatch.chdir(tmp_path)
+    slept = []
+    monkeypatch.setattr(enhanced_ai_collaboration.time, "sleep", slept.append)
+    system = EnhancedAICollaboration()
+
+    system._wait_before_retry(1, ProviderError("openai", "slow down", 429, 12.0))
+    system._wait_before_retry(1, ValueError("not a provider error"))
+
+    assert slept[0] == 12.0
+    assert slept[1] <= system.phase_retry.base_delay
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_oversized_retry_after_fails_fast(make_registry, streaming):
+    """Retry-After が max_retry_after を超える 429 / 503 は待たずに再試行せず失敗させる"""
+    responder, calls = throttled_once(503, 3600.0)
+    registry = make_registry(responder)
+    started = time.monotonic()
+
+    with pytest.raises(ProviderError) as error:
+        if streaming:
+            "".join(registry.iter_stream("openai", "gpt", "prompt"))
+        else:
+            registry.generate("openai", "gpt", "prompt")
+
+    assert time.monotonic() - started < 1.0
+    assert error.value.retry_after == 3600.0 and len(calls) == 1
+    stats = registry.get_stats()["retries"]
+    assert (stats["retries"], stats["retry_after_exceeded"]) == (0, 1)
+
+
+def test_phase_does_not_retry_on_oversized_retry_after(tmp_path, monkeypatch):
+    """フェーズの再試行も Retry-After が system.retry_max_delay を超えれば待たずにやめる"""
+    monkeypatch.chdir(tmp_path)
+    slept = []
+    monkeypatch.setattr(enhanced_ai_collaboration.time, "sleep", slept.append)
+    system = EnhancedAICollaboration()
+
+    waited = system._wait_before_retry(1, ProviderError("openai", "slow down", 429, 3600.0))
+
+    assert waited is False and slept == []
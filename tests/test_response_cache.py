@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Response Cache（ペルソナ応答のキャッシュ）のテスト
+"""
+
+import time
+
+from ai_providers import FakeTransport, ProviderRegistry
+from response_cache import ResponseCache
+from utils.config_manager import ConfigManager
+
+
+def test_key_ignores_config_order_and_separates_requests():
+    """生成設定の順序はキーに影響せず、プロンプト・モデルが違えば別のキーになる"""
+    key = ResponseCache.make_key("openai", "gpt", {"temperature": 0.2, "max_tokens": 10}, "sys", "hi")
+
+    assert key == ResponseCache.make_key("openai", "gpt", {"max_tokens": 10, "temperature": 0.2}, "sys", "hi")
+    assert key != ResponseCache.make_key("openai", "gpt", {"max_tokens": 10, "temperature": 0.2}, "sys", "hey")
+    assert key != ResponseCache.make_key("openai", "gpt-mini", {"max_tokens": 10, "temperature": 0.2}, "sys", "hi")
+
+
+def test_entries_survive_restart_through_disk(tmp_path):
+    """保存した応答はメモリから返り、作り直したキャッシュではディスクから返る"""
+    cache = ResponseCache(tmp_path)
+    cache.put("ab" * 32, "cached text", "openai", "gpt")
+
+    assert cache.get("ab" * 32) == "cached text"
+    assert cache.get("cd" * 32) is None
+    reopened = ResponseCache(tmp_path)
+    assert reopened.get("ab" * 32) == "cached text"
+    stats = reopened.get_stats()
+    assert (stats["disk_hits"], stats["disk_entries"]) == (1, 1)
+    assert reopened.get("ab" * 32) == "cached text"
+    assert reopened.get_stats()["memory_hits"] == 1
+
+
+def test_expired_entries_are_removed(tmp_path, monkeypatch):
+    """ttl を過ぎた応答は返さず、ディスクからも削除する"""
+    cache = ResponseCache(tmp_path, ttl=60)
+    cache.put("ab" * 32, "old")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+
+    assert cache.get("ab" * 32) is None
+    assert ResponseCache(tmp_path).get_stats()["disk_entries"] == 0
+    assert cache.get_stats()["expired"] == 1
+
+
+def test_disk_evicts_oldest_entries_over_limit(tmp_path):
+    """ディスクの合計が上限を超えたら古い応答から削除する"""
+    cache = ResponseCache(tmp_path, max_disk_bytes=250)
+    for index in range(3):
+        cache.put(f"{index:02d}" * 32, "x" * 50)
+
+    fresh = ResponseCache(tmp_path)
+    assert fresh.get("00" * 32) is None
+    assert fresh.get("02" * 32) == "x" * 50
+    assert cache.get_stats()["disk_evictions"] >= 1
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    """壊れたファイルは読み出し時に削除して未保存として扱う"""
+    ResponseCache(tmp_path).put("ab" * 32, "text")
+    (tmp_path / "ab" / f"{'ab' * 32}.json").write_text("{broken", encoding="utf-8")
+
+    cache = ResponseCache(tmp_path)
+    assert cache.get("ab" * 32) is None
+    assert not (tmp_path / "ab" / f"{'ab' * 32}.json").exists()
+
+
+def test_registry_serves_repeated_calls_from_cache(tmp_path, monkeypatch):
+    """同じリクエストはプロバイダーを呼ばずにキャッシュから返し、bypass_cache は呼び出して更新する"""
+    monkeypatch.chdir(tmp_path)
+    transport = FakeTransport(lambda provider, payload: f"answer {len(transport.requests)}")
+    registry = ProviderRegistry(ConfigManager(), transport=transport, cache=ResponseCache(tmp_path / "cache"))
+    try:
+        first = registry.generate("openai", "gpt", "prompt")
+        second = registry.generate("openai", "gpt", "prompt")
+        bypassed = registry.generate("openai", "gpt", "prompt", bypass_cache=True)
+        streamed = "".join(registry.iter_stream("openai", "gpt", "prompt"))
+    finally:
+        registry.close()
+
+    assert (first["cached"], second["cached"], bypassed["cached"]) == (False, True, False)
+    assert second["text"] == first["text"] == "answer 1"
+    assert bypassed["text"] == streamed == "answer 2"
+    assert len(transport.requests) == 2
+    assert registry.cache.get_stats()["bypassed"] == 1
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Search Index のテスト
+"""
+
+from search_index import ConversationSearchIndex, tokenize
+from webui_server import ConversationManager
+
+
+def message(message_id, content, seq=1):
+    return {"id": message_id, "type": "user", "content": content, "timestamp": "t", "seq": seq}
+
+
+def test_tokenize_words_and_japanese_bigrams():
+    """英数字は小文字の単語、日本語は2文字ずつのバイグラム"""
+    assert tokenize("Hello World_2") == ["hello", "world_2"]
+    assert tokenize("データベース") == ["デー", "ータ", "タベ", "ベー", "ース"]
+    assert tokenize("猫 と API") == ["api", "猫", "と"]
+    assert tokenize("!!!") == []
+
+
+def test_search_ranks_and_isolates_users(tmp_path):
+    """検索は利用者自身の会話だけを対象に、関連度の高い順に返す"""
+    index = ConversationSearchIndex()
+    index.add_document("c1", "alice", message("m1", "python web server with python"))
+    index.add_document("c1", "alice", message("m2", "database schema design", 2))
+    index.add_document("c2", "alice", message("m3", "a python script", 1))
+    index.add_document("c3", "bob", message("m4", "python python python", 1))
+
+    results = index.search("Python", "alice")
+    assert [r["message_id"] for r in results] == ["m1", "m3"]
+    assert results[0]["score"] > results[1]["score"]
+    assert index.search("python", "carol") == []
+    assert index.search("   ", "alice") == []
+    assert [r["message_id"] for r in index.search("python", "alice", limit=1)] == ["m1"]
+
+
+def test_search_japanese_text():
+    """日本語のメッセージを部分文字列で検索できる"""
+    index = ConversationSearchIndex()
+    index.add_document("c1", "alice", message("m1", "ユーザー認証機能を追加してください"))
+    index.add_document("c1", "alice", message("m2", "画面のデザインを変更", 2))
+
+    assert [r["message_id"] for r in index.search("認証", "alice")] == ["m1"]
+    assert index.search("認証", "alice")[0]["preview"].startswith("ユーザー認証")
+
+
+def test_index_persists_and_skips_duplicates_and_corrupt_lines(tmp_path):
+    """書き出したインデックスを再生して復元し、壊れた行と同じメッセージの再登録は無視する"""
+    path = tmp_path / "search_index.jsonl"
+    index = ConversationSearchIndex(path)
+    index.add_document("c1", "alice", message("m1", "persistent search"))
+    index.add_document("c1", "alice", message("m1", "persistent search"))
+    assert not path.exists() and index.get_stats()["pending_writes"] == 1
+    index.flush()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"conversation_id": "c1", "us')
+
+    reloaded = ConversationSearchIndex(path)
+    assert len(reloaded) == 1
+    assert reloaded.search("persistent", "alice")[0]["conversation_id"] == "c1"
+    stats = reloaded.get_stats()
+    assert (stats["documents"], stats["users"], stats["pending_writes"]) == (1, 1, 0)
+
+
+def test_manager_rebuilds_missing_index_from_conversations(tmp_path):
+    """インデックスが無い状態で起動すると既存の会話から再構築する"""
+    manager = ConversationManager(str(tmp_path), search_index=ConversationSearchIndex(tmp_path / "index.jsonl"))
+    conversation_id = manager.create_conversation("alice", "search project")
+    manager.add_message(conversation_id, "user", "kubernetes deployment")
+    (tmp_path / "index.jsonl").unlink()
+
+    rebuilt = ConversationManager(str(tmp_path), search_index=ConversationSearchIndex(tmp_path / "index.jsonl"))
+    results = rebuilt.search("kubernetes", "alice")
+    assert [r["conversation_id"] for r in results] == [conversation_id]
+    assert results[0]["project_request"] == "search project"
+    assert rebuilt.search("kubernetes", "bob") == []
+
+
+def test_search_scores_common_terms_alongside_rare_ones():
+    """珍しい語とよく出現する語を組み合わせた検索でも、よく出現する語だけに一致するメッセージを返す"""
+    index = ConversationSearchIndex()
+    index.add_document("c1", "alice", message("m1", "python deploy"))
+    index.add_document("c1", "alice", message("m2", "python tests", 2))
+    index.add_document("c1", "alice", message("m3", "python api", 3))
+    index.add_document("c1", "alice", message("m4", "kubernetes cluster", 4))
+
+    results = index.search("kubernetes python", "alice")
+    common_only = index.search("python", "alice")
+
+    assert [r["message_id"] for r in results][0] == "m4"
+    assert {r["message_id"] for r in results} == {"m1", "m2", "m3", "m4"}
+    assert results[1]["score"] == common_only[0]["score"] > 0
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Single Flight（実行中の同じAI呼び出しの共有）のテスト
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from ai_providers import FakeTransport, ProviderRegistry
+from single_flight import SingleFlight
+from utils.config_manager import ConfigManager
+
+
+def test_concurrent_calls_with_same_key_share_one_call():
+    """同じキーの同時の呼び出しは1回だけ実行し、後から来た呼び出しを coalesced に数える"""
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"text": "shared"}
+
+        results = await asyncio.gather(*(flights.do("k", factory) for _ in range(3)),
+                                       flights.do("other", factory))
+        again = await flights.do("k", factory)
+        return calls, results, again, flights.get_stats()
+
+    calls, results, again, stats = asyncio.run(scenario())
+
+    assert len(calls) == 3
+    assert [r["coalesced"] for r in results] == [False, True, True, False]
+    assert all(r["text"] == "shared" for r in results)
+    assert again["coalesced"] is False
+    assert stats == {"in_flight": 0, "leaders": 3, "coalesced": 2}
+
+
+def test_failure_reaches_every_waiter():
+    """共有した呼び出しの失敗は待っている全員に返る"""
+    async def scenario():
+        flights = SingleFlight()
+
+        async def factory():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        return await asyncio.gather(flights.do("k", factory), flights.do("k", factory), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    """待っている呼び出しがキャンセルされても共有の呼び出しは最後まで実行する"""
+    async def scenario():
+        flights = SingleFlight()
+
+        async def factory():
+            await asyncio.sleep(0.02)
+            return {"text": "done"}
+
+        first = asyncio.ensure_future(flights.do("k", factory))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flights.do("k", factory))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario())["text"] == "done"
+
+
+def drain(subscription):
+    items = []
+    while not subscription.empty():
+        items.append(subscription.get())
+    return items
+
+
+def test_late_stream_subscriber_replays_received_parts():
+    """途中から参加した受信者は受信済みの断片を受け取ってから続きを受け取る"""
+    flights = SingleFlight()
+    started = []
+    flight, first = flights.join_stream("k", started.append)
+    flight.publish("a")
+    same, second = flights.join_stream("k", started.append)
+    flight.publish("b")
+    flights.end_stream("k", flight)
+
+    assert same is flight and started == [flight]
+    assert drain(first) == drain(second) == [("delta", "a"), ("delta", "b"), ("end", None)]
+    assert flights.get_stats()["coalesced"] == 1
+
+
+def test_stream_is_cancelled_only_when_every_subscriber_leaves():
+    """全員が受信をやめた時だけストリームの呼び出しをキャンセルする"""
+    class FakeFuture:
+        cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    flights = SingleFlight()
+    future = FakeFuture()
+    flight, first = flights.join_stream("k", lambda flight: future)
+    _, second = flights.join_stream("k", lambda flight: pytest.fail("must not start twice"))
+
+    flights.leave_stream("k", flight, first)
+    assert future.cancelled is False
+    flights.leave_stream("k", flight, second)
+    assert future.cancelled is True
+    assert flights.get_stats()["in_flight"] == 0
+
+
+def test_registry_coalesces_concurrent_identical_streams(tmp_path, monkeypatch):
+    """同じリクエストの同時のストリーミングはプロバイダーを1回だけ呼び、両方が全文を受け取る"""
+    monkeypatch.chdir(tmp_path)
+    transport = FakeTransport(lambda provider, payload: "a shared streamed answer", latency=0.01, chunk_size=4)
+    registry = ProviderRegistry(ConfigManager(), transport=transport)
+    results = []
+    barrier = threading.Barrier(2)
+
+    def consume():
+        barrier.wait()
+        results.append("".join(registry.iter_stream("openai", "gpt", "prompt")))
+
+    threads = [threading.Thread(target=consume) for _ in range(2)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+    finally:
+        registry.close()
+
+    assert results == ["a shared streamed answer"] * 2
+    assert len(transport.requests) == 1
+    assert registry.single_flight.get_stats()["coalesced"] == 1
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+WebUI サーバーの REST / WebSocket エンドポイントのテスト
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import webui_server
+from enhanced_ai_collaboration import EnhancedAICollaboration
+from webui_server import WebUIServer
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """一時ディレクトリを作業ディレクトリにしたサーバー（会話は tmp_path/conversations に保存）"""
+    monkeypatch.chdir(tmp_path)
+    return WebUIServer()
+
+
+def test_conversation_listing_pages_with_cursor(server):
+    """一覧は limit / cursor でページングし、総件数を X-Total-Count で返す"""
+    for i in range(5):
+        server.conversation_manager.create_conversation("alice", f"request {i}")
+    server.conversation_manager.create_conversation("bob", "other user")
+
+    with TestClient(server.app) as client:
+        seen = []
+        cursor = None
+        while True:
+            params = {"user_id": "alice", "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/api/conversations", params=params)
+            assert response.status_code == 200
+            assert response.headers["X-Total-Count"] == "5"
+            body = response.json()
+            seen.extend(item["project_request"] for item in body["conversations"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+
+    assert seen == [f"request {i}" for i in reversed(range(5))]
+
+
+def test_conversation_listing_rejects_bad_paging_parameters(server):
+    """不正なカーソル・範囲外の limit は 400"""
+    with TestClient(server.app) as client:
+        assert client.get("/api/conversations", params={"cursor": "broken"}).status_code == 400
+        assert client.get("/api/conversations", params={"limit": 0}).status_code == 400
+        assert client.get("/api/conversations", params={"limit": 501}).status_code == 400
+        response = client.get("/api/conversations", params={"status": "completed"})
+        assert response.status_code == 200 and response.json()["conversations"] == []
+
+
+def test_websocket_resumes_from_since_seq(server):
+    """再接続時の since_seq 以降の差分だけを送る"""
+    manager = server.conversation_manager
+    conversation_id = manager.create_conversation("alice", "request")
+    manager.add_message(conversation_id, "user", "old")
+    manager.add_message(conversation_id, "user", "new")
+
+    with TestClient(server.app) as client:
+        with client.websocket_connect(f"/ws/{conversation_id}?since_seq=1") as websocket:
+            frame = websocket.receive_json()
+            assert frame["type"] == "conversation_delta"
+            assert [m["content"] for m in frame["data"]["messages"]] == ["new"]
+            assert frame["data"]["latest_seq"] == 2
+
+
+def test_websocket_rejects_invalid_since_seq_without_disconnecting(server):
+    """整数でない since_seq にはエラーを返し、接続はそのまま使える"""
+    conversation_id = server.conversation_manager.create_conversation("alice", "request")
+    server.conversation_manager.add_message(conversation_id, "user", "hello")
+
+    with TestClient(server.app) as client:
+        with client.websocket_connect(f"/ws/{conversation_id}") as websocket:
+            assert websocket.receive_json()["type"] == "conversation_data"
+            for invalid in ["abc", {"seq": 1}, [1]]:
+                websocket.send_json({"type": "get_conversation", "since_seq": invalid})
+                frame = websocket.receive_json()
+                assert frame["type"] == "error" and "since_seq" in frame["content"]
+
+            websocket.send_json({"type": "get_conversation", "since_seq": "0"})
+            frame = websocket.receive_json()
+            assert frame["type"] == "conversation_delta"
+            assert [m["content"] for m in frame["data"]["messages"]] == ["hello"]
+
+
+class DesignOnlyCollaboration(EnhancedAICollaboration):
+    """AIを呼ばずに設計フェーズを成功させるワークフロー（確認・質問の経路だけを通す）"""
+
+    def _run_design_phase_with_interaction(self, project_request):
+        name = self.user_interaction.ask_for_input("Project name?", "text")
+        return {"status": "success", "data": {"project_name": name}}
+
+
+def run_workflow(server, monkeypatch, answer, mode):
+    """WebSocket でワークフローを実行し、質問に answer(質問の番号) で回答して最後のメッセージと受信した全メッセージを返す"""
+    monkeypatch.setattr(server.providers, "has_api_key", lambda provider: True)
+    conversation_id = server.conversation_manager.create_conversation("alice", "todo app")
+    frames = []
+
+    with TestClient(server.app) as client:
+        with client.websocket_connect(f"/ws/{conversation_id}") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"type": "start_ai_collaboration", "project_request": "todo app",
+                                 "ai_mode": "all", "mode": mode})
+            questions = 0
+            while True:
+                frame = websocket.receive_json()
+                frames.append(frame)
+                if frame["type"] == "user_decision_required":
+                    questions += 1
+                    websocket.send_json({"type": "user_decision", "decision_id": frame["decision_id"],
+                                         "answer": answer(questions - 1)})
+                elif frame["type"] in ("ai_process_completed", "error"):
+                    return frame, frames, server.conversation_manager.get_conversation(conversation_id)
+
+
+def run_design_workflow(server, monkeypatch, answers):
+    """WebSocket で設計モードのワークフローを実行し、質問に answers の順で回答して結果を返す"""
+    monkeypatch.setattr(webui_server, "EnhancedAICollaboration", DesignOnlyCollaboration)
+    frame, frames, conversation = run_workflow(server, monkeypatch, lambda index: answers[index], "design")
+    questions = [f["question"] for f in frames if f["type"] == "user_decision_required"]
+    return frame, questions, conversation
+
+
+def test_workflow_confirmations_go_through_websocket(server, monkeypatch):
+    """開始・入力・完了の確認は標準入力ではなくブラウザへの質問で回答を待つ"""
+    frame, questions, conversation = run_design_workflow(server, monkeypatch, ["yes", "Todo", "yes"])
+
+    assert frame["type"] == "ai_process_completed"
+    results = frame["results"]
+    assert results["status"] == "completed" and results["user_approved"] is True
+    assert results["phases"]["design"]["data"]["project_name"] == "Todo"
+    assert questions[0].startswith("Are you sure you want to proceed with: Start AI collaboration")
+    assert questions[1] == "Project name?"
+    assert questions[2].startswith("Are you sure you want to proceed with: Mark this collaboration")
+    assert [d["answer"] for d in conversation["user_decisions"]] == ["yes", "Todo", "yes"]
+
+
+def test_workflow_cancelled_from_websocket(server, monkeypatch):
+    """開始の確認に no と答えるとワークフローを始めない"""
+    frame, questions, _ = run_design_workflow(server, monkeypatch, ["no"])
+
+    assert frame["type"] == "ai_process_completed"
+    assert frame["results"]["status"] == "cancelled_by_user"
+    assert len(questions) == 1
+
+
+def test_pending_decision_is_resent_to_reconnecting_client(server, monkeypatch):
+    """回答待ちの質問は、後から接続（再接続）したクライアントにも送り直す"""
+    monkeypatch.setattr(webui_server, "EnhancedAICollaboration", DesignOnlyCollaboration)
+    monkeypatch.setattr(server.providers, "has_api_key", lambda provider: True)
+    server.decision_broker.default_timeout = 10
+    conversation_id = server.conversation_manager.create_conversation("alice", "todo app")
+
+    with TestClient(server.app) as client:
+        with client.websocket_connect(f"/ws/{conversation_id}") as first:
+            first.receive_json()
+            first.send_json({"type": "start_ai_collaboration", "project_request": "todo app",
+                             "ai_mode": "all", "mode": "design"})
+            frame = first.receive_json()
+            while frame["type"] != "user_decision_required":
+                frame = first.receive_json()
+
+            with client.websocket_connect(f"/ws/{conversation_id}?since_seq=0") as second:
+                assert second.receive_json()["type"] == "conversation_delta"
+                resent = second.receive_json()
+                assert resent["type"] == "user_decision_required"
+                assert resent["decision_id"] == frame["decision_id"]
+                assert (resent["question"], resent["options"]) == (frame["question"], ["yes", "no"])
+                second.send_json({"type": "user_decision", "decision_id": resent["decision_id"], "answer": "no"})
+
+            while frame["type"] != "ai_process_completed":
+                frame = first.receive_json()
+    assert frame["results"]["status"] == "cancelled_by_user"
+    assert server.decision_broker.pending_count() == 0
+
+
+def test_full_workflow_streams_design_and_implementation_turns(server, monkeypatch, tmp_path):
+    """WebUI の全工程で、設計・実装フェーズのAI応答が断片として届き、ターン数は設定どおりに制限される"""
+    monkeypatch.setattr(server.providers, "is_available", lambda provider: False)
+    # テストクライアントの受信が追いつかなくても断片を破棄しない
+    server.hub.max_queue = 100000
+    # ワークフローは作業ディレクトリの ai_config.json を読む
+    (tmp_path / "ai_config.json").write_text(
+        json.dumps({"system": {"design_turns": 2, "implementation_turns": 50}}), encoding="utf-8"
+    )
+
+    frame, frames, conversation = run_workflow(server, monkeypatch, lambda index: "yes", "full")
+
+    assert frame["type"] == "ai_process_completed"
+    assert frame["results"]["status"] == "completed"
+    # ブラウザと同じく stream_id ごとに断片をつなぎ、完成した応答と比べる（フェーズが変わると turn は1から）
+    streaming, responses = {}, []
+    for f in frames:
+        if f["type"] == "ai_response_delta":
+            streaming[f["stream_id"]] = streaming.get(f["stream_id"], "") + f["delta"]
+        elif f["type"] == "ai_response":
+            assert streaming.pop(f["stream_id"]) == f["content"]
+            responses.append(f)
+    # 設計2ターン + 実装は上限の10ターン
+    assert len(responses) == 2 + EnhancedAICollaboration.MAX_PHASE_TURNS
+    design_log = frame["results"]["phases"]["design"]["data"]["conversation_log"]
+    assert [m["content"] for m in design_log] == [r["content"] for r in responses[:2]]
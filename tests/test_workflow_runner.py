@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Workflow Runner のテスト
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from workflow_runner import WorkflowRunner
+
+
+async def wait_for_stats(runner, **expected):
+    """統計が期待値になるまで待つ（スレッド側の状態遷移を待つため）"""
+    for _ in range(200):
+        stats = runner.get_stats()
+        if all(stats[key] == value for key, value in expected.items()):
+            return stats
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"stats did not reach {expected}: {runner.get_stats()}")
+
+
+def test_runs_at_most_max_workers_at_once():
+    """max_workers を超えるワークフローは空きが出るまで待たせ、イベントループは止めない"""
+    runner = WorkflowRunner(max_workers=2)
+    release = threading.Event()
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(runner.run(release.wait)) for _ in range(4)]
+        await wait_for_stats(runner, running=2, queued=2)
+        release.set()
+        results = await asyncio.gather(*tasks)
+        return results, runner.get_stats()
+
+    results, stats = asyncio.run(scenario())
+    runner.shutdown()
+    assert results == [True] * 4
+    assert (stats["running"], stats["queued"], stats["completed"], stats["failed"]) == (0, 0, 4, 0)
+
+
+def test_exceptions_propagate_and_are_counted():
+    """ワークフローの例外は呼び出し側に伝わり failed に数える"""
+    runner = WorkflowRunner(max_workers=1)
+
+    def broken():
+        raise RuntimeError("workflow failed")
+
+    with pytest.raises(RuntimeError, match="workflow failed"):
+        asyncio.run(runner.run(broken))
+    runner.shutdown()
+    assert runner.get_stats()["failed"] == 1
+
+
+def test_cancelled_before_start_never_runs():
+    """開始前にキャンセルされたワークフローは実行しない"""
+    runner = WorkflowRunner(max_workers=1)
+    release = threading.Event()
+    calls = []
+
+    async def scenario():
+        blocking = asyncio.ensure_future(runner.run(release.wait))
+        waiting = asyncio.ensure_future(runner.run(calls.append, "ran"))
+        await wait_for_stats(runner, running=1, queued=1)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await wait_for_stats(runner, queued=0)
+        release.set()
+        await blocking
+
+    asyncio.run(scenario())
+    runner.shutdown()
+    assert calls == []
+    assert runner.get_stats()["completed"] == 1
+
+
+def test_call_in_loop_runs_coroutine_from_worker_thread():
+    """ワーカースレッドからイベントループ上のコルーチンの結果を受け取れる"""
+    runner = WorkflowRunner(max_workers=1)
+
+    async def double(value):
+        return value * 2
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        return await runner.run(lambda: WorkflowRunner.call_in_loop(loop, double(21)))
+
+    assert asyncio.run(scenario()) == 42
+    runner.shutdown()